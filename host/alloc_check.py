@@ -0,0 +1,99 @@
+"""
+タイマーの計測中の1周 (timer.tick) でメモリを確保していないかを perf.ALLOC_STRICT で確かめる
+期限で起きてベルを鳴らさなかった周について、眠る直前から周の終わりまで (眠っている間の入力タスクと
+描画も含む) に1バイトでも確保すると AssertionError でタイマーが止まり、失敗になる。
+
+確保量 (gc.mem_alloc()) を測れるのは MicroPython だけなので、実機で実行する:
+    mpremote mount src run host/alloc_check.py
+PC (CPython) ではシミュレータで同じ手順を動かし、検査の区間を通った回数だけを確かめる
+(区間が一度も測られないまま「確保なし」と報告しないように)。
+
+実行: python3 host/alloc_check.py
+"""
+
+try:
+    import hostenv  # noqa: F401  (CPython の場合のみ)
+except ImportError:
+    pass
+
+import gc
+import sys
+
+SETTINGS = [2]   # 2分のタイマー (ファイナルフェーズに入る前に止める)
+RUN_MS = 10000   # 計測する時間
+MIN_TICKS = 5    # これより少なければ区間を測れていない
+
+results = {}
+
+
+async def check():
+    # シミュレータは src/ のモジュールを読み直すので、ここで import する
+    import display
+    import hardware
+    import perf
+    import runtime
+    from presentation_timer_mode import PresentationTimerMode, TimerStatus
+
+    display.init()
+    hw = hardware.HardwareInterface()
+    rt = runtime.Runtime(hw, render_thread=sys.platform == "rp2")
+    rt.start()
+    timer = PresentationTimerMode(hw, rt)
+    perf.enable()
+    perf.reset()
+    perf.ALLOC_STRICT = True
+    gc.collect()
+    task = runtime.asyncio.create_task(timer.run(SETTINGS))
+    await runtime.sleep_ms(RUN_MS)
+    rt.post_event("REMOTE_STOP")
+    try:
+        results["status"] = await task
+    except AssertionError as e:
+        results["status"] = TimerStatus.ERROR
+        results["error"] = str(e)
+    finally:
+        perf.ALLOC_STRICT = False
+        if rt.render_worker is not None:
+            rt.render_worker.stop()
+    results["tick"] = perf.report().get("timer.tick.alloc", {"n": 0, "allocated": 0, "max_bytes": 0})
+    results["status_ok"] = results["status"] == TimerStatus.GO_TO_SETTINGS
+
+
+def main():
+    measured = hasattr(gc, "mem_alloc")
+    if measured:
+        import runtime
+        runtime.asyncio.run(check())
+    else:
+        import contextlib
+        import io
+        from sim import Simulator
+
+        async def scenario(sim):
+            while "tick" not in results:
+                await sim.wait_ms(100)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            Simulator().run(scenario, target=check)
+
+    tick = results["tick"]
+    checks = [
+        ("検査の区間を通った", tick["n"] >= MIN_TICKS, "{} 回".format(tick["n"])),
+        ("タイマーが確保で止まらない", results["status_ok"], results.get("error", "")),
+    ]
+    if measured:
+        checks.append(("確保した周が無い", tick["allocated"] == 0,
+                       "{}/{} 回 (最大 {} bytes)".format(tick["allocated"], tick["n"], tick["max_bytes"])))
+    else:
+        print("CPython では確保量を測れません (実機で実行してください)")
+    failed = 0
+    for name, ok, detail in checks:
+        if not ok:
+            failed += 1
+        print("{} {}: {}".format("ok  " if ok else "FAIL", name, detail))
+    print("{}/{} ok".format(len(checks) - failed, len(checks)))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+エンコーダのデコーダを合成波形で計測する
+PC (CPython) でも実機 (MicroPython, src/ と一緒に転送) でも実行できる。
+CPython では native/viper の修飾子は何もしないので、差が出るのは実機のみ。
+
+計測項目:
+  - 1秒あたりに取りこぼしなくデコードできたエッジ数
+  - デコード結果 (ステップ数) が期待値と一致するか、不正遷移の検出数
+
+実行: python3 host/bench_quadrature.py
+"""
+
+try:
+    import hostenv  # noqa: F401  (CPython の場合のみ)
+except ImportError:
+    pass
+
+import time
+
+import quadrature
+
+DETENTS = 2000
+
+# 時計回りのグレイコード (AB): 11 -> 01 -> 00 -> 10 -> 11
+_CW = (0b01, 0b00, 0b10, 0b11)
+
+
+def clean_waveform(detents):
+    """正転 detents クリック、続けて逆転 detents クリック"""
+    edges = bytearray()
+    for _ in range(detents):
+        edges.extend(_CW)
+    for _ in range(detents):
+        edges.extend((0b10, 0b00, 0b01, 0b11))
+    return edges, 0, 0
+
+
+def bouncy_waveform(detents):
+    """各遷移の手前で片相がチャタリングする正転 (期待値は detents*4)"""
+    edges = bytearray()
+    prev = 0b11
+    for _ in range(detents):
+        for ab in _CW:
+            edges.extend((ab, prev, ab))
+            prev = ab
+    return edges, detents * 4, 0
+
+
+def skipping_waveform(detents):
+    """2クリックごとに1遷移を取りこぼす正転 (不正遷移として数えられる)"""
+    edges = bytearray()
+    errors = 0
+    for i in range(detents):
+        if i % 2:
+            edges.extend((0b01, 0b10, 0b11))  # 00 を飛ばす
+            errors += 1
+        else:
+            edges.extend(_CW)
+    return edges, None, errors
+
+
+def legacy_step(state, ab, now_us):
+    """以前の _rotary_handler と同じ比較の連鎖"""
+    sum_val = (state[0] << 2) | ab
+    if sum_val == 0b1101 or sum_val == 0b0100 or sum_val == 0b0010 or sum_val == 0b1011:
+        state[1] += 1
+    elif sum_val == 0b1110 or sum_val == 0b0111 or sum_val == 0b0001 or sum_val == 0b1000:
+        state[1] -= 1
+    state[0] = ab
+
+
+def run(step, edges):
+    state = quadrature.new_state(0b11)
+    t0 = time.ticks_us()
+    for ab in edges:
+        step(state, ab, t0)
+    elapsed_us = max(1, time.ticks_diff(time.ticks_us(), t0))
+    return state, elapsed_us
+
+
+def main():
+    steps = (
+        ("legacy", legacy_step),
+        ("python", quadrature.step_python),
+        ("native", quadrature.step_native),
+        ("viper", quadrature.step_viper),
+    )
+    waveforms = (
+        ("clean", clean_waveform(DETENTS)),
+        ("bouncy", bouncy_waveform(DETENTS)),
+        ("skipping", skipping_waveform(DETENTS)),
+    )
+    for wave_name, (edges, expected_count, expected_errors) in waveforms:
+        print("--- {} ({} edges) ---".format(wave_name, len(edges)))
+        for name, step in steps:
+            state, elapsed_us = run(step, edges)
+            rate = len(edges) * 1000000 // elapsed_us
+            ok = expected_count is None or state[quadrature.COUNT] == expected_count
+            if name != "legacy":
+                ok = ok and state[quadrature.ERRORS] == expected_errors
+            print("{:<8} {:>10} edges/s  count={:<6} errors={:<5} {}".format(
+                name, rate, state[quadrature.COUNT], state[quadrature.ERRORS],
+                "OK" if ok else "NG"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+描画を別スレッドに分けた場合と分けない場合を CPython 上 (実時間) で比べる
+I2C の転送時間 (400kHz) だけ実際に待たせ、全画面が変わるフレームを描画が
+追いつかない速さで要求しながら、入力遅延と時間管理の起床遅れを測る。
+
+計測項目:
+  - input latency:    エンコーダのピン変化から wait_input() が戻るまで
+  - wakeup lateness:  sleep_ms(TICK_MS) の予定時刻から実際に起きるまで
+  - 描画スレッドのみ: 要求から描画開始までの時間 (handoff)、捨てたフレーム数
+
+CPython ではフレームバッファの描画も Python で書かれていて GIL を取り合うので、
+差が出るのは主に I2C の待ち時間の分だけ (実機では描画も2つ目のコアで並行して動く)。
+
+実行: python3 host/bench_render_thread.py
+"""
+
+import hostenv  # noqa: F401  (import パスと time.ticks_* の準備)
+
+import time
+
+import machine
+import display
+import hardware
+import runtime
+from runtime import asyncio
+
+from bench_runtime import CW_SEQUENCE, summarize
+
+DURATION_MS = 3000
+FRAME_INTERVAL_MS = 5  # 描画の要求間隔 (全画面の転送は約25msかかる)
+TICK_MS = 20
+
+
+def _draw_full(i):
+    """毎回全画面が変わるフレーム"""
+    display.display.fill(i & 1)
+    display.display.text(str(i), 0, 0, (i + 1) & 1)
+    display.flush()
+
+
+async def _producer(rt):
+    i = 0
+    end = time.ticks_add(time.ticks_ms(), DURATION_MS)
+    while time.ticks_diff(end, time.ticks_ms()) > 0:
+        rt.render(_draw_full, i)
+        i += 1
+        await runtime.sleep_ms(FRAME_INTERVAL_MS)
+
+
+async def _input_latency(rt, enc_a, enc_b):
+    results = []
+    end = time.ticks_add(time.ticks_ms(), DURATION_MS)
+    i = 0
+    while time.ticks_diff(end, time.ticks_ms()) > 0:
+        await runtime.sleep_ms(3 + (i * 7) % runtime.Runtime.INPUT_POLL_MS)
+        rt.clear_input()
+        t0 = time.ticks_us()
+        for a, b in CW_SEQUENCE:
+            enc_a.drive(a)
+            enc_b.drive(b)
+        await rt.wait_input()
+        results.append(time.ticks_diff(time.ticks_us(), t0))
+        i += 1
+    return results
+
+
+async def _wakeup_lateness():
+    results = []
+    end = time.ticks_add(time.ticks_ms(), DURATION_MS)
+    while time.ticks_diff(end, time.ticks_ms()) > 0:
+        deadline = time.ticks_add(time.ticks_us(), TICK_MS * 1000)
+        await runtime.sleep_ms(TICK_MS)
+        results.append(max(0, time.ticks_diff(time.ticks_us(), deadline)))
+    return results
+
+
+async def bench(render_thread):
+    hw = hardware.HardwareInterface()
+    rt = runtime.Runtime(hw, render_thread=render_thread)
+    rt.start()
+    display.i2c.real_time_cost = True
+    enc_a = machine.Pin.registry[hw.ENC_A_PIN_NUM]
+    enc_b = machine.Pin.registry[hw.ENC_B_PIN_NUM]
+    try:
+        _, latency, lateness = await asyncio.gather(
+            _producer(rt), _input_latency(rt, enc_a, enc_b), _wakeup_lateness())
+    finally:
+        display.i2c.real_time_cost = False
+        if rt.render_worker is not None:
+            rt.render_worker.stop()
+        for task in rt.tasks:
+            task.cancel()
+
+    print("--- render_thread={} ---".format(render_thread))
+    summarize("input latency", latency)
+    summarize("wakeup lateness", lateness)
+    if rt.render_worker is not None:
+        print(rt.render_worker.stats())
+
+
+if __name__ == "__main__":
+    asyncio.run(bench(False))
+    asyncio.run(bench(True))
@@ -0,0 +1,80 @@
+"""
+非同期ランタイムのスケジューリング遅延を CPython 上で計測する
+
+計測項目:
+  - 入力遅延: エンコーダのピン変化から wait_input() が戻るまで
+  - 起床遅れ: sleep_ms(TICK_MS) の予定時刻から実際に起きるまで (描画タスク稼働中)
+
+実行: python3 host/bench_runtime.py
+"""
+
+import hostenv  # noqa: F401  (import パスと time.ticks_* の準備)
+
+import time
+
+import machine
+import display
+import hardware
+import runtime
+from runtime import asyncio
+
+SAMPLES = 200
+TICK_MS = 50
+
+# エンコーダ1クリック分のグレイコード (A, B) の遷移 (時計回り)
+CW_SEQUENCE = ((0, 1), (0, 0), (1, 0), (1, 1))
+
+
+def summarize(name, samples_us):
+    samples_us = sorted(samples_us)
+    n = len(samples_us)
+    avg = sum(samples_us) / n
+    p95 = samples_us[min(n - 1, int(n * 0.95))]
+    print("{:<16} n={:<4} avg={:8.1f}us  p95={:8d}us  max={:8d}us".format(
+        name, n, avg, p95, samples_us[-1]))
+
+
+def click(enc_a, enc_b):
+    for a, b in CW_SEQUENCE:
+        enc_a.drive(a)
+        enc_b.drive(b)
+
+
+async def measure_input_latency(rt, enc_a, enc_b):
+    results = []
+    for i in range(SAMPLES):
+        # 入力監視の周期に対して押すタイミングをずらす
+        await runtime.sleep_ms(3 + (i * 7) % runtime.Runtime.INPUT_POLL_MS)
+        rt.clear_input()
+        t0 = time.ticks_us()
+        click(enc_a, enc_b)
+        delta, _ = await rt.wait_input()
+        results.append(time.ticks_diff(time.ticks_us(), t0))
+        assert delta == 1
+    return results
+
+
+async def measure_wakeup_lateness(rt):
+    results = []
+    for i in range(SAMPLES // 4):
+        # 描画タスクにも仕事をさせる
+        rt.render(display.draw_timer_screen, i // 60, i % 60, [7, 10, 15])
+        deadline = time.ticks_add(time.ticks_us(), TICK_MS * 1000)
+        await runtime.sleep_ms(TICK_MS)
+        results.append(max(0, time.ticks_diff(time.ticks_us(), deadline)))
+    return results
+
+
+async def bench():
+    hw = hardware.HardwareInterface()
+    rt = runtime.Runtime(hw)
+    rt.start()
+    enc_a = machine.Pin.registry[hw.ENC_A_PIN_NUM]
+    enc_b = machine.Pin.registry[hw.ENC_B_PIN_NUM]
+
+    summarize("input latency", await measure_input_latency(rt, enc_a, enc_b))
+    summarize("wakeup lateness", await measure_wakeup_lateness(rt))
+
+
+if __name__ == "__main__":
+    asyncio.run(bench())
@@ -0,0 +1,112 @@
+"""
+設定の保存方式を比較する
+  - json:  以前の main.save_settings / load_settings (確定ごとに settings.json を書き直す)
+  - store: settings_store (バイナリのログ形式。BATCH 回の編集をまとめて1回で書く)
+PC (CPython) でも実機 (MicroPython, src/ と一緒に転送) でも実行できる。
+
+計測項目:
+  - load_us:        起動時の読み込み時間
+  - save_us:        1回の書き込みにかかる時間 (平均)
+  - writes:         ファイルへの書き込み回数
+  - bytes_written:  書き込んだバイト数の合計 (store は事前確保の分を除く)
+
+実行: python3 host/bench_settings.py
+"""
+
+try:
+    import hostenv  # noqa: F401  (CPython の場合のみ)
+except ImportError:
+    pass
+
+import json
+import os
+import time
+
+import settings_store
+
+EDITS = 60   # 編集の確定回数
+BATCH = 4    # store で1回の書き込みにまとめる編集の数
+JSON_FILE = "bench_settings.json"
+STORE_FILE = "bench_settings.bin"
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _edit(i):
+    return [i % 30 + 1, i % 30 + 5, i % 30 + 10]
+
+
+def bench_json():
+    settings = [7, 10, 15]
+    bytes_written = 0
+    save_us = 0
+    for i in range(EDITS):
+        settings = _edit(i)
+        t0 = time.ticks_us()
+        data = json.dumps(settings)
+        with open(JSON_FILE, "w") as f:
+            f.write(data)
+        save_us += time.ticks_diff(time.ticks_us(), t0)
+        bytes_written += len(data)
+
+    t0 = time.ticks_us()
+    with open(JSON_FILE, "r") as f:
+        loaded = json.load(f)
+    load_us = time.ticks_diff(time.ticks_us(), t0)
+    assert loaded == settings
+    return {
+        "load_us": load_us,
+        "save_us": save_us // EDITS,
+        "writes": EDITS,
+        "bytes_written": bytes_written,
+    }
+
+
+def bench_store():
+    store = settings_store.SettingsStore(STORE_FILE, legacy_path=JSON_FILE + ".none")
+    store.load()  # ファイルを確保して初期値を書く
+    store.bytes_written = 0
+    store.flush_count = 0
+    save_us = 0
+    for i in range(EDITS):
+        store.put(store.active, _edit(i))
+        if (i + 1) % BATCH == 0:
+            t0 = time.ticks_us()
+            store.flush()
+            save_us += time.ticks_diff(time.ticks_us(), t0)
+    store.flush()
+
+    t0 = time.ticks_us()
+    restored = settings_store.SettingsStore(STORE_FILE)
+    loaded = restored.load()
+    load_us = time.ticks_diff(time.ticks_us(), t0)
+    assert loaded == _edit(EDITS - 1)
+    return {
+        "load_us": load_us,
+        "save_us": save_us // max(1, store.flush_count),
+        "writes": store.flush_count,
+        "bytes_written": store.bytes_written,
+    }
+
+
+def main():
+    _remove(JSON_FILE)
+    _remove(STORE_FILE)
+    try:
+        results = (("json", bench_json()), ("store", bench_store()))
+    finally:
+        _remove(JSON_FILE)
+        _remove(STORE_FILE)
+    print("--- {} edits (store: {} edits/write) ---".format(EDITS, BATCH))
+    for name, r in results:
+        print("{:<6} load={:>7}us  save={:>7}us  writes={:<4} bytes={}".format(
+            name, r["load_us"], r["save_us"], r["writes"], r["bytes_written"]))
+
+
+if __name__ == "__main__":
+    main()
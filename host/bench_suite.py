@@ -0,0 +1,288 @@
+"""
+シミュレータ上で main() と各モードを動かす性能ベンチマーク
+
+計測項目 (シナリオごと):
+  - loop_lag_ms:       10ms 周期タスクの起床遅れ (描画や I2C でループが止まった時間)
+  - input_latency_ms:  入力 (クリック/ボタン) から次のフレーム転送まで
+  - fps, frames:       フレーム数とフレームレート
+  - render.coalesced:  描画する前に次の要求で上書きされた (まとめられた) フレーム数
+  - i2c_bytes:         セッション全体の I2C 転送量
+  - bell_error_ms:     ベルの打鍵開始時刻の予定とのずれ (タイマーのシナリオのみ)
+  - timer.*:           タイマーモードの1分あたりの起床回数と終了時刻の誤差
+                       final_* はファイナルフェーズ (1/10 秒表示) のフレームレートと描けなかったフレーム数
+  - boot.*:            起動からスプラッシュの転送完了 / 最初のモードの画面までの時間 (ms)
+                       (I2C の転送時間のみ。--cpu-scale を付けると import などの実行時間も含む)
+  - wake_ms, power.*:  画面が消えた状態から入力で点くまでの時間、起きていた時間の割合など
+  - replay.*:          host/traces/ の入力トレースの再生結果 (replay_<名前> のシナリオ。
+                       取りこぼした/余計なクリック、入力から転送までの遅延。host/replay_trace.py を参照)
+
+実行:
+  python3 host/bench_suite.py            # 計測して保存済みのベースラインと比較
+  python3 host/bench_suite.py --save     # 計測結果をベースラインとして保存
+  python3 host/bench_suite.py --cpu-scale 50  # Python の実行時間も50倍して仮想時間に加算
+  python3 host/bench_suite.py --perf     # src/perf.py の区間ごとの計測結果も表示 (--cpu-scale と併用)
+"""
+
+import hostenv
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+
+import bells
+import replay_trace
+from sim import Simulator
+
+BASELINE_FILE = os.path.join(hostenv.HOST_DIR, "baselines", "bench_suite.json")
+
+
+# --- シナリオ ---
+async def menu_scroll(sim):
+    """メニューを速く回して行き来する"""
+    await sim.wait_ms(300)
+    for _ in range(5):
+        await sim.turn(8, rate_hz=20)
+        await sim.turn(-8, rate_hz=20)
+    await sim.wait_ms(300)
+
+
+async def menu_long(sim):
+    """項目が画面に収まらないメニューを速く回し、端で折り返す (描くのは見えている行だけ)"""
+    await sim.wait_ms(300)
+    await sim.turn(12, rate_hz=20)    # 窓の中から下へスクロール
+    await sim.turn(-20, rate_hz=20)   # 先頭を越えて末尾へ折り返す
+    await sim.turn(30, rate_hz=40)
+    await sim.wait_ms(300)
+
+
+async def edit_spin(sim):
+    """1st Bell の編集画面でエンコーダを速く回して決定する"""
+    await sim.wait_ms(300)
+    await sim.click()                 # 1st Bell を選択
+    await sim.turn(30, rate_hz=20)    # 速く回して上限まで
+    await sim.turn(-10, rate_hz=3)    # ゆっくり戻す
+    await sim.click()                 # 決定
+    await sim.wait_ms(300)
+
+
+async def edit_fast_spin(sim):
+    """編集画面でエンコーダを描画が追いつかない速さで回し続ける (途中のフレームはまとめられる)"""
+    await sim.wait_ms(300)
+    await sim.click()                 # 1st Bell を選択
+    await sim.turn(-20, rate_hz=80)   # 下限へ
+    await sim.turn(40, rate_hz=80)
+    await sim.wait_ms(200)
+    await sim.click()                 # 決定
+    await sim.wait_ms(300)
+
+
+async def timer_session(sim):
+    """設定どおりにタイマーを最後まで走らせる"""
+    await sim.wait_ms(300)
+    await sim.turn(len(sim.settings))  # START TIMER へ
+    await sim.click()
+    sim.mark("timer_start", sim.last_release_us)
+    end_ms = bells.compile_schedule(sim.settings)[-1][0]
+    await sim.wait_ms(end_ms + 3000)
+
+
+async def timer_pause(sim):
+    """タイマー中に一時停止/再開を繰り返してから長押しで抜ける"""
+    await sim.wait_ms(300)
+    await sim.turn(3)
+    await sim.click()
+    for _ in range(5):
+        await sim.wait_ms(10000)
+        await sim.click()             # 一時停止
+        await sim.wait_ms(3000)
+        await sim.click()             # 再開
+    await sim.hold()
+    await sim.wait_ms(300)
+
+
+async def timer_final(sim):
+    """ファイナルフェーズ (1/10 秒表示) の途中で一時停止/再開して最後まで走らせる"""
+    await sim.wait_ms(300)
+    await sim.turn(len(sim.settings))
+    await sim.click()
+    sim.mark("timer_start", sim.last_release_us)
+    end_ms = bells.compile_schedule(sim.settings)[-1][0]
+    await sim.wait_ms(end_ms - 15000)  # 残り約15秒
+    await sim.click()                 # 一時停止
+    await sim.wait_ms(2000)
+    await sim.click()                 # 再開
+    await sim.wait_ms(15000 + 3000)
+
+
+async def agenda_switch(sim):
+    """アジェンダのセッションを始めてはダブルクリックで次へ進める"""
+    await sim.wait_ms(300)
+    for _ in range(10):
+        await sim.click()             # スタート
+        await sim.wait_ms(2000)
+        await sim.double_click()      # 次のセッションへ
+        await sim.wait_ms(500)
+
+
+async def idle_sleep(sim):
+    """メニューのまま放置して画面が消えた後、エンコーダで起こす"""
+    pm = sim.power.PowerManager
+    await sim.wait_ms(300)
+    await sim.wait_ms(pm.OFF_AFTER_MS + 60000)
+    # 1クリック目の最初のエッジから画面が点くまで
+    sim.mark("wake_input")
+    turning = asyncio.ensure_future(sim.turn(1))
+    while not sim.display.display.is_on:
+        await sim.wait_ms(1)
+    sim.mark("wake")
+    await turning
+    await sim.turn(2)                 # 起きた後の操作は普通に効く
+    await sim.wait_ms(300)
+
+
+def _agenda_text(sessions):
+    lines = ["# bench agenda"]
+    for i in range(sessions):
+        lines.append("Talk {};{}:1,{}:2,{}:3".format(i + 1, 3 + i % 5, 4 + i % 5, 5 + i % 5))
+    return "\n".join(lines) + "\n"
+
+
+SCENARIOS = (
+    ("menu_scroll", menu_scroll, None),
+    ("menu_long", menu_long, [[i + 1, 1] for i in range(7)]),  # 9項目 (画面は5行)
+    ("edit_spin", edit_spin, None),
+    ("edit_fast_spin", edit_fast_spin, None),
+    ("timer_session", timer_session, [1, 2, 3]),
+    ("timer_many_bells", timer_session, [[1, 1], [2, 1], [3, 2], [4, 2], 6, [5, 3]]),
+    ("timer_pause", timer_pause, [1, 2, 3]),
+    ("timer_final", timer_final, [1]),
+    ("agenda_switch", agenda_switch, None),
+    ("idle_sleep", idle_sleep, None),
+)
+
+# シナリオごとに置いておくファイル
+SCENARIO_FILES = {
+    "agenda_switch": {"agenda.txt": _agenda_text(200)},
+}
+
+
+def bell_error_ms(sim, settings):
+    """
+    ベル設定どおりの時刻と、実際の打鍵パターンの開始時刻のずれ
+    打鍵数が設定と違うパターンは None にする
+    """
+    start = sim.marks.get("timer_start")
+    if start is None:
+        return None
+    errors = []
+    patterns = sim.bell_patterns_us()
+    for i, (deadline_ms, strikes) in enumerate(bells.compile_schedule(settings)):
+        if i >= len(patterns) or patterns[i][1] != strikes:
+            errors.append(None)  # 鳴らなかった / 回数が違う
+            continue
+        expected = start + deadline_ms * 1000
+        errors.append(round((patterns[i][0] - expected) / 1000, 1))
+    return errors
+
+
+def run_all(cpu_scale, perf=False):
+    results = {}
+    replays = {}
+    scenarios = list(SCENARIOS)
+    for trace_name, path in replay_trace.trace_files():
+        name = "replay_" + trace_name
+        replays[name] = {}
+        scenarios.append((name, replay_trace.replay_scenario(path, replays[name]), None))
+    for name, scenario, settings in scenarios:
+        sim = Simulator(cpu_scale=cpu_scale, settings=settings, files=SCENARIO_FILES.get(name),
+                        perf=perf)
+        # 各モードの print はベンチマークの出力に混ぜない
+        with contextlib.redirect_stdout(io.StringIO()):
+            metrics = sim.run(scenario)
+        if perf:
+            print("--- perf: {} ---".format(name))
+            print(sim.perf_text, end="")
+        boot = sim.startup.report()
+        metrics["boot"] = {
+            "first_pixel_ms": boot.get("first_pixel"),
+            "first_screen_ms": round(sim.frames[1][0] / 1000, 1) if len(sim.frames) > 1 else None,
+        }
+        import runtime
+        metrics["render"] = {"coalesced": runtime.Runtime.last.stats()["frames_coalesced"]}
+        if scenario is timer_session:
+            metrics["bell_error_ms"] = bell_error_ms(sim, settings)
+        import presentation_timer_mode
+        stats = presentation_timer_mode.PresentationTimerMode.last_stats
+        if stats is not None:
+            metrics["timer"] = {
+                "wakeups_per_min": stats["wakeups_per_min"],
+                "end_error_ms": stats["end_error_ms"],
+            }
+            for key in ("final_fps", "final_frames", "final_missed"):
+                if key in stats:
+                    metrics["timer"][key] = stats[key]
+        if "wake" in sim.marks:
+            metrics["wake_ms"] = round((sim.marks["wake"] - sim.marks["wake_input"]) / 1000, 2)
+            power = sim.power.PowerManager.last.stats()
+            metrics["power"] = {
+                "awake_pct": power["awake_pct"],
+                "off_ms": power["off_ms"],
+                "sleep_ms": power["sleep_ms"],
+                "sleeps": power["sleeps"],
+            }
+        if name in replays:
+            metrics["replay"] = replays[name]["replay"]
+        results[name] = metrics
+    return results
+
+
+def _flatten(metrics, prefix=""):
+    for key, value in metrics.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, prefix + key + ".")
+        else:
+            yield prefix + key, value
+
+
+def report(results, baseline):
+    for name, metrics in results.items():
+        print("=== {} ===".format(name))
+        base = dict(_flatten(baseline.get(name, {})))
+        for key, value in _flatten(metrics):
+            line = "  {:<24} {}".format(key, value)
+            old = base.get(key)
+            if isinstance(value, (int, float)) and isinstance(old, (int, float)) and old != value:
+                change = "" if old == 0 else " ({:+.1f}%)".format((value - old) * 100 / old)
+                line += "   baseline {}{}".format(old, change)
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--save", action="store_true", help="結果をベースラインとして保存する")
+    parser.add_argument("--cpu-scale", type=float, default=0.0,
+                        help="Python の実行時間を仮想時間に加算する倍率 (既定 0)")
+    parser.add_argument("--perf", action="store_true", help="src/perf.py の計測結果も表示する")
+    args = parser.parse_args()
+
+    results = run_all(args.cpu_scale, args.perf)
+
+    baseline = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE) as f:
+            baseline = json.load(f)
+    report(results, baseline)
+
+    if args.save:
+        os.makedirs(os.path.dirname(BASELINE_FILE), exist_ok=True)
+        with open(BASELINE_FILE, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print("ベースラインを保存しました:", BASELINE_FILE)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+CPython 用の framebuf モジュールのスタンドイン (MONO_VLSB のみ)
+text() は実機の 8x8 フォントではなく、文字コードから決まる擬似グリフを描く。
+ピクセル単位の見た目ではなく、描画範囲と転送量を再現するためのもの。
+"""
+
+MONO_VLSB = 0
+MONO_HLSB = 3
+MONO_HMSB = 4
+
+
+def _glyph(ch):
+    code = ord(ch)
+    if code == 32:
+        return (0,) * 8
+    h = (code * 2654435761) & 0xFFFFFFFF
+    return tuple(((h >> (col * 3)) & 0x7E) | 0x02 for col in range(7)) + (0,)
+
+
+class FrameBuffer:
+    def __init__(self, buffer, width, height, format=MONO_VLSB, stride=None):
+        if format != MONO_VLSB:
+            raise ValueError("host framebuf supports MONO_VLSB only")
+        self.buf = buffer
+        self.fb_width = width
+        self.fb_height = height
+
+    def _index(self, x, y):
+        return (y >> 3) * self.fb_width + x
+
+    def pixel(self, x, y, c=None):
+        if not (0 <= x < self.fb_width and 0 <= y < self.fb_height):
+            return 0 if c is None else None
+        i = self._index(x, y)
+        bit = 1 << (y & 7)
+        if c is None:
+            return 1 if self.buf[i] & bit else 0
+        if c:
+            self.buf[i] |= bit
+        else:
+            self.buf[i] &= ~bit & 0xFF
+
+    def fill(self, c):
+        v = 0xFF if c else 0
+        for i in range(len(self.buf)):
+            self.buf[i] = v
+
+    def fill_rect(self, x, y, w, h, c):
+        for yy in range(max(y, 0), min(y + h, self.fb_height)):
+            for xx in range(max(x, 0), min(x + w, self.fb_width)):
+                self.pixel(xx, yy, c)
+
+    def rect(self, x, y, w, h, c, f=False):
+        if f:
+            self.fill_rect(x, y, w, h, c)
+            return
+        self.hline(x, y, w, c)
+        self.hline(x, y + h - 1, w, c)
+        self.vline(x, y, h, c)
+        self.vline(x + w - 1, y, h, c)
+
+    def hline(self, x, y, w, c):
+        self.fill_rect(x, y, w, 1, c)
+
+    def vline(self, x, y, h, c):
+        self.fill_rect(x, y, 1, h, c)
+
+    def line(self, x1, y1, x2, y2, c):
+        dx = abs(x2 - x1)
+        dy = -abs(y2 - y1)
+        sx = 1 if x1 < x2 else -1
+        sy = 1 if y1 < y2 else -1
+        err = dx + dy
+        while True:
+            self.pixel(x1, y1, c)
+            if x1 == x2 and y1 == y2:
+                break
+            e2 = 2 * err
+            if e2 >= dy:
+                err += dy
+                x1 += sx
+            if e2 <= dx:
+                err += dx
+                y1 += sy
+
+    def text(self, s, x, y, c=1):
+        for n, ch in enumerate(s):
+            cols = _glyph(ch)
+            for col in range(8):
+                bits = cols[col]
+                for row in range(8):
+                    if bits & (1 << row):
+                        self.pixel(x + n * 8 + col, y + row, c)
+
+    def blit(self, fbuf, x, y, key=-1, palette=None):
+        for yy in range(fbuf.fb_height):
+            for xx in range(fbuf.fb_width):
+                c = fbuf.pixel(xx, yy)
+                if c != key:
+                    self.pixel(x + xx, y + yy, c)
+
+    def scroll(self, xstep, ystep):
+        w, h = self.fb_width, self.fb_height
+        pixels = [[self.pixel(x, y) for x in range(w)] for y in range(h)]
+        for y in range(h):
+            for x in range(w):
+                sx, sy = x - xstep, y - ystep
+                if 0 <= sx < w and 0 <= sy < h:
+                    self.pixel(x, y, pixels[sy][sx])
@@ -0,0 +1,104 @@
+"""
+CPython 上で src/ のコードを動かすための環境設定
+- host/ のスタンドイン (machine, ssd1306, framebuf, micropython) と src/ を import パスに追加
+- time モジュールに MicroPython 固有の ticks_ms / sleep_ms などを追加
+
+使い方: host/ 以下のスクリプトの先頭で `import hostenv` する
+"""
+
+import math
+import os
+import sys
+import time
+
+HOST_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(HOST_DIR), "src")
+
+for _path in (SRC_DIR, HOST_DIR):
+    if _path not in sys.path:
+        sys.path.insert(0, _path)
+
+# --- 時計 (実時間 / 仮想時間) ---
+class Clock:
+    """
+    ticks_* が参照する時計
+    仮想時間モードでは advance_us() した分だけ進み、sleep も一瞬で終わる。
+    """
+
+    def __init__(self):
+        self.virtual = False
+        self._virtual_us = 0
+        self._real_sleep = time.sleep
+
+    def now_us(self):
+        if self.virtual:
+            return self._virtual_us
+        return int(time.monotonic() * 1000000)
+
+    def advance_us(self, us):
+        """仮想時間を進める (実時間モードでは何もしない)"""
+        if self.virtual and us > 0:
+            # 切り捨てるとイベントループの期限にいつまでも届かないので切り上げる
+            self._virtual_us += int(math.ceil(us))
+
+    def use_virtual(self, start_us=0):
+        """仮想時間モードに切り替える。time.sleep も仮想時間を進めるだけになる"""
+        self.virtual = True
+        self._virtual_us = start_us
+        time.sleep = self._virtual_sleep
+
+    def use_real(self):
+        self.virtual = False
+        time.sleep = self._real_sleep
+
+    def _virtual_sleep(self, seconds):
+        self.advance_us(seconds * 1000000)
+
+
+clock = Clock()
+
+# --- MicroPython の ticks 系関数 (2^30 で一周する) ---
+TICKS_PERIOD = 1 << 30
+_TICKS_MASK = TICKS_PERIOD - 1
+_TICKS_HALF = TICKS_PERIOD // 2
+
+
+def ticks_ms():
+    return (clock.now_us() // 1000) & _TICKS_MASK
+
+
+def ticks_us():
+    return clock.now_us() & _TICKS_MASK
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) & _TICKS_MASK
+
+
+def ticks_diff(ticks1, ticks2):
+    return ((ticks1 - ticks2 + _TICKS_HALF) & _TICKS_MASK) - _TICKS_HALF
+
+
+def sleep_ms(ms):
+    time.sleep(ms / 1000)
+
+
+def sleep_us(us):
+    time.sleep(us / 1000000)
+
+
+for _name in ("ticks_ms", "ticks_us", "ticks_add", "ticks_diff", "sleep_ms", "sleep_us"):
+    if not hasattr(time, _name):
+        setattr(time, _name, globals()[_name])
+
+# --- viper のポインタ型 (CPython ではバッファをそのまま添字アクセスする) ---
+import builtins
+
+
+def _ptr(obj):
+    return obj
+
+
+for _name in ("ptr8", "ptr16", "ptr32"):
+    if not hasattr(builtins, _name):
+        setattr(builtins, _name, _ptr)
@@ -0,0 +1,202 @@
+"""
+CPython 用の machine モジュールのスタンドイン
+ピンは番号ごとに Pin.registry に登録され、drive() で外部から入力を与えられる。
+I2C は送信したバイト数を記録し、仮想時間モードでは転送時間だけ時計を進める。
+Timer は仮想時間モードではイベントループ上で発火する。
+WDT は餌をやった時刻を記録するだけでリセットはしない (expired() で期限切れを調べる)。
+mem32 はウォッチドッグのスクラッチレジスタ用の辞書で、シミュレータを続けて動かしても中身が残る
+(_reset_cause を WDT_RESET にすると、ウォッチドッグのリセットからの起動を再現できる)。
+"""
+
+import asyncio
+import threading
+import time
+
+import hostenv
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = 4
+    IRQ_RISING = 8
+
+    registry = {}  # ピン番号 -> 最後に生成された Pin
+
+    def __init__(self, pin_id, mode=-1, pull=-1, value=None):
+        self.id = pin_id
+        self.mode = mode
+        self.pull = pull
+        self._value = 1 if pull == self.PULL_UP else 0
+        if value is not None:
+            self._value = value
+        self._handler = None
+        self._trigger = 0
+        self.history = []  # 出力ピンの (ticks_ms, value) の履歴
+        Pin.registry[pin_id] = self
+
+    def value(self, v=None):
+        if v is None:
+            return self._value
+        v = 1 if v else 0
+        if self.mode == self.OUT:
+            self.history.append((time.ticks_ms(), v))
+        self._value = v
+
+    def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING, **kwargs):
+        self._handler = handler
+        self._trigger = trigger
+
+    def drive(self, v):
+        """外部からピンのレベルを変える (割り込みハンドラも呼ばれる)"""
+        v = 1 if v else 0
+        if v == self._value:
+            return
+        self._value = v
+        edge = self.IRQ_RISING if v else self.IRQ_FALLING
+        if self._handler is not None and (self._trigger & edge):
+            self._handler(self)
+
+
+class I2C:
+    def __init__(self, bus_id, sda=None, scl=None, freq=400000):
+        self.bus_id = bus_id
+        self.freq = freq
+        self.bytes_sent = 0     # 送信したバイト数の累計 (アドレスバイトは除く)
+        self.transactions = 0   # トランザクション数
+        # 実時間モードでも転送時間だけ呼び出し元を待たせる (描画スレッドの計測用)
+        self.real_time_cost = False
+
+    # 仮想時間モードで1トランザクションにかかる時間のモデル
+    # (開始/アドレス/停止のビット + ドライバのオーバーヘッド)
+    TRANSACTION_OVERHEAD_US = 40
+
+    def _transfer(self, nbytes):
+        self.bytes_sent += nbytes
+        self.transactions += 1
+        # 1バイト = 8bit + ACK の9クロック
+        cost_us = self.TRANSACTION_OVERHEAD_US + nbytes * 9 * 1000000 / self.freq
+        if hostenv.clock.virtual:
+            hostenv.clock.advance_us(cost_us)
+        elif self.real_time_cost:
+            time.sleep(cost_us / 1000000)
+
+    def writeto(self, addr, buf, stop=True):
+        self._transfer(len(buf))
+        return 1
+
+    def writevto(self, addr, vector, stop=True):
+        self._transfer(sum(len(buf) for buf in vector))
+        return 1
+
+    def reset_stats(self):
+        self.bytes_sent = 0
+        self.transactions = 0
+
+
+class Timer:
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, timer_id=-1, **kwargs):
+        self._timer = None
+        if kwargs:
+            self.init(**kwargs)
+
+    def init(self, mode=PERIODIC, period=-1, callback=None, **kwargs):
+        self.deinit()
+        self._mode = mode
+        self._period = period
+        self._callback = callback
+        self._arm()
+
+    def _arm(self):
+        if hostenv.clock.virtual:
+            self._timer = asyncio.get_event_loop().call_later(self._period / 1000, self._fire)
+            return
+        self._timer = threading.Timer(self._period / 1000, self._fire)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _fire(self):
+        if self._mode == self.PERIODIC:
+            self._arm()
+        if self._callback is not None:
+            self._callback(self)
+
+    def deinit(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+
+def disable_irq():
+    return 0
+
+
+def enable_irq(state):
+    pass
+
+
+def lightsleep(ms=None):
+    """
+    実機ではピンの割り込みで途中で起きる。仮想時間モードでは代わりに、
+    イベントループに次に予定されている処理 (シナリオの入力など) の時刻で起きる
+    """
+    if ms is None:
+        return
+    if hostenv.clock.virtual:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is not None:
+            pending = [h.when() for h in loop._scheduled if not h.cancelled()]
+            if pending:
+                ms = min(ms, max(0.0, (min(pending) - loop.time()) * 1000))
+    time.sleep(ms / 1000)
+
+
+def freq(hz=None):
+    return 125000000
+
+
+# --- リセット ---
+PWRON_RESET = 1
+WDT_RESET = 3
+_reset_cause = PWRON_RESET
+
+
+def reset_cause():
+    return _reset_cause
+
+
+class WDT:
+    last = None  # 直近に作られたインスタンス (計測用)
+
+    def __init__(self, id=0, timeout=5000):
+        self.timeout = timeout
+        self.feeds = 0
+        self.last_feed = time.ticks_ms()
+        self.max_gap_ms = 0  # 餌と餌の間の最大の間隔
+        WDT.last = self
+
+    def feed(self):
+        now = time.ticks_ms()
+        self.max_gap_ms = max(self.max_gap_ms, time.ticks_diff(now, self.last_feed))
+        self.last_feed = now
+        self.feeds += 1
+
+    def expired(self):
+        """実機ならリセットされている"""
+        return time.ticks_diff(time.ticks_ms(), self.last_feed) > self.timeout
+
+
+class _Mem32(dict):
+    def __missing__(self, addr):
+        return 0
+
+
+mem32 = _Mem32()
@@ -0,0 +1,22 @@
+"""CPython 用の micropython モジュールのスタンドイン"""
+
+
+def const(value):
+    return value
+
+
+def native(func):
+    return func
+
+
+def viper(func):
+    return func
+
+
+def schedule(func, arg):
+    func(arg)
+    return True
+
+
+def alloc_emergency_exception_buf(size):
+    pass
@@ -0,0 +1,135 @@
+"""
+画面を消している間の待ち方をシミュレータで確かめる
+- 描画スレッドを使う (RP2040 では2つ目のコアで動く) ランタイムは machine.lightsleep を使わない
+  (lightsleep は両方のコアを止める)。その場合も画面を消した後は time.sleep_ms で待ち、
+  エンコーダを回すと SHARED_SLEEP_MS 程度で画面が点き、ウォッチドッグの期限も過ぎない
+- 描画スレッドを使わない場合は lightsleep で待つ
+- どちらの場合も、眠ってイベントループを止めている間に起きられなかった他のループ (autosave など) を
+  ストールとして記録しない
+
+描画スレッドは仮想時間では動かせないので、待ち方だけを描画スレッドありの場合と同じにして動かす。
+実機の消費電流と、lightsleep がピンの変化で起きるかどうかはここでは測れない。
+
+実行: python3 host/power_check.py
+"""
+
+import hostenv  # noqa: F401  (import パスと time.ticks_* の準備)
+
+import asyncio
+import contextlib
+import io
+import sys
+
+import machine
+from sim import Simulator
+
+
+def check_wiring():
+    """描画スレッドの有無で待ち方を選ぶ"""
+    import display
+    import hardware
+    import runtime
+    display.init()
+    hw = hardware.HardwareInterface()
+    shared = runtime.Runtime(hw, render_thread=True).power
+    alone = runtime.Runtime(hw, render_thread=False).power
+    ok = (not shared.use_lightsleep and shared.sleep_max_ms == shared.SHARED_SLEEP_MS
+          and alone.use_lightsleep and alone.sleep_max_ms == alone.SLEEP_MAX_MS)
+    return [("描画スレッドがあれば lightsleep を使わない", ok,
+             {"render_thread": shared.use_lightsleep, "alone": alone.use_lightsleep})]
+
+
+def _idle_and_wake(lightsleep):
+    """メニューのまま画面が消えるまで放置して、エンコーダで起こす"""
+    seen = {}
+    calls = []
+    sim = Simulator()
+
+    async def target():
+        if not lightsleep:
+            power = sim.power
+
+            class SharedCorePower(power.PowerManager):
+                def __init__(self, lightsleep=True):
+                    super().__init__(lightsleep=False)
+
+            power.PowerManager = SharedCorePower
+        await sim.main.main()
+
+    async def scenario(sim):
+        pm = sim.power.PowerManager
+        await sim.wait_ms(300)
+        await sim.wait_ms(pm.OFF_AFTER_MS + 60000)
+        seen["off"] = not sim.display.display.is_on
+        t0 = sim.now_ms()
+        turning = asyncio.ensure_future(sim.turn(1))
+        while not sim.display.display.is_on:
+            await sim.wait_ms(1)
+        seen["wake_ms"] = sim.now_ms() - t0
+        await turning
+        await sim.wait_ms(300)
+        seen["power"] = sim.power.PowerManager.last.stats()
+        seen["watchdog"] = sim.perf.report()["watchdog"]
+
+    def counting(ms=None):
+        calls.append(ms)
+        lightsleep_orig(ms)
+
+    lightsleep_orig = machine.lightsleep
+    machine.lightsleep = counting
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            sim.run(scenario, target=target)
+    finally:
+        machine.lightsleep = lightsleep_orig
+    seen["lightsleeps"] = len(calls)
+    return seen
+
+
+def check_shared_core():
+    """描画スレッドありの待ち方: lightsleep せずに time.sleep_ms で待つ"""
+    import power
+    seen = _idle_and_wake(lightsleep=False)
+    stats = seen["power"]
+    wd = seen["watchdog"]
+    return [
+        ("lightsleep を呼ばない", seen["lightsleeps"] == 0, seen["lightsleeps"]),
+        ("画面を消した後は sleep_ms で待つ", seen["off"] and stats["sleeps"] > 0
+         and stats["sleep_ms"] * 2 > stats["off_ms"], stats),
+        ("回すと SHARED_SLEEP_MS 程度で画面が点く",
+         seen["wake_ms"] <= power.PowerManager.SHARED_SLEEP_MS + 20, "{}ms".format(seen["wake_ms"])),
+        ("待っている間もウォッチドッグの期限を過ぎない", wd["starved"] == 0 and wd["overruns"] == 0,
+         {"starved": wd["starved"], "overruns": wd["overruns"], "slowest": wd["slowest"]}),
+    ]
+
+
+def check_alone():
+    """描画スレッドなしの待ち方: lightsleep で待つ"""
+    seen = _idle_and_wake(lightsleep=True)
+    wd = seen["watchdog"]
+    return [
+        ("lightsleep で待つ", seen["off"] and seen["lightsleeps"] > 0 and seen["power"]["sleeps"] > 0,
+         {"lightsleeps": seen["lightsleeps"], "sleeps": seen["power"]["sleeps"]}),
+        ("lightsleep の間もウォッチドッグの期限を過ぎない", wd["starved"] == 0 and wd["overruns"] == 0,
+         {"starved": wd["starved"], "overruns": wd["overruns"], "slowest": wd["slowest"]}),
+    ]
+
+
+CHECKS = (check_wiring, check_shared_core, check_alone)
+
+
+def main():
+    results = []
+    for check in CHECKS:
+        results.extend(check())
+    failed = 0
+    for name, ok, detail in results:
+        if not ok:
+            failed += 1
+        print("{} {}: {}".format("ok  " if ok else "FAIL", name, detail))
+    print("{}/{} ok".format(len(results) - failed, len(results)))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+リモート操作 (src/remote.py) をパイプ越しに確かめる
+標準入力をパイプに差し替えて、シミュレータ (仮想時間) の上で main() を動かし、
+パイプの書き込み側からコマンドを1行ずつ送って返事の行を確かめる。
+続けて、PC 側が読まなくなった (書き込むと止まる) 間にコマンドを送っても入力タスクが止まらず
+(ウォッチドッグへの餌が途切れない)、読み始めたら返事が順番に出て、溢れた分は数えられることを確かめる。
+
+実行: python3 host/remote_pipe.py
+"""
+
+import hostenv
+
+import contextlib
+import io
+import os
+import sys
+
+from sim import Simulator
+
+# (送る行, 返事に含まれているべき文字列)
+CHECKS = (
+    ("state", "OK mode=menu preset=default bells=7,10,15"),
+    ("bell 1 5; bell 2 8:2; state", "OK mode=menu preset=default bells=5,8:2,15"),
+    ("bell 9 3", "ERR 1 bell: no bell 9"),
+    ("bell 1 5; bell 2 999", "ERR 2 bell: minutes"),
+    ("state", "bells=5,8:2,15"),  # 不正なバッチは何も変えない
+    ("preset lt5; state", "OK mode=menu preset=lt5 bells=3,4,5"),
+    ("preset; state", "preset=talk20"),
+    ("bells 1,2:1,3:3; state", "bells=1,2:1,3:3"),
+    ("start", "OK"),
+    ("state", "mode=timer preset=talk20 bells=1,2:1,3:3 paused=0"),
+    ("pause", "OK"),
+    ("state", "paused=1"),
+    ("start", "OK"),
+    ("state", "paused=0"),
+    ("stop", "OK"),
+    ("state", "mode=menu"),
+    ("export", "OK export 1"),  # 中断したセッションの記録
+    ("trace start", "OK trace=recording"),
+    ("trace stop", "OK trace=0"),
+    ("trace replay", "OK trace=replaying"),
+    ("trace rewind", "ERR 1 trace: start|stop|replay"),
+    ("frobnicate", "ERR 1 frobnicate: unknown command"),
+    ("x" * 200, "ERR line too long"),
+)
+
+WAIT_MS = 1500  # 1コマンドごとに待つ時間 (モードの遷移と描画を済ませる)
+BLOCK_MS = 2000  # 読まれていない出力先に書くと止まる時間 (1回の書き込みごと)
+
+
+class _StalledOutput(io.StringIO):
+    """blocked の間は、書き込みのたびに BLOCK_MS だけ止まる出力先 (読まれていない USB シリアル)"""
+    blocked = False
+
+    def write(self, text):
+        if self.blocked:
+            hostenv.clock.advance_us(BLOCK_MS * 1000)
+        return super().write(text)
+
+
+def check_stalled_output():
+    """出力先が詰まっている間に start / stop / export と state を10回送り、詰まりが解けたら返事を読む"""
+    r, w = os.pipe()
+    stdin = sys.stdin
+    sys.stdin = open(r, "r")
+    out = _StalledOutput()
+    seen = {}
+
+    async def scenario(sim):
+        import log
+        import runtime
+        log.writable = lambda: not out.blocked
+        await sim.wait_ms(300)
+        rt = runtime.Runtime.last
+        out.blocked = True
+        for line in ["start", "stop", "export"] + ["state"] * 10:
+            os.write(w, line.encode() + b"\n")
+            await sim.wait_ms(500)
+        await sim.wait_ms(5000)
+        seen["watchdog"] = sim.perf.report()["watchdog"]
+        seen["stats"] = rt.remote.stats()
+        seen["queue"] = rt.remote.OUT_QUEUE
+        start = len(out.getvalue())
+        out.blocked = False
+        await sim.wait_ms(3000)
+        seen["lines"] = [l for l in out.getvalue()[start:].splitlines() if l.startswith(("OK", "ERR", "T "))]
+        seen["after"] = rt.remote.stats()
+
+    try:
+        with contextlib.redirect_stdout(out):
+            Simulator().run(scenario)
+    finally:
+        sys.stdin.close()
+        sys.stdin = stdin
+        os.close(w)
+    lines = seen["lines"]
+    exported = [l for l in lines if l.startswith("T ")]
+    stats = seen["stats"]
+    return [
+        ("詰まっている間も餌をやる", seen["watchdog"]["starved"] == 0 and seen["watchdog"]["overruns"] == 0,
+         seen["watchdog"]),
+        # 返事は13個と export の行の1つ。出力待ちの列に入らなかった分を捨てる
+        ("溢れた返事を数える", stats["out_dropped"] == 14 - seen["queue"], stats),
+        ("詰まりが解けたら順番に出す",
+         lines[:2] == ["OK", "OK"] and len(exported) == 1 and lines[2] == exported[0]
+         and lines[3] == "OK export 1" and seen["after"]["out_pending"] == 0,
+         [l[:12] for l in lines[:4]]),
+    ]
+
+
+def main():
+    r, w = os.pipe()
+    stdin = sys.stdin
+    sys.stdin = open(r, "r")
+    out = io.StringIO()
+    results = []
+
+    async def scenario(sim):
+        await sim.wait_ms(300)
+        for line, expect in CHECKS:
+            start = len(out.getvalue())
+            os.write(w, line.encode() + b"\n")
+            await sim.wait_ms(WAIT_MS)
+            replies = [l for l in out.getvalue()[start:].splitlines() if l.startswith(("OK", "ERR"))]
+            reply = replies[0] if replies else "(返事なし)"
+            results.append((line, expect, reply, len(replies) == 1 and expect in reply))
+
+    try:
+        with contextlib.redirect_stdout(out):
+            Simulator().run(scenario)
+    finally:
+        sys.stdin.close()
+        sys.stdin = stdin
+        os.close(w)
+
+    failed = 0
+    for line, expect, reply, ok in results:
+        if not ok:
+            failed += 1
+        print("{} {:<32} -> {}".format("ok  " if ok else "FAIL", line[:32], reply))
+        if not ok:
+            print("     期待: {}".format(expect))
+    stalled = check_stalled_output()
+    for name, ok, detail in stalled:
+        if not ok:
+            failed += 1
+        print("{} {}: {}".format("ok  " if ok else "FAIL", name, detail))
+    total = len(results) + len(stalled)
+    print("{}/{} ok".format(total - failed, total))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
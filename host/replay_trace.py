@@ -0,0 +1,107 @@
+"""
+入力トレース (src/input_trace.py) をシミュレータ上で記録・再生する
+実機で記録したトレース (remote の "trace stop" で保存される input.trc) を PC で再生すると、
+同じ操作に対する入力遅延と、取りこぼした/余計なクリックの数を何度でも同じ条件で測れる。
+host/traces/ に置いたトレースは bench_suite.py でも "replay_<名前>" のシナリオとして再生される。
+
+実行:
+  python3 host/replay_trace.py input.trc                 # 再生して結果を表示
+  python3 host/replay_trace.py --record edit_fast_spin out.trc
+                                  # bench_suite のシナリオの操作をトレースとして記録する
+"""
+
+import hostenv
+
+import argparse
+import contextlib
+import io
+import json
+import os
+
+from sim import Simulator
+
+TRACES_DIR = os.path.join(hostenv.HOST_DIR, "traces")
+
+
+async def _runtime(sim):
+    """main() がランタイムを作るまで待つ"""
+    import runtime
+    while runtime.Runtime.last is None:
+        await sim.wait_ms(1)
+    return runtime.Runtime.last
+
+
+def replay_scenario(path, results):
+    """
+    トレースを再生するシナリオ (再生の結果は results["replay"] に入る)
+    Args:
+        path (str): トレースのファイル (シミュレータの作業ディレクトリが変わるので絶対パスにする)
+    """
+    path = os.path.abspath(path)
+
+    async def scenario(sim):
+        import input_trace
+        rt = await _runtime(sim)
+        await sim.wait_ms(300)
+        trace = input_trace.InputTrace.load(path)
+        results["replay"] = await input_trace.TraceReplayer(rt.hw, trace).run()
+
+    return scenario
+
+
+def record(scenario, path):
+    """シナリオの操作を記録してトレースに保存する"""
+    path = os.path.abspath(path)
+
+    async def recording(sim):
+        import input_trace
+        rt = await _runtime(sim)
+        trace = input_trace.InputTrace()
+        rt.hw.start_trace(trace)
+        await scenario(sim)
+        rt.hw.stop_trace()
+        trace.save(path)
+        return trace
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        Simulator().run(recording)
+
+
+def replay(path, cpu_scale=0.0):
+    results = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        Simulator(cpu_scale=cpu_scale).run(replay_scenario(path, results))
+    return results["replay"]
+
+
+def trace_files():
+    """host/traces/ のトレース [(名前, パス), ...]"""
+    if not os.path.isdir(TRACES_DIR):
+        return []
+    return [(name[:-4], os.path.join(TRACES_DIR, name))
+            for name in sorted(os.listdir(TRACES_DIR)) if name.endswith(".trc")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("trace", help="トレースのファイル")
+    parser.add_argument("--record", metavar="SCENARIO",
+                        help="bench_suite のシナリオの操作を記録して trace に保存する")
+    parser.add_argument("--cpu-scale", type=float, default=0.0,
+                        help="Python の実行時間を仮想時間に加算する倍率 (既定 0)")
+    args = parser.parse_args()
+
+    if args.record:
+        import bench_suite
+        scenarios = {name: scenario for name, scenario, _ in bench_suite.SCENARIOS}
+        if args.record not in scenarios:
+            parser.error("シナリオ: " + ", ".join(scenarios))
+        record(scenarios[args.record], args.trace)
+        print("記録しました:", args.trace)
+        return
+
+    print(json.dumps(replay(args.trace, args.cpu_scale), indent=2))
+
+
+if __name__ == "__main__":
+    main()
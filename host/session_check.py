@@ -0,0 +1,203 @@
+"""
+タイマーのセッションまわりの振る舞いをシミュレータで確かめる
+- 計測中にリモート操作で変えた設定は、計測が終わるまでフラッシュに書かない
+- アジェンダのセッションを長押しで抜けた後のメニューでは、ダブルクリックを判定しない
+- セッションの記録 (telemetry.bin) の一時停止の時間は、一時停止中に止めた分も数える
+- ファイナルフェーズの反転は選んだ時だけで、一時停止中は反転しない
+- 計測中にリモート操作でベル設定を変えても、画面の見出しと鳴らすベルは元の設定のまま (次のタイマーから)
+
+実行: python3 host/session_check.py
+"""
+
+import hostenv  # noqa: F401  (import パスと time.ticks_* の準備)
+
+import contextlib
+import io
+import sys
+
+import bells
+from sim import Simulator
+
+SETTINGS = [1, 2]
+
+
+async def _runtime(sim):
+    """main() がランタイムを作るまで待つ"""
+    import runtime
+    while runtime.Runtime.last is None:
+        await sim.wait_ms(1)
+    return runtime.Runtime.last
+
+
+def check_autosave():
+    """計測中の設定の変更は、終わってから書く"""
+    writes = []
+
+    async def scenario(sim):
+        import settings_store
+        rt = await _runtime(sim)
+        flush = settings_store.SettingsStore.flush
+
+        def recording_flush(store):
+            written = flush(store)
+            if written:
+                writes.append(sim.now_ms())
+            return written
+
+        settings_store.SettingsStore.flush = recording_flush
+        await sim.wait_ms(300)
+        await sim.turn(len(SETTINGS))  # START TIMER へ
+        await sim.click()
+        start_ms = sim.last_release_us // 1000
+        await sim.wait_ms(2000)
+        rt.remote.execute("bell 1 5")
+        end_ms = start_ms + bells.compile_schedule(SETTINGS)[-1][0]
+        await sim.wait_ms(end_ms - sim.now_ms() + 8000)
+        writes.append(end_ms)  # 最後は終了時刻 (比べる用)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        Simulator(settings=SETTINGS).run(scenario)
+    end_ms = writes.pop()
+    ok = bool(writes) and all(t >= end_ms for t in writes)
+    return ("計測中の設定の変更は終わってから書く", ok,
+            "書き込み {} / 終了 {}ms".format(writes, end_ms))
+
+
+def check_agenda_exit():
+    """アジェンダのセッションを長押しで抜けた後は、素早い2回のクリックも2回の短押しになる"""
+    out = io.StringIO()
+
+    async def scenario(sim):
+        await sim.wait_ms(300)
+        await sim.hold()               # スタート待ちのセッションからメニューへ
+        await sim.wait_ms(300)
+        await sim.double_click()       # 1st Bell を選び、編集画面ですぐ決定する
+        await sim.wait_ms(1000)
+
+    agenda = "Talk 1;1,2\nTalk 2;2,3\n"
+    with contextlib.redirect_stdout(out):
+        Simulator(files={"agenda.txt": agenda}).run(scenario)
+    text = out.getvalue()
+    after = text[text.find("--- Setting Mode ---"):]
+    # 1回目で 1st Bell の編集へ、2回目で決定してメニューに戻る
+    selected = "Selected: 1st Bell" in after
+    menus = after.count("--- Setting Mode ---")
+    return ("アジェンダを抜けた後のメニューは短押しを待たせない", selected and menus == 2,
+            "選択 {} / メニューの表示 {}回".format(selected, menus))
+
+
+def check_pause_accounting():
+    """一時停止を2回 (3秒、4秒) して、2回目の一時停止中に長押しで止めたセッションの記録"""
+    sessions = []
+
+    async def scenario(sim):
+        import telemetry_decode
+        await sim.wait_ms(300)
+        await sim.turn(len(SETTINGS))
+        await sim.click()
+        await sim.wait_ms(5000)
+        await sim.click()              # 一時停止
+        await sim.wait_ms(3000)
+        await sim.click()              # 再開
+        await sim.wait_ms(5000)
+        await sim.click()              # 一時停止
+        await sim.wait_ms(4000)
+        await sim.hold()               # 一時停止のまま止める
+        await sim.wait_ms(3000)        # autosave が書くまで
+        sessions.extend(telemetry_decode.decode_all(
+            telemetry_decode.read_records("telemetry.bin"))[0])
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        Simulator(settings=SETTINGS).run(scenario)
+    s = sessions[-1] if sessions else {}
+    # 2回目の一時停止は長押しの判定の時間も含む
+    lengths = [length for _, length in s.get("pauses", [])]
+    ok = (len(sessions) == 1 and s["pause_count"] == 2 and 7000 <= s["paused_ms"] < 9000
+          and lengths[0] == 3 and lengths[1] >= 4)
+    return ("一時停止中に止めたセッションの一時停止の時間", ok,
+            "paused_ms {} pauses {}".format(s.get("paused_ms"), s.get("pauses")))
+
+
+def _final_invert(style):
+    """1分のタイマーの残り約15秒で、一時停止の前と一時停止中のパネルの反転を調べる"""
+    seen = {}
+
+    async def scenario(sim):
+        from presentation_timer_mode import PresentationTimerMode
+        if style is not None:
+            PresentationTimerMode.FINAL_STYLE = style
+        await sim.wait_ms(300)
+        await sim.turn(1)
+        await sim.click()
+        await sim.wait_ms(60000 - 15000)
+        seen["running"] = sim.display._inverted
+        await sim.click()              # 一時停止
+        await sim.wait_ms(1000)
+        seen["paused"] = sim.display._inverted
+        await sim.hold()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        Simulator(settings=[1]).run(scenario)
+    return seen
+
+
+def check_final_invert():
+    default = _final_invert(None)
+    inverted = _final_invert("invert")
+    ok = (not default["running"] and not default["paused"]
+          and inverted["running"] and not inverted["paused"])
+    return ("ファイナルフェーズの反転は選んだ時だけ (一時停止中は戻す)", ok,
+            "既定 {} / invert {}".format(default, inverted))
+
+
+def check_remote_bells():
+    """[1,2] のタイマーの計測中に "bells 3,4" を送っても、見出しとベルは [1,2] のまま"""
+    seen = {}
+
+    async def scenario(sim):
+        import display
+        rt = await _runtime(sim)
+        await sim.wait_ms(300)
+        await sim.turn(len(SETTINGS))
+        await sim.click()
+        start_ms = sim.last_release_us // 1000
+        await sim.wait_ms(10000)
+        seen["reply"] = rt.remote.execute("bells 3,4")
+        await sim.wait_ms(start_ms + 61000 - sim.now_ms())   # 1分のベルの後
+        seen["header"] = display._backgrounds["timer"][0]
+        # 1分のベル (1回打つ) の分だけ打っている
+        seen["strikes"] = sum(1 for t in sim.solenoid_strikes_us() if t >= start_ms * 1000)
+        seen["state"] = rt.remote.execute("state")
+        await sim.hold()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        Simulator(settings=SETTINGS).run(scenario)
+    first = bells.compile_schedule(SETTINGS)[0][1]
+    ok = (seen["reply"] == "OK" and seen["header"] == SETTINGS and seen["strikes"] == first
+          and "bells=3,4" in seen["state"])
+    return ("計測中のベル設定の変更は次のタイマーから (見出しとベルが揃う)", ok,
+            "見出し {} / 打鍵 {} / {}".format(seen["header"], seen["strikes"], seen["state"]))
+
+
+CHECKS = (
+    check_autosave,
+    check_agenda_exit,
+    check_pause_accounting,
+    check_final_invert,
+    check_remote_bells,
+)
+
+
+def main():
+    failed = 0
+    for check in CHECKS:
+        name, ok, detail = check()
+        if not ok:
+            failed += 1
+        print("{} {}: {}".format("ok  " if ok else "FAIL", name, detail))
+    print("{}/{} ok".format(len(CHECKS) - failed, len(CHECKS)))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
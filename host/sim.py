@@ -0,0 +1,309 @@
+"""
+PC 上のハードウェアシミュレータ
+- 仮想時間のイベントループ上で src/ の main() や各モードを動かす
+- エンコーダの回転・ボタン操作をスクリプトで与える
+- 描画フレーム、I2C転送量、ソレノイドの打鍵時刻を記録する
+
+仮想時間は sleep/await の待ち時間と I2C の転送時間 (machine.I2C のモデル) で進む。
+cpu_scale を指定すると、Python の実行にかかった実時間をその倍率で仮想時間に加算する
+(0 なら計算時間は無視され、結果は毎回同じになる)。
+
+使い方:
+    sim = Simulator()
+    async def scenario(sim):
+        await sim.wait_ms(300)
+        await sim.click()
+    metrics = sim.run(scenario)
+"""
+
+import hostenv
+
+import asyncio
+import contextlib
+import io
+import os
+import selectors
+import sys
+import tempfile
+import time
+
+import machine
+
+# 入れ替えて読み直す src/ のモジュール
+SRC_MODULES = (
+    "main", "display", "hardware", "runtime", "quadrature", "bells", "settings_store", "agenda", "power", "perf", "render_worker", "startup", "log", "remote", "telemetry", "input_trace", "watchdog", "menu",
+    "presentation_timer_mode", "setting_mode", "edit_mode",
+)
+
+# エンコーダ1クリック分のグレイコード (A, B) の遷移
+CW_SEQUENCE = ((0, 1), (0, 0), (1, 0), (1, 1))
+CCW_SEQUENCE = ((1, 0), (0, 0), (0, 1), (1, 1))
+
+
+class SimulationStalled(Exception):
+    """どのタスクも時刻待ちをしておらず、仮想時間を進められない"""
+
+
+class _VirtualSelector:
+    """select() で待つ代わりに仮想時間を進めるセレクタ"""
+
+    def __init__(self, clock, cpu_scale):
+        self._selector = selectors.DefaultSelector()
+        self._clock = clock
+        self._cpu_scale = cpu_scale
+        self._last_real = time.perf_counter()
+
+    def __getattr__(self, name):
+        # register / get_key など select() 以外はそのまま本物のセレクタへ
+        return getattr(self._selector, name)
+
+    def select(self, timeout=None):
+        # 前回から今回までの Python の実行時間を仮想時間に加算する
+        now_real = time.perf_counter()
+        cpu_us = (now_real - self._last_real) * 1000000 * self._cpu_scale
+        self._clock.advance_us(cpu_us)
+
+        ready = self._selector.select(0)
+        if not ready:
+            if timeout is None:
+                raise SimulationStalled("no task is waiting on a deadline")
+            self._clock.advance_us(max(0.0, timeout * 1000000 - cpu_us))
+        self._last_real = time.perf_counter()
+        return ready
+
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    """loop.time() が仮想時間を返すイベントループ"""
+
+    def __init__(self, clock, cpu_scale=0.0):
+        self._clock = clock
+        super().__init__(_VirtualSelector(clock, cpu_scale))
+
+    def time(self):
+        return self._clock.now_us() / 1000000
+
+
+class Simulator:
+    def __init__(self, cpu_scale=0.0, settings=None, files=None, perf=False):
+        """
+        Args:
+            cpu_scale (float): Python の実行時間を仮想時間に加算する倍率
+            settings (list): 起動時に settings.json (旧形式。初回起動時に取り込まれる) として置いておくベル設定
+            files (dict): 起動時に置いておくその他のファイル (名前 -> 内容の文字列)
+            perf (bool): src/perf.py の計測を有効にする (結果は sim.perf.report() / dump())
+        """
+        self.cpu_scale = cpu_scale
+        self.settings = settings
+        self.files = files or {}
+        self.perf_enabled = perf
+        self.perf_text = ""       # perf=True の場合の perf.dump() の出力
+        self.clock = hostenv.clock
+
+        # 記録
+        self.frames = []          # (時刻us, I2C送信バイト数)
+        self.input_latency_us = []  # 入力から次のフレームまで
+        self.loop_lag_us = []     # 周期タスクの起床遅れ
+        self.marks = {}           # 名前 -> 時刻us
+        self.last_release_us = None  # 最後にボタンを離した時刻
+        self._pending_input_us = None
+
+    # --- 時刻 ---
+    def now_us(self):
+        return self.clock.now_us()
+
+    def now_ms(self):
+        return self.clock.now_us() // 1000
+
+    def mark(self, name, at_us=None):
+        """シナリオ中の時刻 (省略時は現在) に名前を付けて記録する"""
+        self.marks[name] = self.now_us() if at_us is None else at_us
+
+    async def wait_ms(self, ms):
+        await asyncio.sleep(ms / 1000)
+
+    # --- 入力 ---
+    def _pin(self, num):
+        return machine.Pin.registry[num]
+
+    def _input_done(self):
+        # 画面が変わらないまま次の入力が来た場合は、新しい入力から測り直す
+        self._pending_input_us = self.now_us()
+
+    async def turn(self, clicks, rate_hz=10):
+        """エンコーダを clicks クリック回す (負なら逆回転)。rate_hz はクリック/秒"""
+        hw = self.hardware.HardwareInterface
+        enc_a = self._pin(hw.ENC_A_PIN_NUM)
+        enc_b = self._pin(hw.ENC_B_PIN_NUM)
+        sequence = CW_SEQUENCE if clicks > 0 else CCW_SEQUENCE
+        edge_ms = 1000 / rate_hz / len(sequence)
+        for _ in range(abs(clicks)):
+            for a, b in sequence:
+                enc_a.drive(a)
+                enc_b.drive(b)
+                if (a, b) == sequence[-1]:
+                    self._input_done()  # デテントに戻った時点で1クリック完了
+                await self.wait_ms(edge_ms)
+
+    async def press(self, hold_ms=100, release_wait_ms=50):
+        """ボタンを hold_ms 押して離す"""
+        button = self._pin(self.hardware.HardwareInterface.BUTTON_PIN_NUM)
+        button.drive(1)
+        await self.wait_ms(hold_ms)
+        button.drive(0)
+        self.last_release_us = self.now_us()
+        self._input_done()
+        await self.wait_ms(release_wait_ms)
+
+    async def click(self):
+        await self.press(80)
+
+    async def double_click(self):
+        await self.press(80, release_wait_ms=0)
+        await self.wait_ms(100)
+        await self.click()
+
+    async def hold(self):
+        await self.press(self.hardware.HardwareInterface.LONG_PRESS_MS + 200)
+
+    # --- 記録用フック ---
+    def _hook_display(self):
+        display = self.display
+        original_flush = display.flush
+
+        def flush(force=False):
+            # I2C は main() の中で初期化されるので、呼ばれた時に取り出す
+            i2c = display.i2c
+            before = i2c.bytes_sent
+            result = original_flush(force)
+            now = self.now_us()
+            self.frames.append((now, i2c.bytes_sent - before))
+            if self._pending_input_us is not None:
+                self.input_latency_us.append(now - self._pending_input_us)
+                self._pending_input_us = None
+            return result
+
+        display.flush = flush
+
+    async def _lag_probe(self, period_ms=10):
+        while True:
+            deadline = self.now_us() + period_ms * 1000
+            await asyncio.sleep(period_ms / 1000)
+            self.loop_lag_us.append(max(0, self.now_us() - deadline))
+
+    def solenoid_strikes_us(self):
+        """ソレノイドを通電した時刻 (us) の一覧"""
+        pin = self._pin(self.hardware.HardwareInterface.SOLENOID_PIN_NUM)
+        return [t_ms * 1000 for t_ms, v in pin.history if v == 1]
+
+    def bell_patterns_us(self, gap_ms=500):
+        """打鍵を gap_ms 以上の間隔で区切ったパターンごとの (先頭時刻us, 打鍵数)"""
+        patterns = []
+        last = None
+        for t in self.solenoid_strikes_us():
+            if last is None or t - last > gap_ms * 1000:
+                patterns.append([t, 0])
+            patterns[-1][1] += 1
+            last = t
+        return [tuple(p) for p in patterns]
+
+    # --- 実行 ---
+    def _load_modules(self):
+        """src/ のモジュールを読み直して、前回の実行の状態を持ち越さないようにする"""
+        for name in SRC_MODULES:
+            sys.modules.pop(name, None)
+        machine.Pin.registry.clear()
+        machine.WDT.last = None
+        import display
+        import hardware
+        import main
+        import power
+        import perf
+        import startup
+        perf.enable(self.perf_enabled)
+        self.startup = startup
+        self.perf = perf
+        self.display = display
+        self.power = power
+        self.hardware = hardware
+        self.main = main
+
+    def run(self, scenario, target=None):
+        """
+        シナリオを仮想時間で実行する
+        Args:
+            scenario: async def scenario(sim) 。終わると target も止める
+            target: 動かすコルーチン関数 (省略時は main.main)
+        Return:
+            dict: 計測結果 (metrics() と同じ)
+        """
+        workdir = tempfile.TemporaryDirectory()
+        cwd = os.getcwd()
+        os.chdir(workdir.name)
+        self.clock.use_virtual()
+        loop = VirtualTimeLoop(self.clock, self.cpu_scale)
+        try:
+            if self.settings is not None:
+                import json
+                with open("settings.json", "w") as f:
+                    json.dump(self.settings, f)
+            for name, text in self.files.items():
+                with open(name, "w") as f:
+                    f.write(text)
+            self._load_modules()
+            self._hook_display()
+            start_us = self.now_us()
+
+            async def runner():
+                target_task = asyncio.create_task((target or self.main.main)())
+                probe = asyncio.create_task(self._lag_probe())
+                try:
+                    await scenario(self)
+                finally:
+                    # target が起動した常駐タスクも含めて止める
+                    others = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+                    for task in others:
+                        task.cancel()
+                    await asyncio.gather(*others, return_exceptions=True)
+                if not target_task.cancelled() and target_task.exception():
+                    raise target_task.exception()
+
+            loop.run_until_complete(runner())
+            self.duration_us = self.now_us() - start_us
+            if self.perf_enabled:
+                # 経過時間を含む統計もあるので、仮想時間のうちに取っておく
+                out = io.StringIO()
+                with contextlib.redirect_stdout(out):
+                    self.perf.dump()
+                self.perf_text = out.getvalue()
+        finally:
+            loop.close()
+            self.clock.use_real()
+            os.chdir(cwd)
+            workdir.cleanup()
+        return self.metrics()
+
+    def metrics(self):
+        duration_s = self.duration_us / 1000000
+        i2c_bytes = self.display.i2c.bytes_sent if self.display.i2c is not None else 0
+        return {
+            "duration_s": round(duration_s, 3),
+            "frames": len(self.frames),
+            "fps": round(len(self.frames) / duration_s, 2) if duration_s else 0.0,
+            "i2c_bytes": i2c_bytes,
+            "i2c_bytes_per_frame": (i2c_bytes // len(self.frames)) if self.frames else 0,
+            "input_latency_ms": _stats_ms(self.input_latency_us),
+            "loop_lag_ms": _stats_ms(self.loop_lag_us),
+        }
+
+
+def _stats_ms(samples_us):
+    """平均 / p95 / 最大 (ms)"""
+    if not samples_us:
+        return {"avg": 0.0, "p95": 0.0, "max": 0.0}
+    ordered = sorted(samples_us)
+    n = len(ordered)
+    return {
+        "avg": round(sum(ordered) / n / 1000, 2),
+        "p95": round(ordered[min(n - 1, int(n * 0.95))] / 1000, 2),
+        "max": round(ordered[-1] / 1000, 2),
+    }
@@ -0,0 +1,82 @@
+"""
+CPython 用の ssd1306 ドライバのスタンドイン
+micropython-lib の ssd1306.py と同じインターフェース (I2C のみ)。
+"""
+
+import framebuf
+
+SET_CONTRAST = 0x81
+SET_ENTIRE_ON = 0xA4
+SET_NORM_INV = 0xA6
+SET_DISP = 0xAE
+SET_MEM_ADDR = 0x20
+SET_COL_ADDR = 0x21
+SET_PAGE_ADDR = 0x22
+
+
+class SSD1306(framebuf.FrameBuffer):
+    def __init__(self, width, height, external_vcc):
+        self.width = width
+        self.height = height
+        self.external_vcc = external_vcc
+        self.pages = self.height // 8
+        self.buffer = bytearray(self.pages * self.width)
+        super().__init__(self.buffer, self.width, self.height, framebuf.MONO_VLSB)
+        self.is_on = False
+        self.contrast_level = 0xFF
+        self.inverted = False
+        self.init_display()
+
+    def init_display(self):
+        self.write_cmd(SET_MEM_ADDR)
+        self.write_cmd(0x00)
+        self.fill(0)
+        self.show()
+        self.poweron()
+
+    def poweroff(self):
+        self.write_cmd(SET_DISP)
+        self.is_on = False
+
+    def poweron(self):
+        self.write_cmd(SET_DISP | 0x01)
+        self.is_on = True
+
+    def contrast(self, contrast):
+        self.write_cmd(SET_CONTRAST)
+        self.write_cmd(contrast)
+        self.contrast_level = contrast
+
+    def invert(self, invert):
+        self.write_cmd(SET_NORM_INV | (invert & 1))
+        self.inverted = bool(invert & 1)
+
+    def rotate(self, rotate):
+        pass
+
+    def show(self):
+        self.write_cmd(SET_COL_ADDR)
+        self.write_cmd(0)
+        self.write_cmd(self.width - 1)
+        self.write_cmd(SET_PAGE_ADDR)
+        self.write_cmd(0)
+        self.write_cmd(self.pages - 1)
+        self.write_data(self.buffer)
+
+
+class SSD1306_I2C(SSD1306):
+    def __init__(self, width, height, i2c, addr=0x3C, external_vcc=False):
+        self.i2c = i2c
+        self.addr = addr
+        self.temp = bytearray(2)
+        self.write_list = [b"\x40", None]
+        super().__init__(width, height, external_vcc)
+
+    def write_cmd(self, cmd):
+        self.temp[0] = 0x80
+        self.temp[1] = cmd
+        self.i2c.writeto(self.addr, self.temp)
+
+    def write_data(self, buf):
+        self.write_list[1] = buf
+        self.i2c.writevto(self.addr, self.write_list)
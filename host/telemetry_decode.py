@@ -0,0 +1,98 @@
+"""
+セッションの記録 (src/telemetry.py) を読んで表にする
+次のどちらかを読む:
+  - リモート操作の export の出力を保存したもの ("T <16進数>" の行。ほかの行は読み飛ばす)
+  - 実機からコピーした telemetry.bin
+
+「終了予定との差」は途中で止めたセッションなら残っていた時間 (負)。タイマーは 0 で止まるので、
+予定を超えて話した時間 (超過) は記録していない (0 まで計ったセッションは終わりに気づいた遅れだけ)。
+
+実行: python3 host/telemetry_decode.py export.txt
+      python3 host/telemetry_decode.py telemetry.bin
+"""
+
+import hostenv  # noqa: F401  (import パスの準備)
+
+import binascii
+import sys
+
+import telemetry
+from presentation_timer_mode import TimerStatus
+
+STATUS_NAMES = {
+    TimerStatus.FINISHED: "finished",
+    TimerStatus.GO_TO_SETTINGS: "stopped",
+    TimerStatus.NEXT_SESSION: "next",
+    TimerStatus.ERROR: "error",
+}
+
+
+def read_records(path):
+    """ファイルからレコードを読む (export の出力か telemetry.bin)"""
+    with open(path, "rb") as f:
+        data = f.read()
+    records = []
+    if data[:1] == bytes([telemetry.MAGIC]) or data[:1] == b"\x00":
+        # telemetry.bin
+        for offset in range(0, len(data) - telemetry.RECORD_SIZE + 1, telemetry.RECORD_SIZE):
+            records.append(data[offset:offset + telemetry.RECORD_SIZE])
+    else:
+        for line in data.decode(errors="replace").splitlines():
+            line = line.strip()
+            if line.startswith("T "):
+                try:
+                    records.append(binascii.unhexlify(line[2:].strip()))
+                except (binascii.Error, ValueError):
+                    print("読めない行:", line[:40], file=sys.stderr)
+    return records
+
+
+def decode_all(records):
+    """読めたレコードを seq の順に返す (重複は1つにまとめる)"""
+    sessions = {}
+    bad = 0
+    for record in records:
+        decoded = telemetry.decode_record(record) if len(record) == telemetry.RECORD_SIZE else None
+        if decoded is None:
+            if record[:1] == bytes([telemetry.MAGIC]):
+                bad += 1
+            continue
+        sessions[decoded["seq"]] = decoded
+    return [sessions[seq] for seq in sorted(sessions)], bad
+
+
+def _min_sec(sec):
+    return "{}:{:02}".format(sec // 60, sec % 60)
+
+
+def format_session(s):
+    lines = ["#{seq:<4} {name:<12} {status:<8} 予定 {planned:>6}  実行 {run:>6}  一時停止 {paused:>6}  終了予定との差 {end_offset:+.1f}s".format(
+        seq=s["seq"], name=s["name"] or "-", status=STATUS_NAMES.get(s["status"], str(s["status"])),
+        planned=_min_sec(s["planned_s"]), run=_min_sec(s["run_ms"] // 1000),
+        paused=_min_sec(s["paused_ms"] // 1000), end_offset=s["end_offset_ms"] / 1000)]
+    if s["bells"]:
+        lines.append("      ベル: " + "  ".join(
+            "{}={}".format(_min_sec(scheduled), "missed" if error is None else "{:+d}ms".format(error))
+            for scheduled, error in s["bells"]))
+    if s["pause_count"]:
+        text = "  ".join("{}+{}s".format(_min_sec(at), length) for at, length in s["pauses"])
+        if s["pause_count"] > len(s["pauses"]):
+            text += "  (ほか {} 回)".format(s["pause_count"] - len(s["pauses"]))
+        lines.append("      一時停止: " + text)
+    return "\n".join(lines)
+
+
+def main():
+    if len(sys.argv) != 2:
+        print(__doc__)
+        sys.exit(2)
+    sessions, bad = decode_all(read_records(sys.argv[1]))
+    for s in sessions:
+        print(format_session(s))
+    print("{} セッション{}".format(len(sessions), " (CRC 不一致 {} 件)".format(bad) if bad else ""))
+    if sessions:
+        print("終了予定との差: 途中で止めた時は残り時間 (負)。超過の時間はタイマーが 0 で止まるので測っていません")
+
+
+if __name__ == "__main__":
+    main()
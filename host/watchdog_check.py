@@ -0,0 +1,253 @@
+"""
+ループの期限監視とウォッチドッグ (src/watchdog.py) をシミュレータで確かめる
+1. タイマーの計測中に I2C の転送を1回だけ遅らせると、ストールとして i2c のせいに記録される
+2. I2C の転送が止まったまま (実機ならウォッチドッグでリセットされる) になった時点の
+   スクラッチレジスタで起動し直すと、メニューに戻らずに計測中のセッションが途中から再開される
+3. Ctrl-C で止めて (すべてのループが止まる) watchdog.release() を呼ぶと、REPL にいる間も
+   タイマーが餌をやり続ける。その後の machine.reset() (rp2 ではウォッチドッグのリセットと報告される) では
+   セッションを再開しない
+4. main.WATCHDOG = False なら、計測中もスクラッチレジスタに何も書かない
+5. 2つのコアが同時に別々のサブシステムを処理している時、止まったループのコアの処理のせいにする
+
+実行: python3 host/watchdog_check.py
+"""
+
+import hostenv
+
+import contextlib
+import io
+import sys
+import time
+
+import machine
+from sim import Simulator
+
+SETTINGS = [1, 2, 3]   # 3分のタイマー (1分のベルは止まる前に鳴っている)
+STALL_MS = 700         # 1回だけ遅らせる I2C の転送の時間
+HANG_AT_MS = 70000     # 計測を始めてから I2C が止まるまでの時間
+BOOT_MS = 1500         # 起動し直してから調べるまで
+
+
+def _slow_flush(delay_ms, at_ms=0, on_stall=None):
+    """今から at_ms 以降の最初の転送を delay_ms だけ遅らせる"""
+    import display
+    flush = display._flush
+    start = time.ticks_ms()
+    done = []
+
+    def slow(force):
+        if not done and time.ticks_diff(time.ticks_ms(), start) >= at_ms:
+            done.append(True)
+            hostenv.clock.advance_us(delay_ms * 1000)
+            if on_stall is not None:
+                on_stall()
+        return flush(force)
+
+    display._flush = slow
+
+
+async def _start_timer(sim):
+    await sim.wait_ms(300)
+    await sim.turn(len(SETTINGS))  # START TIMER へ
+    await sim.click()
+
+
+def run_stall():
+    results = {}
+
+    async def scenario(sim):
+        await _start_timer(sim)
+        await sim.wait_ms(5000)
+        _slow_flush(STALL_MS)
+        await sim.wait_ms(3000)
+        results["watchdog"] = sim.perf.report()["watchdog"]
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        Simulator(settings=SETTINGS).run(scenario)
+    return results
+
+
+def run_reset():
+    results = {}
+    scratch = {}
+
+    async def hang(sim):
+        await _start_timer(sim)
+        wdt = machine.WDT.last
+        # 止まった時点のスクラッチレジスタを取っておく (実機ならこの後リセットされる)
+        _slow_flush(wdt.timeout + 1000, HANG_AT_MS, lambda: scratch.update(machine.mem32))
+        await sim.wait_ms(HANG_AT_MS + 12000)
+        results["max_gap_ms"] = wdt.max_gap_ms
+        results["timeout_ms"] = wdt.timeout
+
+    async def reboot(sim):
+        from presentation_timer_mode import PresentationTimerMode
+        await sim.wait_ms(BOOT_MS)
+        results["watchdog"] = sim.perf.report()["watchdog"]
+        results["frames_at_boot"] = len(sim.frames)
+        await sim.wait_ms(3 * 60000)
+        results["timer"] = PresentationTimerMode.last_stats
+        results["strikes"] = len(sim.solenoid_strikes_us())
+
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        Simulator(settings=SETTINGS).run(hang)
+        # ウォッチドッグのリセット: RAM は消えるが、スクラッチレジスタは残る
+        machine.mem32.clear()
+        machine.mem32.update(scratch)
+        machine._reset_cause = machine.WDT_RESET
+        try:
+            Simulator(settings=SETTINGS).run(reboot)
+        finally:
+            machine._reset_cause = machine.PWRON_RESET
+            machine.mem32.clear()
+    results["resumed"] = "セッションを再開します" in out.getvalue()
+    return results
+
+
+def run_release():
+    """計測中に Ctrl-C で止めた時と同じく、ループを全部止めてから release() を呼ぶ"""
+    results = {}
+
+    async def scenario(sim):
+        import asyncio
+        import watchdog
+        await _start_timer(sim)
+        await sim.wait_ms(5000)
+        # 実機の Ctrl-C では止まったコルーチンの finally は動かない (計測中のセッションの記録が残る)。
+        # ここではタスクを止めた後に、止めた時点のスクラッチレジスタに戻しておく
+        interrupted = dict(machine.mem32)
+        me = asyncio.current_task()
+        others = [t for t in asyncio.all_tasks() if t is not me]
+        for task in others:
+            task.cancel()
+        await asyncio.gather(*others, return_exceptions=True)
+        machine.mem32.update(interrupted)
+        results["session_at_interrupt"] = bool(interrupted.get(watchdog._SCR_SESSION))
+        watchdog.release()
+        wdt = machine.WDT.last
+        wdt.max_gap_ms = 0
+        await sim.wait_ms(30000)       # REPL で過ごす時間
+        results["max_gap_ms"] = wdt.max_gap_ms
+        results["expired"] = wdt.expired()
+        results["timeout_ms"] = wdt.timeout
+        scratch.update(machine.mem32)
+
+    async def reboot(sim):
+        await sim.wait_ms(BOOT_MS)
+
+    scratch = {}
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        Simulator(settings=SETTINGS).run(scenario)
+        # REPL から machine.reset(): rp2 ではウォッチドッグのリセットとして報告される
+        machine.mem32.clear()
+        machine.mem32.update(scratch)
+        machine._reset_cause = machine.WDT_RESET
+        boot = out.tell()
+        try:
+            Simulator(settings=SETTINGS).run(reboot)
+        finally:
+            machine._reset_cause = machine.PWRON_RESET
+            machine.mem32.clear()
+    results["resumed"] = "セッションを再開します" in out.getvalue()[boot:]
+    return results
+
+
+def run_disabled():
+    """main.WATCHDOG = False で計測中のスクラッチレジスタを調べる"""
+    results = {}
+    sim = Simulator(settings=SETTINGS)
+
+    async def target():
+        sim.main.WATCHDOG = False
+        await sim.main.main()
+
+    async def scenario(sim):
+        await _start_timer(sim)
+        await sim.wait_ms(65000)       # 1分のベルと、毎秒のセッションの記録の後
+        results["scratch"] = {hex(a): v for a, v in machine.mem32.items() if v}
+
+    machine.mem32.clear()
+    with contextlib.redirect_stdout(io.StringIO()):
+        sim.run(scenario, target=target)
+    return results
+
+
+def run_cores():
+    """コア1 (描画) が I2C の転送中、コア0 がフラッシュへの書き込み中に、描画のループだけが期限を過ぎる"""
+    import watchdog
+    cpuid = watchdog._CPUID
+    hostenv.clock.use_virtual()
+    machine.mem32.clear()
+    try:
+        monitor = watchdog.DeadlineMonitor(path="stalls_check.bin")
+        input_slot = monitor.register("input")
+        render_slot = monitor.register("render", 1)
+        monitor.start()
+        monitor.expect(render_slot, 200)
+        machine.mem32[cpuid] = 1
+        watchdog.enter(watchdog.I2C)       # コア1: 転送が止まる
+        machine.mem32[cpuid] = 0
+        watchdog.enter(watchdog.FLASH)     # コア0: その間に書き込みを始める
+        hostenv.clock.advance_us(600 * 1000)
+        monitor.check()
+        stall_word = machine.mem32[watchdog._SCR_STALL]
+        monitor.tick(input_slot)
+        machine.mem32[cpuid] = 1
+        watchdog.leave()
+        monitor.tick(render_slot)
+        machine.mem32[cpuid] = 0
+        watchdog.leave()
+    finally:
+        watchdog._running = False
+        machine.mem32.clear()
+        hostenv.clock.use_real()
+    return {"scratch": watchdog.NAMES[stall_word & 0xFF], "slowest": monitor.stats()["slowest"]}
+
+
+def main():
+    stall = run_stall()
+    reset = run_reset()
+    release = run_release()
+    disabled = run_disabled()
+    cores = run_cores()
+    timer = reset["timer"] or {}
+    expect_run_ms = SETTINGS[-1] * 60000 - HANG_AT_MS
+    checks = (
+        ("遅れた転送をストールとして記録する", stall["watchdog"]["overruns"] > 0, stall["watchdog"]),
+        ("ストールを i2c のせいにする",
+         any(s.endswith(" i2c") for s in stall["watchdog"]["slowest"]), stall["watchdog"]["slowest"]),
+        ("止まっている間は餌をやらない", reset["max_gap_ms"] > reset["timeout_ms"],
+         "{}ms > {}ms".format(reset["max_gap_ms"], reset["timeout_ms"])),
+        ("リセット後にセッションを再開する", reset["resumed"], reset["resumed"]),
+        ("止まった I2C をリセットの原因として記録する",
+         any(s.startswith("reset ") and s.endswith(" i2c") for s in reset["watchdog"]["slowest"]),
+         reset["watchdog"]["slowest"]),
+        # 止まったのは約70秒の時点: 残りの約110秒だけ走って終わる (誤差は最後に書いた秒の分まで)
+        ("続きの時間だけ計測する",
+         timer.get("end_error_ms") is not None and abs(timer["run_ms"] - BOOT_MS - expect_run_ms) < 3000,
+         timer.get("run_ms")),
+        ("鳴らしたベルは鳴らし直さない", reset["strikes"] == 5, "{} strikes".format(reset["strikes"])),
+        ("Ctrl-C の後はタイマーが餌をやる",
+         not release["expired"] and release["max_gap_ms"] < release["timeout_ms"],
+         "最大の間隔 {}ms / 期限切れ {}".format(release["max_gap_ms"], release["expired"])),
+        ("Ctrl-C の後の machine.reset() では再開しない",
+         release["session_at_interrupt"] and not release["resumed"],
+         "止めた時の記録 {} / 再開 {}".format(release["session_at_interrupt"], release["resumed"])),
+        ("WATCHDOG = False ならスクラッチに書かない", not disabled["scratch"], disabled["scratch"]),
+        ("止まったループのコアの処理を原因にする",
+         cores["scratch"] == "i2c" and cores["slowest"] == ["render 400ms i2c"],
+         "スクラッチ {} / {}".format(cores["scratch"], cores["slowest"])),
+    )
+    failed = 0
+    for name, ok, detail in checks:
+        if not ok:
+            failed += 1
+        print("{} {}: {}".format("ok  " if ok else "FAIL", name, detail))
+    print("{}/{} ok".format(len(checks) - failed, len(checks)))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+アジェンダ (連続するセッションの予定)
+1行に1セッションのテキストファイルを、先頭から1行ずつ読む。
+メモリに持つのは現在と次のセッション、次に読む位置 (ファイル内のオフセット) だけなので、
+セッション数がいくつあっても使用メモリは変わらない。
+
+ファイルの形式 (agenda.txt):
+    # コメントと空行は読み飛ばす
+    タイトル;ベル,ベル,...
+  ベルは 分 (回数はリスト内の順番) か 分:回数。最も遅いベルが終了時刻 (bells.py と同じ)
+    Opening;3,4,5
+    Keynote;20:1,25:2,28:2,30:3
+"""
+
+import bells
+import log
+
+AGENDA_FILE = "agenda.txt"
+
+
+def parse_session(line):
+    """
+    1行をセッションに変換する
+    Return:
+        (str, list): (タイトル, ベル設定)。コメント・空行なら None
+    """
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    title, _, spec = line.rpartition(";")
+    bell_settings = [bells.parse_text(item) for item in spec.split(",")]
+    return title.strip(), bell_settings
+
+
+class Agenda:
+    """
+    アジェンダを先頭から順に進めるクラス
+    使い方:
+        agenda = Agenda()
+        if agenda.load():
+            title, bell_settings = agenda.current
+            agenda.advance()   # 次のセッションへ
+    """
+
+    def __init__(self, path=AGENDA_FILE):
+        self.path = path
+        self.current = None  # (タイトル, ベル設定)
+        self.next = None
+        self.index = 0       # 現在のセッションの番号 (1始まり)
+        self._offset = 0     # 次に読む行の位置
+        self.errors = 0      # 読めなかった行の数
+
+    def load(self):
+        """
+        先頭の2セッションを読む
+        Return:
+            bool: セッションが1つ以上あれば True
+        """
+        self._offset = 0
+        self.errors = 0
+        try:
+            self.current = self._read_next()
+        except OSError:
+            self.current = None
+            return False
+        self.next = self._read_next()
+        self.index = 1 if self.current is not None else 0
+        if self.current is not None:
+            log.info("アジェンダ: {}", self.path)
+        return self.current is not None
+
+    def advance(self):
+        """
+        次のセッションへ進み、その次のセッションを読み込んでおく
+        Return:
+            bool: 次のセッションがあれば True (最後だった場合は current が None になる)
+        """
+        self.current = self.next
+        if self.current is None:
+            return False
+        self.index += 1
+        self.next = self._read_next()
+        return True
+
+    def _read_next(self):
+        """_offset から次のセッションを1つ読む (無ければ None)"""
+        with open(self.path, "r") as f:
+            f.seek(self._offset)
+            while True:
+                line = f.readline()
+                if not line:
+                    return None
+                self._offset = f.tell()
+                try:
+                    session = parse_session(line)
+                except ValueError:
+                    log.warn("アジェンダの行を読めません: {}", line.strip())
+                    self.errors += 1
+                    continue
+                if session is not None:
+                    return session
+
+
+if __name__ == "__main__":
+    agenda = Agenda()
+    if agenda.load():
+        while agenda.current is not None:
+            print(agenda.index, agenda.current, "次:", agenda.next)
+            agenda.advance()
+    else:
+        print(AGENDA_FILE, "がありません")
@@ -0,0 +1,78 @@
+"""
+ベル設定の扱い
+設定は「ベルごとの要素」のリスト。要素は次のどちらか:
+  - int: 鳴らす時間 (分)。鳴らす回数はリスト内の順番 (1番目=1回, 2番目=2回, ...)
+  - [分, 回数]: 鳴らす回数を個別に指定
+最も遅いベルが終了時刻 (タイマー終了時に鳴る) になる。
+例: [7, 10, 15]  /  [[5, 1], [10, 1], [15, 2], [18, 2], [20, 3]]
+"""
+
+_ORDINALS = ("1st", "2nd", "3rd")
+
+
+def parse(entry, index):
+    """
+    ベル設定の1要素を (分, 回数) に分解する
+    Args:
+        entry: int または [分, 回数]
+        index (int): リスト内の位置 (回数の省略時に使う)
+    """
+    if isinstance(entry, int):
+        return entry, index + 1
+    return entry[0], entry[1]
+
+
+def minutes(entry):
+    """ベル設定の1要素から鳴らす時間 (分) を取り出す"""
+    if isinstance(entry, int):
+        return entry
+    return entry[0]
+
+
+def with_minutes(entry, new_minutes):
+    """回数の指定を保ったまま、鳴らす時間だけを変えた要素を返す"""
+    if isinstance(entry, int):
+        return new_minutes
+    return [new_minutes, entry[1]]
+
+
+def parse_text(text):
+    """
+    "分" または "分:回数" の文字列をベル設定の1要素にする (アジェンダやリモート操作の書き方)
+    例: "10" -> 10,  "8:2" -> [8, 2]
+    """
+    mins, _, strikes = text.strip().partition(":")
+    if strikes:
+        return [int(mins), int(strikes)]
+    return int(mins)
+
+
+def to_text(bell_settings):
+    """ベル設定を "分,分:回数,..." の文字列にする (parse_text の逆)"""
+    items = []
+    for entry in bell_settings:
+        if isinstance(entry, int):
+            items.append(str(entry))
+        else:
+            items.append("{}:{}".format(entry[0], entry[1]))
+    return ",".join(items)
+
+
+def title(index):
+    """画面に表示するベルの名前 (例: "1st Bell", "4th Bell")"""
+    if index < len(_ORDINALS):
+        return _ORDINALS[index] + " Bell"
+    return "{}th Bell".format(index + 1)
+
+
+def compile_schedule(bell_settings):
+    """
+    ベル設定を時刻順の (経過ms, 回数) のリストに変換する
+    最後の要素が終了時刻になる
+    """
+    events = []
+    for i, entry in enumerate(bell_settings):
+        mins, strikes = parse(entry, i)
+        events.append((int(mins * 60) * 1000, strikes))
+    events.sort()
+    return events
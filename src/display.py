@@ -1,67 +1,461 @@
 # ディスプレイモジュールを使用して文字を表示させるコード
 import machine
+import _thread
+import framebuf
 import ssd1306
+import bells
+import time
+import perf
+import watchdog
 
 # --- 初期設定 ---
-i2c = machine.I2C(0, sda=machine.Pin(0), scl=machine.Pin(1))
-# 画面サイズ 128x64
-display = ssd1306.SSD1306_I2C(128, 64, i2c)
+# I2C とドライバは import 時ではなく init() で作る (起動直後にすぐスプラッシュを出すため)
+i2c = None
+display = None
+_buf_view = None  # display.buffer の memoryview (init() で作る)
 
+# I2C バスの排他 (描画スレッドの転送と、メインのコアからの明るさ変更などが重ならないように)
+bus_lock = _thread.allocate_lock()
 
-def draw_timer_screen(current_min, current_sec, bell_settings):
+# --- 差分転送 (ダーティ領域フラッシュ) 用 ---
+# SSD1306のコマンド (ssd1306.pyと同じ値)
+_SET_COL_ADDR = 0x21
+_SET_PAGE_ADDR = 0x22
+
+WIDTH = 128
+PAGES = 8  # 1ページ = 縦8ピクセル
+
+# パネルに既に表示されている内容の控え (シャドウバッファ)
+_shadow = bytearray(WIDTH * PAGES)
+_shadow_valid = False  # パネルの内容が不明な間は全画面転送する (init() で全消去の状態になる)
+
+# 転送量の統計 (I2Cに流したバイト数。コマンドバイトも含む)
+last_flush_bytes = 0   # 直前のフレーム
+total_flush_bytes = 0  # 起動からの累計
+flush_count = 0        # flush() の呼び出し回数
+
+# 1回の部分転送にかかるコマンド分のオーバーヘッド
+# (コマンド6個 x 2バイト + データ先頭の制御バイト1)
+_WINDOW_OVERHEAD = 13
+
+# 転送する範囲のフレームバッファの memoryview (開始位置 << 8 | 長さ -> memoryview)
+# 毎フレーム同じ範囲が変わることが多いので作ったものを使い回す (毎回作るとメモリを確保する)
+_views = {}
+_VIEWS_MAX = 32
+
+
+def init():
+    """
+    I2C バスと SSD1306 を初期化する (2回目以降は何もしない)
+    ドライバの初期化でパネルは全消去されるので、シャドウバッファも全消去の状態として扱う
+    (最初のフレームも変化した部分だけの転送で済む)
+    """
+    global i2c, display, _buf_view, _shadow_valid
+    if display is not None:
+        return
+    i2c = machine.I2C(0, sda=machine.Pin(0), scl=machine.Pin(1))
+    # 画面サイズ 128x64
+    display = ssd1306.SSD1306_I2C(128, 64, i2c)
+    _buf_view = memoryview(display.buffer)
+    _shadow[:] = display.buffer
+    _shadow_valid = True
+
+
+def invalidate():
+    """
+    シャドウバッファを無効化し、次回の flush() で全画面を転送させる
+    (パネルがリセットされた場合など、表示内容が不明になった時に呼ぶ)
+    """
+    global _shadow_valid
+    _shadow_valid = False
+
+
+# --- パネルの明るさと電源 (省電力用) ---
+# どちらもコマンドを送るだけで、パネルの表示内容 (GDDRAM) は保たれる
+def set_contrast(level):
+    """明るさ (0-255) を変える"""
+    with bus_lock:
+        display.contrast(level)
+
+
+def set_power(on):
+    """パネルの表示を入/切する。入に戻すと直前の画面がそのまま出る"""
+    with bus_lock:
+        if on:
+            display.poweron()
+        else:
+            display.poweroff()
+
+
+def _send_window(page, x0, x1):
+    """1ページ内の x0〜x1 列だけをパネルへ転送し、シャドウを更新する"""
+    display.write_cmd(_SET_COL_ADDR)
+    display.write_cmd(x0)
+    display.write_cmd(x1)
+    display.write_cmd(_SET_PAGE_ADDR)
+    display.write_cmd(page)
+    display.write_cmd(page)
+
+    start = page * WIDTH + x0
+    end = page * WIDTH + x1 + 1
+    data = _window_view(start, end)
+    display.write_data(data)
+    _shadow[start:end] = data
+    return _WINDOW_OVERHEAD + (end - start)
+
+
+def _window_view(start, end):
+    """フレームバッファの start〜end の memoryview (同じ範囲なら前に作ったものを返す)"""
+    key = (start << 8) | (end - start)
+    view = _views.get(key)
+    if view is None:
+        if len(_views) >= _VIEWS_MAX:
+            _views.clear()
+        view = _buf_view[start:end]
+        _views[key] = view
+    return view
+
+
+def flush(force=False):
+    """
+    フレームバッファの内容をパネルへ反映する (display.show() の代わり)
+
+    シャドウバッファと比較し、内容が変わったページの変化した列範囲だけを
+    I2Cで送る。カウントダウンで1桁だけ変わった場合などは数十バイトで済む。
+
+    Args:
+        force (bool): True の場合は差分を取らず全画面を転送する
+    Return:
+        int: このフレームでI2Cに送ったバイト数
+    """
+    if perf.ENABLED:
+        t0 = time.ticks_us()
+    with bus_lock:
+        watchdog.enter(watchdog.I2C)
+        try:
+            sent = _flush(force)
+        finally:
+            watchdog.leave()
+    if perf.ENABLED:
+        perf.record("display.flush", t0)
+    return sent
+
+
+def _flush(force):
+    global _shadow_valid, last_flush_bytes, total_flush_bytes, flush_count
+
+    buf = display.buffer
+    sent = 0
+
+    if force or not _shadow_valid:
+        display.show()
+        _shadow[:] = buf
+        _shadow_valid = True
+        sent = _WINDOW_OVERHEAD + len(buf)
+    else:
+        for page in range(PAGES):
+            base = page * WIDTH
+
+            # 左端から最初に変化した列を探す
+            x0 = 0
+            while x0 < WIDTH and buf[base + x0] == _shadow[base + x0]:
+                x0 += 1
+            if x0 == WIDTH:
+                continue  # このページは変化なし
+
+            # 右端から最後に変化した列を探す
+            x1 = WIDTH - 1
+            while buf[base + x1] == _shadow[base + x1]:
+                x1 -= 1
+
+            sent += _send_window(page, x0, x1)
+
+    last_flush_bytes = sent
+    total_flush_bytes += sent
+    flush_count += 1
+    return sent
+
+
+# --- 描画キャッシュ (静的な背景レイヤーと大きな数字のグリフ) ---
+HEIGHT = PAGES * 8
+
+# 画面名 -> (背景のキー, 背景のフレームバッファ内容)
+# 背景は画面ごとに最新の1枚だけ持つ (1枚 1KB)
+_backgrounds = {}
+
+# 文字コード | 横倍率 << 8 | 縦倍率 << 12 -> 拡大済みグリフの FrameBuffer
+# (キーを整数にして、引くたびにタプルを作らないようにする)
+_glyphs = {}
+
+# 大きな数字の文字列を組み立てる作業用バッファ (毎フレーム文字列を作らない)
+_chars = bytearray(8)
+
+# 残り時間の大きな数字 (8x8フォントを 横3倍 x 縦4倍 = 24x32 に拡大)
+BIG_SCALE_X = 3
+BIG_SCALE_Y = 4
+BIG_Y = 12  # ヘッダーの区切り線と操作説明の間
+
+
+def _background(name, key, build):
+    """
+    背景レイヤーを返す。キーが前回と違う時だけ build(fbuf, key) で作り直す
+    Args:
+        name (str): 画面名
+        key: 背景の内容を決める値 (ベル設定や項目名など)
+        build: 背景を描く関数
+    """
+    entry = _backgrounds.get(name)
+    if entry is None or entry[0] != key:
+        buf = bytearray(WIDTH * PAGES)
+        build(framebuf.FrameBuffer(buf, WIDTH, HEIGHT, framebuf.MONO_VLSB), key)
+        # キーがリストの場合に後から書き換えられても気付けるようコピーして持つ
+        if isinstance(key, list):
+            key = list(key)
+        entry = (key, buf)
+        _backgrounds[name] = entry
+    return entry[1]
+
+
+def _glyph(code, scale_x, scale_y):
+    """標準8x8フォントの1文字 (文字コード) を拡大したグリフを返す (初回だけ作ってキャッシュ)"""
+    key = code | (scale_x << 8) | (scale_y << 12)
+    glyph = _glyphs.get(key)
+    if glyph is None:
+        src_buf = bytearray(8)
+        src = framebuf.FrameBuffer(src_buf, 8, 8, framebuf.MONO_VLSB)
+        src.text(chr(code), 0, 0, 1)
+
+        w = 8 * scale_x
+        h = 8 * scale_y
+        glyph = framebuf.FrameBuffer(bytearray(w * ((h + 7) // 8)), w, h, framebuf.MONO_VLSB)
+        for y in range(8):
+            for x in range(8):
+                if src.pixel(x, y):
+                    glyph.fill_rect(x * scale_x, y * scale_y, scale_x, scale_y, 1)
+        _glyphs[key] = glyph
+    return glyph
+
+
+def _draw_big(chars, n, x, y, scale_x=BIG_SCALE_X, scale_y=BIG_SCALE_Y):
+    """拡大グリフを並べて chars (文字コードの列) の先頭 n 文字を描く"""
+    step = 8 * scale_x
+    for i in range(n):
+        display.blit(_glyph(chars[i], scale_x, scale_y), x, y)
+        x += step
+
+
+def _put_number(pos, value, width):
+    """
+    _chars[pos] から value を10進数で書く (width 桁に満たない分は0で埋める)
+    Return:
+        int: 書いた後の位置
+    """
+    n = width
+    limit = 10 ** width
+    while value >= limit:
+        n += 1
+        limit *= 10
+    end = pos + n
+    for i in range(end - 1, pos - 1, -1):
+        _chars[i] = 0x30 + value % 10
+        value //= 10
+    return end
+
+
+def _build_timer_background(fbuf, bell_settings):
+    # ベル設定の表示
+    if len(bell_settings) <= 3:
+        for i, entry in enumerate(bell_settings):
+            fbuf.text("{}){:2}".format(i + 1, bells.minutes(entry)), (0, 48, 95)[i], 0)
+    else:
+        # 4つ以上は分だけを並べる (1行16文字に収まる分だけ)
+        line = " ".join(str(bells.minutes(entry)) for entry in bell_settings)
+        fbuf.text(line[:WIDTH // 8], 0, 0)
+
+    # 区切り線を描画
+    fbuf.hline(0, 10, 128, 1)
+
+    # 操作説明
+    fbuf.text("click: run/stop", 2, 45)
+    fbuf.text("hold : menu",    2, 55)
+
+
+def _build_edit_background(fbuf, title):
+    fbuf.text(f"Edit: {title}", 0, 0)
+    fbuf.hline(0, 10, 128, 1)
+    fbuf.text("min", 100, 30)
+    fbuf.text("Rotate: Change", 0, 45)
+    fbuf.text("Click : OK",     0, 53)
+
+
+_inverted = False  # パネルの白黒反転
+
+
+def set_invert(on):
+    """白黒を反転する (コマンドを1つ送るだけで画面の内容は転送しない。変わる時だけ送る)"""
+    global _inverted
+    on = bool(on)
+    if on != _inverted:
+        with bus_lock:
+            display.invert(1 if on else 0)
+        _inverted = on
+
+
+def _draw_title(title):
+    # 画面からはみ出す分は描かれない (切り詰めた文字列は作らない)
+    display.fill_rect(0, 55, WIDTH, 8, 0)
+    display.text(title, 0, 55)
+
+
+def draw_timer_screen(current_min, current_sec, bell_settings, title=None):
     """
     画面を描画する関数
     
     Args:
         current_min (int): 現在の残り分数 (または経過分数)
         current_sec (int): 現在の残り秒数
-        bell_settings (list): [1回鳴らす時間, 2回鳴らす時間, 3回鳴らす時間]
+        bell_settings (list): ベル設定 (形式は bells.py を参照)
                               例: [10, 15, 20] -> 10分, 15分, 20分
+        title (str): セッション名 (アジェンダ使用時)。操作説明の最後の行の代わりに表示
     """
-    display.fill(0)  # 画面をクリア
-    
-    # ベル設定の表示
-    display.text("1){:2}".format(bell_settings[0]), 0, 0)
-    display.text("2){:2}".format(bell_settings[1]), 48, 0)
-    display.text("3){:2}".format(bell_settings[2]), 95, 0)
+    # 静的な部分 (ベル設定・区切り線・操作説明) はキャッシュした背景を1回コピーするだけ
+    display.buffer[:] = _background("timer", bell_settings, _build_timer_background)
 
-    # 区切り線を描画
-    display.hline(0, 10, 128, 1)
+    # 現在のタイマー時間を大きな数字で表示 (会場の後ろからでも読める大きさ)
+    # "MM:SS" は作業用バッファに組み立てる (毎秒の文字列の生成をしない)
+    n = _put_number(0, current_min, 2)
+    _chars[n] = 0x3A  # ":"
+    n = _put_number(n + 1, current_sec, 2)
+    if n <= 5:
+        _draw_big(_chars, n, (WIDTH - 5 * 8 * BIG_SCALE_X) // 2, BIG_Y)
+    else:
+        # 100分以上は6文字になるので横幅を詰める
+        _draw_big(_chars, n, (WIDTH - 6 * 16) // 2, BIG_Y, 2, BIG_SCALE_Y)
 
-    # 現在のタイマー時間 
-    time_str = "{:02}:{:02}".format(current_min, current_sec)
-    
-    # SSD1306の標準フォントは小さい(8x8)ため、視認性を上げるために
-    # 文字列を中央(x=44付近)かつ、少し太く見えるよう2重描画する
-    display.text(time_str, 44, 25)
-    display.text(time_str, 45, 25) # 横に1ピクセルずらして太字風にする
+    if title is not None:
+        _draw_title(title)
 
-    # 操作説明
-    display.text("click: run/stop", 2, 45)
-    display.text("hold : menu",    2, 55)
+    # 描画を反映 (変化した部分のみ転送)
+    set_invert(False)
+    flush()
+
+def draw_countdown_screen(seconds, tenths, bell_settings, title=None, inverted=False):
+    """
+    最後の数十秒の画面 (残り時間を 1/10 秒まで表示する)
+    1/10 秒ごとに描かれるので、変わるのはほぼ小数点以下の1桁だけ (転送も数十バイト)
+    Args:
+        seconds (int): 残りの秒 (整数部)
+        tenths (int): 残りの 1/10 秒の桁 (0-9)
+        bell_settings (list): ベル設定 (背景の表示用)
+        title (str): セッション名 (アジェンダ使用時)
+        inverted (bool): 白黒を反転して表示する
+    """
+    display.buffer[:] = _background("timer", bell_settings, _build_timer_background)
+
+    # "SS.t" を作業用バッファに組み立てる
+    n = _put_number(0, seconds, 1)
+    _chars[n] = 0x2E  # "."
+    _chars[n + 1] = 0x30 + tenths
+    n += 2
+    if n <= 5:
+        _draw_big(_chars, n, (WIDTH - n * 8 * BIG_SCALE_X) // 2, BIG_Y)
+    else:
+        _draw_big(_chars, n, (WIDTH - n * 16) // 2, BIG_Y, 2, BIG_SCALE_Y)
+
+    if title is not None:
+        _draw_title(title)
+
+    set_invert(inverted)
+    flush()
+
+# --- メニュー ---
+MENU_Y = 12          # 最初の行の y
+MENU_LINE = 10       # 行の間隔
+_MENU_BAR_X = 125    # スクロールバー (項目が画面に収まらない時だけ)
+_MENU_BAR_W = 3
 
-    # 描画を反映
-    display.show()
+# 前回描いたメニューの状態 (描画側だけが触る)
+_menu_shown = None   # 描いた menu.Menu
+_menu_top = 0
+_menu_cursor = 0
+_menu_count = 0
+_menu_flush = -1     # 描き終えた時の flush_count (ほかの画面が描かれたら全体を描き直す)
+_menu_texts = []     # 行ごとに描いた文字列
+_menu_version = -1   # 文字列を作った時の menu.version
+# 作った項目の文字列 (項目の番号 % 行数 の位置に、番号と一緒に置く。同じ行にいる間は使い回す)
+_menu_cache_index = []
+_menu_cache = []
 
-def draw_menu_screen(cursor_index, items):
+
+def draw_menu_screen(menu):
     """
-    設定メニュー画面を描画する
+    メニュー画面を描画する
+    前回描いた状態と比べて、変わった行だけを描き直す (項目の数に関係なく、見えている行だけ)
+    窓がスクロールした時や、間にほかの画面を描いた時は見えている行をすべて描く
     Args:
-        cursor_index (int): 現在選択中のインデックス
-        items (list): 表示する文字列のリスト
+        menu (menu.Menu): 描くメニュー (カーソルと窓の位置。見えている行の文字列はここで作って覚える)
     """
-    display.fill(0)
-    display.text("-- SETTING --", 20, 0)
-    
-    start_y = 12
-    line_height = 10
-    
-    for i, item in enumerate(items):
-        y = start_y + (i * line_height)
-        prefix = ">" if i == cursor_index else " "
-        display.text(f"{prefix} {item}", 0, y)
-        
-    display.show()
+    global _menu_shown, _menu_top, _menu_cursor, _menu_count, _menu_flush, _menu_texts
+    global _menu_version, _menu_cache_index, _menu_cache
+    # version を先に読む (この後に reset() されたら、次の描画で作り直す)
+    version = menu.version
+    top = menu.top
+    cursor = menu.cursor
+    count = menu.count
+    rows = menu.rows
+    full = (menu is not _menu_shown or top != _menu_top or count != _menu_count
+            or flush_count != _menu_flush or len(_menu_texts) != rows)
+    if menu is not _menu_shown or version != _menu_version or len(_menu_cache) != rows:
+        # 項目が変わった: 覚えた文字列を捨てる
+        if len(_menu_cache) != rows:
+            _menu_cache_index = [-1] * rows
+            _menu_cache = [None] * rows
+        else:
+            for i in range(rows):
+                _menu_cache_index[i] = -1
+                _menu_cache[i] = None
+        _menu_version = version
+    if full:
+        display.fill(0)
+        set_invert(False)
+        display.text(menu.title, (WIDTH - len(menu.title) * 8) // 2, 0)
+        if count > rows:
+            height = rows * MENU_LINE
+            bar = max(4, height * rows // count)
+            y = MENU_Y + (height - bar) * top // (count - rows)
+            display.vline(_MENU_BAR_X + 1, MENU_Y, height, 1)
+            display.fill_rect(_MENU_BAR_X, y, _MENU_BAR_W, bar, 1)
+        if len(_menu_texts) != rows:
+            _menu_texts = [None] * rows
+        _menu_shown = menu
+        _menu_top = top
+        _menu_count = count
+
+    for row in range(rows):
+        index = top + row
+        text = None
+        if index < count:
+            slot = index % rows
+            if _menu_cache_index[slot] != index:
+                _menu_cache[slot] = menu.label(index)
+                _menu_cache_index[slot] = index
+            text = _menu_cache[slot]
+        was_selected = not full and top + row == _menu_cursor
+        if not full and text is _menu_texts[row] and (index == cursor) == was_selected:
+            continue  # この行は変わっていない
+        y = MENU_Y + row * MENU_LINE
+        if not full:
+            display.fill_rect(0, y, _MENU_BAR_X - 1, MENU_LINE, 0)
+        if text is not None:
+            # "> 項目" の文字列を作らずに、カーソルと項目を別々に描く
+            if index == cursor:
+                display.text(">", 0, y)
+            display.text(text, 16, y)
+        _menu_texts[row] = text
+    _menu_cursor = cursor
+
+    flush()
+    _menu_flush = flush_count
 
 def draw_edit_screen(title, value):
     """
@@ -70,16 +464,21 @@ def draw_edit_screen(title, value):
         title (str): 項目名 (例: "1st Bell")
         value (int): 現在の設定値 (分)
     """
-    display.fill(0)
-    display.text(f"Edit: {title}", 0, 0)
-    display.hline(0, 10, 128, 1)
-    
-    # 値を中央に大きく表示
-    val_str = f"{value} min"
-    display.text(val_str, 40, 30)
-    display.text(val_str, 41, 30) # 太字風
+    set_invert(False)
+    display.buffer[:] = _background("edit", title, _build_edit_background)
     
-    display.text("Rotate: Change", 0, 45)
-    display.text("Click : OK",     0, 53)
+    # 値を右寄せで大きく表示 (最大3桁)
+    n = _put_number(0, value, 1)
+    _draw_big(_chars, n, 96 - n * 8 * BIG_SCALE_X, BIG_Y)
     
-    display.show()
+    flush()
+
+def draw_splash():
+    """
+    起動直後の画面 (スプラッシュ)
+    フォントの拡大グリフなどを作らずに、標準フォントだけで描く
+    """
+    display.fill(0)
+    display.text("PRESENTATION", 16, 20)
+    display.text("TIMER", 44, 32)
+    flush()
@@ -1,83 +1,126 @@
 import time
 import hardware
 import display
+import perf
+import log
+import runtime
+from runtime import asyncio
 
 
 class EditMode:
-    def __init__(self, hardware_interface):
+    # 加速カーブ: (回転速度 [クリック/秒] の下限, 1クリックあたりの変化量 [分])
+    # 速く回すほど大きな刻みになり、1〜180分を1秒ほどの回転で行き来できる
+    ACCEL_CURVE = (
+        (0, 1),
+        (5, 5),
+        (12, 10),
+    )
+    MIN_VALUE = 1
+    MAX_VALUE = 180
+
+    def __init__(self, hardware_interface, rt):
         self.hw = hardware_interface
+        self.rt = rt
+
+    def _step_for_velocity(self, velocity):
+        """回転速度に応じた1クリックあたりの変化量を加速カーブから求める"""
+        step = 1
+        for threshold, step_size in self.ACCEL_CURVE:
+            if velocity >= threshold:
+                step = step_size
+        return step
+
+    def _apply_rotation(self, value, delta, step):
+        """回転量を値に反映する。刻みが2以上の場合は刻みの倍数に揃える"""
+        if step == 1:
+            value += delta
+        elif delta > 0:
+            value = (value // step + delta) * step
+        else:
+            value = ((value + step - 1) // step + delta) * step
 
-    def run(self, title, current_value):
+        # 範囲制限 (例: 1分〜180分)
+        if value < self.MIN_VALUE: value = self.MIN_VALUE
+        if value > self.MAX_VALUE: value = self.MAX_VALUE
+        return value
+
+    async def run(self, title, current_value):
         """
-        値編集ループ
+        値編集ループ (コルーチン)
         Args:
             title (str): 画面に表示する項目名
             current_value (int): 現在の設定値
         Return:
             int: 変更後の設定値
         """
-        print(f"--- Edit Mode: {title} ---")
+        log.info("--- Edit Mode: {} ---", title)
         value = current_value
         
+        # 遷移前に溜まった入力は捨てる (遷移直後の誤操作防止)
+        self.rt.clear_input()
+
         # 画面初回描画
-        display.draw_edit_screen(title, value)
-        time.sleep(0.2)
+        self.rt.render(display.draw_edit_screen, title, value)
 
+        t0 = 0
         while True:
+            # 入力があるまで待つ
+            delta, event = await self.rt.wait_input()
+            if perf.ENABLED:
+                t0 = time.ticks_us()
+
             # 1. 回転入力 (値の増減)
-            delta = self.hw.get_rotation_delta()
             if delta != 0:
-                # 加速処理: ハードウェア側で回転カウントが溜まっている(=速く回した)場合、
-                # そのまま加算することで自然と大きな変化になります。
-                # さらに強調したい場合は以下のように倍率をかけます。
-                if abs(delta) > 2:
-                    change = delta * 2 # 速く回したら変化量を2倍に
-                else:
-                    change = delta
-                
-                value += change
-                
-                # 範囲制限 (例: 1分〜180分)
-                if value < 1: value = 1
-                if value > 180: value = 180
-                
-                display.draw_edit_screen(title, value)
-                print(f"Value: {value}")
+                # 加速処理: 割り込みで記録したクリック時刻から回転速度を求め、
+                # 速く回しているほど1クリックの変化量を大きくする
+                # (ループの周期に左右されない)
+                step = self._step_for_velocity(self.hw.get_rotation_velocity())
+                new_value = self._apply_rotation(value, delta, step)
+
+                # 上限/下限に張り付いている間は再描画しない
+                if new_value != value:
+                    value = new_value
+                    self.rt.render(display.draw_edit_screen, title, value)
+                    log.debug("Value: {}", value)
 
             # 2. ボタン入力 (決定・保存)
-            event = self.hw.get_button_event()
             if event == "SHORT_PRESS":
-                print(f"Saved: {value}")
+                log.info("Saved: {}", value)
                 return value
 
-            time.sleep(0.05)
+            if perf.ENABLED:
+                perf.record("edit.loop", t0)
 
 if __name__ == "__main__":
     print("=== Edit Mode Test Start ===")
     print("エンコーダを回して数値変更、ボタンで決定してください。")
     print("Ctrl+C で終了します。")
 
-    try:
-        hw = hardware.HardwareInterface()
-    except Exception as e:
-        print(f"ハードウェア初期化エラー: {e}")
+    async def _test():
+        try:
+            hw = hardware.HardwareInterface()
+        except Exception as e:
+            print(f"ハードウェア初期化エラー: {e}")
 
-    app = EditMode(hw)
+        rt = runtime.Runtime(hw)
+        rt.start()
+        app = EditMode(hw, rt)
 
-    # テスト用の初期値
-    test_value = 10 
-    test_title = "Test Item"
+        # テスト用の初期値
+        test_value = 10 
+        test_title = "Test Item"
 
-    try:
         while True:
             print(f"\n--- 編集モード起動 (現在の値: {test_value}) ---")
-            new_value = app.run(test_title, test_value)
+            new_value = await app.run(test_title, test_value)
             
             print(f"決定されました。")
             print(f"変更前: {test_value} -> 変更後: {new_value}")
             
             test_value = new_value
-            time.sleep(1.0)
+            await runtime.sleep_ms(1000)
 
+    try:
+        asyncio.run(_test())
     except KeyboardInterrupt:
         print("\nテストを終了します。")
\ No newline at end of file
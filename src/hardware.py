@@ -1,5 +1,120 @@
 import machine
+import micropython
 import time
+from array import array
+
+import quadrature
+import perf
+import log
+
+# 割り込みハンドラ内の例外を表示できるようにしておく
+micropython.alloc_emergency_exception_buf(100)
+
+
+class BellScheduler:
+    """
+    ソレノイドの打鍵パターンをキューに積み、ブロックせずに鳴らすクラス
+    - ring_bell() はキューに積むだけで即座に戻る
+    - 実際のピン操作は tick() の状態遷移で行う (タイマー割り込みから呼ぶ)
+    """
+
+    QUEUE_SIZE = 8  # 溜めておけるパターン数
+
+    def __init__(self, pin, on_ms, interval_ms, pattern_gap_ms):
+        self.pin = pin
+        self.on_ms = on_ms                    # 1打の通電時間
+        self.interval_ms = interval_ms        # 同じパターン内の打鍵間隔
+        self.pattern_gap_ms = pattern_gap_ms  # パターン同士の間隔 (1回と2回を聞き分けるため)
+
+        # 打鍵回数のリングバッファ (積むのはメイン側、取り出すのは tick 側だけ)
+        self._queue = bytearray(self.QUEUE_SIZE)
+        self._head = 0
+        self._tail = 0
+
+        self._strikes_left = 0   # 現在のパターンの残り打鍵数
+        self._pin_on = False
+        self._next_ms = 0        # 次にピンを切り替える時刻 (ticks_ms)
+        self._busy = False       # パターン実行中 (ギャップ待ちも含む)
+
+        self.strike_count = 0    # 起動からの総打鍵数
+        self.dropped = 0         # キューが一杯で捨てたパターン数
+
+    def enqueue(self, times):
+        """打鍵パターンを積む。キューが一杯なら False"""
+        if times <= 0:
+            return True
+        nxt = (self._tail + 1) % self.QUEUE_SIZE
+        if nxt == self._head:
+            self.dropped += 1
+            return False
+        self._queue[self._tail] = min(times, 255)
+        self._tail = nxt
+        return True
+
+    def queue_depth(self):
+        """鳴らし始めていない待ちパターンの数"""
+        return (self._tail - self._head) % self.QUEUE_SIZE
+
+    def is_ringing(self):
+        """パターンの実行中、または待ちパターンがあれば True"""
+        return self._busy or self._head != self._tail
+
+    def tick(self, now=None):
+        """
+        状態遷移を1ステップ進める
+        Return:
+            int: 次に tick() を呼ぶべきまでの時間 (ms)
+            None: 鳴らすものが無くなった (アイドル)
+        """
+        if now is None:
+            now = time.ticks_ms()
+
+        if self._busy:
+            wait = time.ticks_diff(self._next_ms, now)
+            if wait > 0:
+                return wait
+
+            if self._pin_on:
+                # --- 通電終了 ---
+                self.pin.value(0)
+                self._pin_on = False
+                self._strikes_left -= 1
+                if self._strikes_left > 0:
+                    self._next_ms = time.ticks_add(now, self.interval_ms)
+                    return self.interval_ms
+                # パターン終了。次のパターンとの間は少し空ける
+                self._next_ms = time.ticks_add(now, self.pattern_gap_ms)
+                return self.pattern_gap_ms
+
+            if self._strikes_left > 0:
+                # --- 通電開始 ---
+                self.pin.value(1)
+                self._pin_on = True
+                self.strike_count += 1
+                self._next_ms = time.ticks_add(now, self.on_ms)
+                return self.on_ms
+
+            # ギャップ待ちが終わった
+            self._busy = False
+
+        if self._head == self._tail:
+            return None
+
+        # --- 次のパターンを取り出して開始 ---
+        self._strikes_left = self._queue[self._head]
+        self._head = (self._head + 1) % self.QUEUE_SIZE
+        self._busy = True
+        self._next_ms = now
+        return self.tick(now)
+
+    def stop(self):
+        """鳴動を中止してソレノイドを切る"""
+        self.pin.value(0)
+        self._pin_on = False
+        self._strikes_left = 0
+        self._busy = False
+        self._head = self._tail
+
 
 class HardwareInterface:
     """
@@ -20,123 +135,320 @@ class HardwareInterface:
     # --- 設定値 ---
     SOLENOID_ON_MS = 60        # ソレノイド通電時間
     SOLENOID_INTERVAL_MS = 250 # 連打間隔
+    BELL_PATTERN_GAP_MS = 800  # 続けて鳴らすパターン同士の間隔
     
     LONG_PRESS_MS = 800     # 長押し閾値
     DEBOUNCE_MS = 50        # ボタンのチャタリング防止
+    DOUBLE_CLICK_MS = 350   # ダブルクリックとみなす2回目のクリックまでの時間
+    BUTTON_EDGE_QUEUE = 32  # 割り込みで溜めておけるボタンのエッジ数
     
     STEPS_PER_CLICK = 4     # ソレノイドの分解能(1クリックで内部カウンタがいくつ進むか)
+
+    # エンコーダのデコーダ実装 (quadrature.MODE_PYTHON / MODE_NATIVE / MODE_VIPER)
+    DECODER_MODE = quadrature.MODE_VIPER
+    VELOCITY_WINDOW_MS = 250  # 回転速度の推定に使う直近の時間幅
     
     def __init__(self):
         # 1. ソレノイド初期化
         self.solenoid = machine.Pin(self.SOLENOID_PIN_NUM, machine.Pin.OUT)
         self.solenoid.value(0) 
 
+        # ベルの打鍵はスケジューラに任せ、ワンショットタイマーで駆動する
+        # (ピンの切り替えがイベントループの遅れ (フラッシュへの書き込み、GC、I2C) で伸びないように)
+        self.bell = BellScheduler(self.solenoid, self.SOLENOID_ON_MS,
+                                  self.SOLENOID_INTERVAL_MS, self.BELL_PATTERN_GAP_MS)
+        try:
+            self._bell_timer = machine.Timer()
+        except (AttributeError, ValueError, OSError):
+            # タイマーが無い環境: 駆動は set_bell_driver() で外部に任せる
+            self._bell_timer = None
+        self._bell_timer_armed = False
+        self._bell_timer_cb = self._on_bell_timer  # 割り込み内でのメソッドオブジェクト生成を避ける
+        self._bell_driver = None  # 外部 (非同期ランタイム) が駆動する場合の通知先
+
         # 2. エンコーダ回転用ピン初期化 (PullUp推奨)
         self.enc_a = machine.Pin(self.ENC_A_PIN_NUM, machine.Pin.IN, machine.Pin.PULL_UP)
         self.enc_b = machine.Pin(self.ENC_B_PIN_NUM, machine.Pin.IN, machine.Pin.PULL_UP)
         
-        # 回転量保持用変数（端数もここに溜まり続ける）
-        self._rotation_counter = 0
+        # 遷移表によるデコーダ (回転量の端数もデコーダの状態配列に溜まり続ける)
+        self.decoder = quadrature.QuadratureDecoder(self.enc_a, self.enc_b,
+                                                    self.ENC_A_PIN_NUM, self.ENC_B_PIN_NUM,
+                                                    self.DECODER_MODE)
+        # 回転検知用の割り込みハンドラ (ユーザーが直接呼ぶものではありません)
+        self._rotary_handler = self.decoder.handler
         
-        # 割り込み設定 (A相の値が変わった瞬間に _rotary_handler を実行)
+        # 割り込み設定 (A相/B相の値が変わった瞬間に _rotary_handler を実行)
         self.enc_a.irq(trigger=machine.Pin.IRQ_RISING | machine.Pin.IRQ_FALLING, handler=self._rotary_handler)
         self.enc_b.irq(trigger=machine.Pin.IRQ_RISING | machine.Pin.IRQ_FALLING, handler=self._rotary_handler)
-        self.last_encoded = (self.enc_a.value() << 1) | self.enc_b.value()
 
         # 3. ボタン初期化 (ロータリーエンコーダはコモンアノードデバイスのためPULL_DOWNに設定)
         self.button = machine.Pin(self.BUTTON_PIN_NUM, machine.Pin.IN, machine.Pin.PULL_DOWN)
 
+        # ボタンのエッジ (時刻, レベル) を溜めるリングバッファ
+        # 割り込みハンドラ内でメモリを確保しないよう、ここで確保しておく
+        self._btn_edge_ms = array("i", [0] * self.BUTTON_EDGE_QUEUE)
+        self._btn_edge_level = bytearray(self.BUTTON_EDGE_QUEUE)
+        self._btn_head = 0  # 取り出し位置 (get_button_event 側だけが書き換える)
+        self._btn_tail = 0  # 書き込み位置 (割り込みハンドラ側だけが書き換える)
+        self.button_edges_dropped = 0  # バッファが一杯で捨てたエッジ数
+
         # ボタン状態管理用変数
         self.last_press_start = 0
-        self.is_pressing = False
+        self.is_pressing = (self.button.value() == 1)
         self.long_press_triggered = False
+        self._btn_accepted_ms = time.ticks_add(time.ticks_ms(), -self.DEBOUNCE_MS)  # 最後にレベル変化を採用した時刻
+        self._btn_raw_level = self.button.value() # 最後に受け取ったエッジのレベル
+        self._btn_raw_ms = self._btn_accepted_ms
+        self._pending_click_ms = None  # ダブルクリック判定待ちのクリック時刻
+        self._btn_events = []          # 判定済みで返していないイベント
 
-    def _rotary_handler(self, pin):
-        """
-        回転検知用の割り込みハンドラ
-        (ユーザーが直接呼ぶものではありません)
-        """
-        # 現在の状態を読み取る
-        MSB = self.enc_a.value() # MSB = most significant bit
-        LSB = self.enc_b.value() # LSB = least significant bit
-        
-        encoded = (MSB << 1) | LSB
-        sum_val = (self.last_encoded << 2) | encoded
-        
-        # 状態遷移テーブルのようなロジックで回転方向を判定
-        # (一般的なエンコーダの遷移パターン: 0b1101, 0b0100, 0b0010, 0b1011 が1方向)
-        if sum_val == 0b1101 or sum_val == 0b0100 or sum_val == 0b0010 or sum_val == 0b1011:
-            self._rotation_counter += 1
-        elif sum_val == 0b1110 or sum_val == 0b0111 or sum_val == 0b0001 or sum_val == 0b1000:
-            self._rotation_counter -= 1
-            
-        self.last_encoded = encoded
+        # ダブルクリック判定を行うか (有効にすると短押しは DOUBLE_CLICK_MS だけ遅れて届く)
+        self.double_click_enabled = False
+
+        self.button.irq(trigger=machine.Pin.IRQ_RISING | machine.Pin.IRQ_FALLING, handler=self._button_handler)
+
+        # 入力トレースの記録先 (input_trace.InputTrace。start_trace() の間だけ)
+        self._trace = None
+
+        # 計測用のカウンタ (perf.dump() で表示される)
+        perf.add_source("isr.encoder", self._encoder_counters)
+        perf.add_source("isr.button", self._button_counters)
+        perf.add_source("bell", self._bell_counters)
+
+    def _encoder_counters(self):
+        return {"calls": self.decoder.edges, "errors": self.decoder.errors}
+
+    def _button_counters(self):
+        return {"dropped": self.button_edges_dropped}
+
+    def _bell_counters(self):
+        return {"strikes": self.bell.strike_count, "dropped": self.bell.dropped}
 
     def get_rotation_delta(self):
         """
         前回のチェック以降の「クリック数」を取得する
         """
+        state = self.decoder.state
+
+        # 読んでから減算するまでの間に割り込みが入るとカウントを失うので、割り込みを止める
+        irq_state = machine.disable_irq()
         # 必要なステップ数（例:4）に達しているかチェック
-        # int()キャストを使うことで、0方向への切り捨てを行う（例: 3/4=0, -3/4=0）
-        clicks = int(self._rotation_counter / self.STEPS_PER_CLICK)
+        # 0方向への切り捨てを整数だけで行う（例: 3→0, -3→0, -5→-1）
+        # (/ は float を作るので、回転を調べるたびにメモリを確保してしまう)
+        count = state[quadrature.COUNT]
+        if count >= 0:
+            clicks = count // self.STEPS_PER_CLICK
+        else:
+            clicks = -((-count) // self.STEPS_PER_CLICK)
 
         if clicks != 0:
             # 確定したクリック分だけカウンタから減算する
             # 例: counterが5なら、1クリック返して、counterは1残る
-            self._rotation_counter -= (clicks * self.STEPS_PER_CLICK)
-            return clicks
-        
-        return 0
+            state[quadrature.COUNT] -= (clicks * self.STEPS_PER_CLICK)
+        machine.enable_irq(irq_state)
+
+        return clicks
+
+    def get_rotation_velocity(self):
+        """
+        割り込みで記録したクリック時刻から、現在の回転速度を推定する
+        Return:
+            int: クリック/秒 (止まっている、またはゆっくり回している場合は 0)
+        """
+        return self.decoder.click_rate(self.VELOCITY_WINDOW_MS * 1000)
+
+    def get_encoder_errors(self):
+        """エンコーダの不正遷移 (取りこぼし) の回数"""
+        return self.decoder.errors
+
+    def get_input_edges(self):
+        """
+        エンコーダとボタンのピンが変化した回数をまとめた値
+        前回と違えば何かしら触られている (1クリックや押下の完了を待たずに分かる)
+        """
+        return self.decoder.edges * self.BUTTON_EDGE_QUEUE + self._btn_tail
+
+    # --- 入力トレース ---
+    def _set_input_irqs(self, rotary, button):
+        edges = machine.Pin.IRQ_RISING | machine.Pin.IRQ_FALLING
+        self.enc_a.irq(trigger=edges, handler=rotary)
+        self.enc_b.irq(trigger=edges, handler=rotary)
+        self.button.irq(trigger=edges, handler=button)
+
+    def _pin_levels(self):
+        return (self.enc_a.value() << 2) | (self.enc_b.value() << 1) | self.button.value()
+
+    def _rotary_traced(self, pin):
+        self._trace.edge(self._pin_levels())
+        self._rotary_handler(pin)
+
+    def _button_traced(self, pin):
+        self._trace.edge(self._pin_levels())
+        self._button_handler(pin)
+
+    def start_trace(self, trace):
+        """
+        エンコーダとボタンのエッジを trace (input_trace.InputTrace) に記録し始める
+        記録している間だけ、記録付きの割り込みハンドラに差し替える
+        """
+        trace.start(self._pin_levels())
+        self._trace = trace
+        self._set_input_irqs(self._rotary_traced, self._button_traced)
+
+    def stop_trace(self):
+        """記録をやめて元の割り込みハンドラに戻す"""
+        self._set_input_irqs(self._rotary_handler, self._button_handler)
+        trace = self._trace
+        self._trace = None
+        return trace
+
+    def _on_bell_timer(self, timer):
+        """ベル用タイマーの割り込みハンドラ。次の切り替え時刻でタイマーを掛け直す"""
+        delay = self.bell.tick()
+        if delay is None:
+            self._bell_timer_armed = False
+        else:
+            self._bell_timer.init(mode=machine.Timer.ONE_SHOT, period=max(delay, 1),
+                                  callback=self._bell_timer_cb)
+
+    @property
+    def has_bell_timer(self):
+        """ベルをタイマー割り込みで駆動できる (False なら set_bell_driver() で駆動側を渡す)"""
+        return self._bell_timer is not None
+
+    def set_bell_driver(self, notify):
+        """
+        ベルの駆動をタイマー割り込みではなく外部に任せる (タイマーが無い環境だけで使う)
+        Args:
+            notify: パターンが積まれた時に呼ばれる関数 (駆動側は bell.tick() を回す)
+        """
+        self._bell_driver = notify
 
     def ring_bell(self, times):
-        """指定回数ベルを鳴らす"""
-        print(f"[Hardware] ベルを{times}回鳴らします")
-        for i in range(times):
-            self.solenoid.value(1)
-            time.sleep_ms(self.SOLENOID_ON_MS)
-            self.solenoid.value(0)
-            if i < times - 1:
-                time.sleep_ms(self.SOLENOID_INTERVAL_MS)
+        """
+        指定回数ベルを鳴らす (ブロックしない)
+        打鍵はキューに積まれ、タイマー割り込み (または外部の駆動側) で順番に鳴らされる
+        """
+        if perf.ENABLED:
+            t0 = time.ticks_us()
+        log.debug("[Hardware] ベルを{}回鳴らします", times)
+        self.bell.enqueue(times)
+        if self._bell_driver is not None:
+            self._bell_driver()
+        elif not self._bell_timer_armed:
+            self._bell_timer_armed = True
+            self._bell_timer.init(mode=machine.Timer.ONE_SHOT, period=1,
+                                  callback=self._bell_timer_cb)
+        if perf.ENABLED:
+            perf.record("bell.ring", t0)
+
+    def bell_queue_depth(self):
+        """鳴らし始めていないベルのパターン数"""
+        return self.bell.queue_depth()
+
+    def is_ringing(self):
+        """ベルが鳴動中 (または鳴動待ち) なら True"""
+        return self.bell.is_ringing()
+
+    def _button_handler(self, pin):
+        """
+        ボタンのエッジ検知用の割り込みハンドラ
+        時刻とレベルをリングバッファに積むだけ (判定は get_button_event で行う)
+        """
+        now = time.ticks_ms()
+        tail = self._btn_tail
+        nxt = (tail + 1) % self.BUTTON_EDGE_QUEUE
+        if nxt == self._btn_head:
+            self.button_edges_dropped += 1
+            return
+        self._btn_edge_ms[tail] = now
+        self._btn_edge_level[tail] = pin.value()
+        self._btn_tail = nxt
+
+    def _accept_button_level(self, level, edge_ms):
+        """チャタリング除去後のレベル変化を押下/解放として処理する"""
+        self._btn_accepted_ms = edge_ms
+        # ロータリーエンコーダのスイッチは押すとHIGH(1)になる
+        if level == 1:
+            # --- 押し始め ---
+            self.is_pressing = True
+            self.long_press_triggered = False
+            self.last_press_start = edge_ms
+            return
+
+        # --- 離した瞬間 ---
+        self.is_pressing = False
+        duration = time.ticks_diff(edge_ms, self.last_press_start)
+        if self.long_press_triggered:
+            return
+        if duration > self.LONG_PRESS_MS:
+            # ループが止まっている間に押して離された長押し
+            self._btn_events.append("LONG_PRESS")
+        elif duration > self.DEBOUNCE_MS:
+            self._on_click(edge_ms)
+
+    def _on_click(self, edge_ms):
+        """短押し1回分の処理。ダブルクリック判定が有効なら2回目を待つ"""
+        if not self.double_click_enabled:
+            self._btn_events.append("SHORT_PRESS")
+        elif (self._pending_click_ms is not None
+              and time.ticks_diff(edge_ms, self._pending_click_ms) <= self.DOUBLE_CLICK_MS):
+            self._pending_click_ms = None
+            self._btn_events.append("DOUBLE_CLICK")
+        else:
+            self._pending_click_ms = edge_ms
 
     def get_button_event(self):
         """
-        ボタンイベントの検出 (Active Low対応版)
-        Return: "SHORT_PRESS", "LONG_PRESS", None
+        ボタンイベントの検出
+        割り込みで記録されたエッジの時刻から押下時間を判定するため、
+        呼び出し間隔が空いても押下を取りこぼさない
+        Return: "SHORT_PRESS", "LONG_PRESS", "DOUBLE_CLICK", None
         """
+        # 1. 溜まったエッジを時刻順に処理 (チャタリングはエッジの時刻で除去)
+        while self._btn_head != self._btn_tail:
+            head = self._btn_head
+            edge_ms = self._btn_edge_ms[head]
+            level = self._btn_edge_level[head]
+            self._btn_head = (head + 1) % self.BUTTON_EDGE_QUEUE
+
+            self._btn_raw_level = level
+            self._btn_raw_ms = edge_ms
+            if (level == 1) == self.is_pressing:
+                continue
+            if time.ticks_diff(edge_ms, self._btn_accepted_ms) < self.DEBOUNCE_MS:
+                continue  # 直前の変化から間もないのでチャタリングとみなす
+            self._accept_button_level(level, edge_ms)
+
         current_time = time.ticks_ms()
-        
-        # ロータリーエンコーダのスイッチは押すとLOW(0)になるため論理を反転
-        is_pressed = (self.button.value() == 1)
-        
-        event = None
-
-        if is_pressed:
-            if not self.is_pressing:
-                # --- 押し始め ---
-                self.is_pressing = True
-                self.long_press_triggered = False
-                self.last_press_start = current_time
-            else:
-                # --- 押している最中 ---
-                duration = time.ticks_diff(current_time, self.last_press_start)
-                if duration > self.LONG_PRESS_MS and not self.long_press_triggered:
-                    self.long_press_triggered = True
-                    event = "LONG_PRESS"
-        
-        else: # ボタンが離されている状態
-            if self.is_pressing:
-                # --- 離した瞬間 ---
-                self.is_pressing = False
-                duration = time.ticks_diff(current_time, self.last_press_start)
-                
-                if not self.long_press_triggered and duration > self.DEBOUNCE_MS:
-                    event = "SHORT_PRESS"
 
-        return event
+        # 2. チャタリングとして無視したエッジの後でレベルが落ち着いていれば採用する
+        if ((self._btn_raw_level == 1) != self.is_pressing
+                and time.ticks_diff(current_time, self._btn_accepted_ms) >= self.DEBOUNCE_MS):
+            self._accept_button_level(self._btn_raw_level, self._btn_raw_ms)
+
+        # 3. 押している最中の長押し判定
+        if self.is_pressing and not self.long_press_triggered:
+            duration = time.ticks_diff(current_time, self.last_press_start)
+            if duration > self.LONG_PRESS_MS:
+                self.long_press_triggered = True
+                self._pending_click_ms = None
+                self._btn_events.append("LONG_PRESS")
+
+        # 4. ダブルクリック待ちの期限切れは短押しとして確定
+        if (self._pending_click_ms is not None
+                and time.ticks_diff(current_time, self._pending_click_ms) > self.DOUBLE_CLICK_MS):
+            self._pending_click_ms = None
+            self._btn_events.append("SHORT_PRESS")
+
+        if self._btn_events:
+            return self._btn_events.pop(0)
+        return None
 
 # --- 動作確認テスト ---
 if __name__ == "__main__":
     hw = HardwareInterface()
+    hw.double_click_enabled = True
     print("ハードウェアテスト開始: エンコーダを回すか押してください...")
     
     try:
@@ -157,6 +469,8 @@ if __name__ == "__main__":
                     hw.ring_bell(1)
                 elif evt == "LONG_PRESS":
                     hw.ring_bell(2)
+                elif evt == "DOUBLE_CLICK":
+                    hw.ring_bell(3)
             
             time.sleep(0.01) # CPU負荷軽減
             
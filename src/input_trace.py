@@ -0,0 +1,313 @@
+"""
+入力トレース (エンコーダとボタンのピンのエッジ) の記録と再生
+ノブの反応が遅い・クリックを取りこぼすといった不具合は、ループのタイミングに対して
+どう回したかで起きたり起きなかったりする。実際の操作をエッジ単位で記録しておき、
+同じタイミングで割り込みハンドラとボタンの判定に流し直すと、何度でも同じ操作を再現できる。
+
+- 記録: HardwareInterface.start_trace(trace) で割り込みハンドラを記録付きのものに差し替える
+        (記録していない間のハンドラは今までどおりで、余計な処理は無い)
+- 再生: TraceReplayer.run() を await する (実機でも host/replay_trace.py のシミュレータでも同じ)。
+        入力から画面の転送までの遅延と、取りこぼした/余計なクリックの数を返す
+
+1エッジは32bitの値1つ: 前のエッジからの時間 (us) << 3 | A相 << 2 | B相 << 1 | ボタン
+(割り込みハンドラ内でメモリを確保しないよう、値は MicroPython の small int に収まる範囲にする。
+ 前のエッジから MAX_DELTA_US (約134秒) 以上空いた場合はそこで切り詰める)
+
+ファイルの形式 (リトルエンディアン):
+  magic(4) version(1) initial(1, 記録開始時のピンのレベル) reserved(2) count(4) edges(count x 4)
+"""
+
+import struct
+import time
+from array import array
+
+import display
+import log
+import quadrature
+from runtime import sleep_ms
+
+TRACE_FILE = "input.trc"
+TRACE_EDGES = 2048  # 記録できるエッジ数 (8KB)
+
+MAGIC = b"ITRC"
+VERSION = 1
+_HEADER = "<4sBBHI"
+_HEADER_SIZE = struct.calcsize(_HEADER)
+
+# エッジの値のビット
+LEVEL_A = 4
+LEVEL_B = 2
+LEVEL_BUTTON = 1
+LEVEL_BITS = 3
+MAX_DELTA_US = (1 << 27) - 1
+
+
+class InputTrace:
+    """
+    記録したエッジの列
+    使い方:
+        trace = InputTrace()
+        hw.start_trace(trace)   # ... 操作する ...
+        hw.stop_trace()
+        trace.save()
+    """
+
+    def __init__(self, size=TRACE_EDGES):
+        self.edges = array("I", [0] * size)
+        self.size = size
+        self.count = 0
+        self.dropped = 0   # 一杯で記録できなかったエッジ数
+        self.initial = 0   # 記録開始時のピンのレベル (エッジと同じビット)
+        self._last_us = 0
+
+    def start(self, levels):
+        self.initial = levels
+        self.count = 0
+        self.dropped = 0
+        self._last_us = time.ticks_us()
+
+    def edge(self, levels):
+        """エッジを1つ記録する (割り込みハンドラから呼ばれる。メモリを確保しない)"""
+        now = time.ticks_us()
+        if self.count >= self.size:
+            self.dropped += 1
+            return
+        delta = time.ticks_diff(now, self._last_us)
+        self._last_us = now
+        if delta > MAX_DELTA_US:
+            delta = MAX_DELTA_US
+        self.edges[self.count] = (delta << LEVEL_BITS) | levels
+        self.count += 1
+
+    def duration_us(self):
+        total = 0
+        for i in range(self.count):
+            total += self.edges[i] >> LEVEL_BITS
+        return total
+
+    # --- ファイル ---
+    def save(self, path=TRACE_FILE):
+        with open(path, "wb") as f:
+            f.write(struct.pack(_HEADER, MAGIC, VERSION, self.initial, 0, self.count))
+            f.write(memoryview(self.edges)[:self.count])
+        log.info("入力トレースを保存しました: {} {}エッジ", path, self.count)
+
+    @staticmethod
+    def load(path=TRACE_FILE):
+        """
+        Return:
+            InputTrace: 読み込んだトレース (形式が違えば ValueError)
+        """
+        with open(path, "rb") as f:
+            magic, version, initial, _, count = struct.unpack(_HEADER, f.read(_HEADER_SIZE))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError("not an input trace")
+            trace = InputTrace(max(count, 1))
+            if count and f.readinto(memoryview(trace.edges)[:count]) != count * 4:
+                raise ValueError("truncated trace")
+        trace.initial = initial
+        trace.count = count
+        return trace
+
+
+class _ReplayPin:
+    """再生中のピンのレベル (ハンドラの pin.value() に答える)"""
+
+    def __init__(self):
+        self.level = 0
+
+    def value(self):
+        return self.level
+
+
+def expected_inputs(trace, steps_per_click, debounce_ms):
+    """
+    トレースから本来の入力を数える (ループのタイミングに関係なく、すべてのエッジを見た場合)
+    Return:
+        (int, int, int): (右回りのクリック数, 左回りのクリック数, ボタンを押して離した回数)
+    """
+    state = quadrature.new_state((trace.initial & (LEVEL_A | LEVEL_B)) >> 1)
+    cw = ccw = presses = 0
+    pressing = bool(trace.initial & LEVEL_BUTTON)
+    accepted_us = -debounce_ms * 1000
+    raw = pressing
+    now = 0
+    for i in range(trace.count):
+        value = trace.edges[i]
+        now += value >> LEVEL_BITS
+        ab = (value & (LEVEL_A | LEVEL_B)) >> 1
+        if ab != state[quadrature.LAST]:
+            quadrature.step_python(state, ab, now)
+            clicks = int(state[quadrature.COUNT] / steps_per_click)
+            state[quadrature.COUNT] -= clicks * steps_per_click
+            if clicks > 0:
+                cw += clicks
+            else:
+                ccw -= clicks
+        raw = bool(value & LEVEL_BUTTON)
+        if raw != pressing and now - accepted_us >= debounce_ms * 1000:
+            pressing = raw
+            accepted_us = now
+            if not pressing:
+                presses += 1
+    if raw != pressing and not raw:
+        presses += 1  # 最後のエッジの後でレベルが落ち着いた
+    return cw, ccw, presses
+
+
+class TraceReplayer:
+    """
+    トレースを記録した時と同じ間隔でハンドラに流し直し、入力の結果を数える
+    再生中はエンコーダのデコーダがピンの代わりに再生中のレベルを読む
+    (実機の GPIO レジスタを直接読むハンドラは使わない。本物のノブには触らないこと)
+    使い方:
+        report = await TraceReplayer(hw, InputTrace.load()).run()
+    """
+
+    SETTLE_MS = 1500   # 最後のエッジの後、長押しやダブルクリックの判定と描画が済むまで待つ
+    LATENCY_SAMPLES = 256
+
+    def __init__(self, hw, trace):
+        self.hw = hw
+        self.trace = trace
+        self._pin_a = _ReplayPin()
+        self._pin_b = _ReplayPin()
+        self._button = _ReplayPin()
+
+        # 計測
+        self._latency_us = array("I", [0] * self.LATENCY_SAMPLES)
+        self._latency_count = 0
+        self._input_us = None   # まだ画面に出ていない最後の入力の時刻
+        self.late_us_max = 0    # 記録どおりの時刻からの注入の遅れ
+        self.cw = self.ccw = 0  # モードに渡ったクリック
+        self.presses = 0        # モードに渡ったボタンイベント (ダブルクリックは2回)
+        self.decoder_errors = 0
+
+    # --- 差し替えるフック ---
+    def _flush(self, force=False):
+        result = self._display_flush(force)
+        if self._input_us is not None:
+            i = self._latency_count % self.LATENCY_SAMPLES
+            self._latency_us[i] = time.ticks_diff(time.ticks_us(), self._input_us)
+            self._latency_count += 1
+            self._input_us = None
+        return result
+
+    def _get_rotation_delta(self):
+        delta = self._hw_rotation_delta()
+        if delta > 0:
+            self.cw += delta
+        elif delta < 0:
+            self.ccw -= delta
+        return delta
+
+    def _get_button_event(self):
+        event = self._hw_button_event()
+        if event == "DOUBLE_CLICK":
+            self.presses += 2
+        elif event is not None:
+            self.presses += 1
+        return event
+
+    def _install(self):
+        hw = self.hw
+        decoder = hw.decoder
+        self._saved_pins = (decoder.pin_a, decoder.pin_b)
+        decoder.pin_a = self._pin_a
+        decoder.pin_b = self._pin_b
+        self._rotary = decoder.pin_handler
+        self._hw_rotation_delta = hw.get_rotation_delta
+        self._hw_button_event = hw.get_button_event
+        hw.get_rotation_delta = self._get_rotation_delta
+        hw.get_button_event = self._get_button_event
+        self._display_flush = display.flush
+        display.flush = self._flush
+
+    def _uninstall(self):
+        hw = self.hw
+        hw.decoder.pin_a, hw.decoder.pin_b = self._saved_pins
+        del hw.get_rotation_delta
+        del hw.get_button_event
+        display.flush = self._display_flush
+
+    # --- 再生 ---
+    def _inject(self, value):
+        ab = value & (LEVEL_A | LEVEL_B)
+        if ab != ((self._pin_a.level << 2) | (self._pin_b.level << 1)):
+            self._pin_a.level = (value >> 2) & 1
+            self._pin_b.level = (value >> 1) & 1
+            self._rotary(self._pin_a)
+            if ab == LEVEL_A | LEVEL_B:
+                self._input_us = time.ticks_us()  # デテントに戻った = 1クリック完了
+        level = value & LEVEL_BUTTON
+        if level != self._button.level:
+            self._button.level = level
+            self.hw._button_handler(self._button)
+            if not level:
+                self._input_us = time.ticks_us()
+
+    async def run(self):
+        """
+        トレースを再生する
+        Return:
+            dict: 再生の結果 (report() と同じ)
+        """
+        trace = self.trace
+        initial = trace.initial
+        self._pin_a.level = (initial >> 2) & 1
+        self._pin_b.level = (initial >> 1) & 1
+        self._button.level = initial & LEVEL_BUTTON
+        self.hw.decoder.state[quadrature.LAST] = (initial & (LEVEL_A | LEVEL_B)) >> 1
+        errors = self.hw.get_encoder_errors()
+        log.info("入力トレースを再生します: {}エッジ", trace.count)
+
+        self._install()
+        try:
+            at = time.ticks_us()
+            for i in range(trace.count):
+                value = trace.edges[i]
+                at = time.ticks_add(at, value >> LEVEL_BITS)
+                wait = time.ticks_diff(at, time.ticks_us())
+                if wait >= 1000:
+                    await sleep_ms(wait // 1000)
+                    wait = time.ticks_diff(at, time.ticks_us())
+                if -wait > self.late_us_max:
+                    self.late_us_max = -wait
+                self._inject(value)
+            await sleep_ms(self.SETTLE_MS)
+        finally:
+            self._uninstall()
+        self.decoder_errors = self.hw.get_encoder_errors() - errors
+        result = self.report()
+        log.info("入力トレースの再生: {}", result)
+        return result
+
+    def report(self):
+        hw = self.hw
+        cw, ccw, presses = expected_inputs(self.trace, hw.STEPS_PER_CLICK, hw.DEBOUNCE_MS)
+        n = min(self._latency_count, self.LATENCY_SAMPLES)
+        samples = sorted(self._latency_us[i] for i in range(n))
+        # 取りこぼし/余計なクリックは最終的な位置のずれで数える
+        # (逆向きのクリックが入力監視の1周の間に続くと、差し引きされて渡る。これは merged に数える)
+        expected = cw - ccw
+        error = (self.cw - self.ccw) - expected
+        if expected < 0:
+            error = -error
+        lost = max(0, -error)
+        return {
+            "edges": self.trace.count,
+            "clicks_expected": cw + ccw,
+            "clicks_lost": lost,
+            "clicks_extra": max(0, error),
+            "clicks_merged": max(0, cw + ccw - self.cw - self.ccw - lost),
+            "presses_expected": presses,
+            "presses_lost": max(0, presses - self.presses),
+            "presses_extra": max(0, self.presses - presses),
+            "decoder_errors": self.decoder_errors,
+            "late_us_max": self.late_us_max,
+            "latency_ms": {
+                "avg": round(sum(samples) / n / 1000, 2) if n else 0.0,
+                "p95": round(samples[min(n - 1, n * 95 // 100)] / 1000, 2) if n else 0.0,
+                "max": round(samples[-1] / 1000, 2) if n else 0.0,
+            },
+        }
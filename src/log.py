@@ -0,0 +1,172 @@
+"""
+レベル付きのログ (print の代わり)
+ループの中から print() すると、USB シリアルがつながっていて PC 側が読んでいない時に
+書き込みで止まってしまう。また文字列の整形でメモリも確保する。
+このモジュールでは書式と引数をそのまま固定長のリングバッファに入れるだけにして、
+整形と出力は入力タスクの空き時間に drain() でまとめて行う (出力が詰まっている間は書かない)。
+
+- LEVEL 未満のログは呼び出し1回と比較1回だけで捨てる (整形もしない)
+- 引数は3つまで。書式は str.format の形 ("残り: {:02}:{:02}")
+- 整形は出力する時に行うので、リストなどを渡すと出力時点の中身になる
+- リングが一杯の時は古いものから上書きし、捨てた件数を出力する
+- 割り込みハンドラからは呼ばない (ロックを取るため)
+
+書き方:
+    import log
+    log.debug("Cursor: {}", index)
+    log.info("プリセット: {} {}", name, settings)
+
+REPL から:
+    log.LEVEL = log.DEBUG   # 詳しいログも出す
+    log.flush()             # 溜まっているログを今すぐ全部出す
+"""
+
+import sys
+import time
+import _thread
+
+DEBUG = 10
+INFO = 20
+WARN = 30
+ERROR = 40
+OFF = 100
+
+# これより低いレベルのログは記録しない (実行中に変えてよい)
+LEVEL = INFO
+
+SIZE = 32  # リングバッファの件数
+
+_NAMES = {DEBUG: "D", INFO: "I", WARN: "W", ERROR: "E"}
+
+# リングバッファ (件数分を最初に確保しておき、記録の時は参照を入れるだけ)
+_levels = bytearray(SIZE)
+_ticks = [0] * SIZE
+_fmts = [None] * SIZE
+_a = [None] * SIZE
+_b = [None] * SIZE
+_c = [None] * SIZE
+_head = 0   # 次に書く位置
+count = 0   # 溜まっている件数
+
+# 描画スレッド (2つ目のコア) からも書くので、リングの出し入れはロックで守る
+_lock = _thread.allocate_lock()
+
+# 計測用
+written = 0  # 出力した件数
+dropped = 0  # 出力前に上書きされた件数
+_dropped_reported = 0
+
+# 出力先に書き込めるか (書いても止まらないか) を調べる
+try:
+    import select
+    _poller = select.poll()
+    _poller.register(sys.stdout, select.POLLOUT)
+except Exception:
+    _poller = None  # 調べられない環境では常に書いてよいものとする
+
+
+def _put(level, fmt, a, b, c):
+    global _head, count, dropped
+    if level < LEVEL:
+        return
+    with _lock:
+        i = _head
+        _levels[i] = level
+        _ticks[i] = time.ticks_ms()
+        _fmts[i] = fmt
+        _a[i] = a
+        _b[i] = b
+        _c[i] = c
+        _head = (i + 1) % SIZE
+        if count == SIZE:
+            dropped += 1
+        else:
+            count += 1
+
+
+def debug(fmt, a=None, b=None, c=None):
+    _put(DEBUG, fmt, a, b, c)
+
+
+def info(fmt, a=None, b=None, c=None):
+    _put(INFO, fmt, a, b, c)
+
+
+def warn(fmt, a=None, b=None, c=None):
+    _put(WARN, fmt, a, b, c)
+
+
+def error(fmt, a=None, b=None, c=None):
+    _put(ERROR, fmt, a, b, c)
+
+
+def writable():
+    """出力先に書いても止まらないか (remote.py の返事の出力も使う)"""
+    if _poller is None:
+        return True
+    try:
+        return bool(_poller.poll(0))
+    except Exception:
+        return True
+
+
+def _pop():
+    """一番古いログを1件取り出す (取り出した後の参照は消す)"""
+    global count
+    with _lock:
+        if count == 0:
+            return None
+        i = (_head - count) % SIZE
+        entry = (_ticks[i], _levels[i], _fmts[i], _a[i], _b[i], _c[i])
+        _fmts[i] = _a[i] = _b[i] = _c[i] = None
+        count -= 1
+        return entry
+
+
+def _write(entry):
+    global written
+    ticks, level, fmt, a, b, c = entry
+    try:
+        text = fmt.format(a, b, c)
+    except Exception:
+        text = "{} {} {} {}".format(fmt, a, b, c)
+    print("{:>8} {} {}".format(ticks, _NAMES.get(level, "?"), text))
+    written += 1
+
+
+def _report_dropped():
+    global _dropped_reported
+    if dropped != _dropped_reported:
+        print("(ログを{}件捨てました)".format(dropped - _dropped_reported))
+        _dropped_reported = dropped
+
+
+def drain(max_lines):
+    """
+    溜まっているログを最大 max_lines 件出力する (出力先が詰まっていたら何もしない)
+    Return:
+        int: 出力した件数
+    """
+    n = 0
+    while n < max_lines and count and writable():
+        entry = _pop()
+        if entry is None:
+            break
+        _report_dropped()
+        _write(entry)
+        n += 1
+    return n
+
+
+def flush():
+    """溜まっているログを全部出力する (出力先が詰まっていても待つ。終了時や REPL 用)"""
+    while True:
+        entry = _pop()
+        if entry is None:
+            break
+        _report_dropped()
+        _write(entry)
+
+
+def stats():
+    return {"pending": count, "written": written, "dropped": dropped}
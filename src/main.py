@@ -1,107 +1,246 @@
+# 起動時間の記録と最初の画面に必要なものだけを先に import する
+# (残りのモジュールはスプラッシュを出した後に main() の中で import する)
+import startup
+import sys
 import time
-import json
-import machine
-
-# 自作モジュール
-import hardware
 import display
-from presentation_timer_mode import PresentationTimerMode, TimerStatus
-from setting_mode import SettingMode
-from edit_mode import EditMode
+import log
 
-# --- 設定ファイル管理 ---
-SETTINGS_FILE = "settings.json"
+# 描画と I2C 転送を2つ目のコアで行う (RP2040 のみ。PC のシミュレータでは1スレッドのまま)
+RENDER_ON_SECOND_CORE = sys.platform == "rp2"
 
-def load_settings():
-    """設定をJSONから読み込む。なければデフォルト値を返す"""
-    default_settings = [7, 10, 15] # 単位は「分」
-    try:
-        with open(SETTINGS_FILE, "r") as f:
-            data = json.load(f)
-            print("設定をロードしました:", data)
-            return data
-    except (OSError, ValueError):
-        print("設定ファイルが見つかりません。デフォルトを使用します。")
-        return default_settings
-
-def save_settings(settings):
-    """設定をJSONに保存する"""
-    try:
-        with open(SETTINGS_FILE, "w") as f:
-            json.dump(settings, f)
-            print("設定を保存しました:", settings)
-    except OSError as e:
-        print("保存エラー:", e)
+# USB シリアルからのリモート操作 (remote.py) を受け付ける
+REMOTE_CONTROL = True
+
+# ループの期限を監視し、守られている間だけウォッチドッグに餌をやる (watchdog.py)
+# ウォッチドッグでリセットされたら、計測中だったセッションを途中から再開する
+# 一度動かすと止められない: Ctrl-C で止めた後はタイマーで餌をやり続ける (watchdog.release())。
+# ソフトリセットするツール (mpremote、Thonny) で開発する間は False にして書き込む
+WATCHDOG = True
+
+# --- 設定の保存 ---
+# 編集の確定ごとには書かず、最後の変更から SAVE_DELAY_MS 経ったら (またはタイマー開始時に)
+# まとめて1回で書き込む
+SAVE_DELAY_MS = 5000
+
+async def autosave(store, session_log=None, hw=None, monitor=None, slot=0):
+    """
+    溜まった設定の変更を、操作が落ち着いてから書き込む
+    設定・セッションの記録・ストールの記録のどれも、計測中やベルを鳴らしている間は書かない
+    (計測中のリモート操作による変更は、終わってから書く。書き込みでソレノイドの通電が延びないように)
+    Args:
+        monitor: watchdog.DeadlineMonitor (slot はこのループのスロット)
+    """
+    import runtime
+    while True:
+        if monitor is not None:
+            monitor.expect(slot, SAVE_DELAY_MS // 5)
+        await runtime.sleep_ms(SAVE_DELAY_MS // 5)
+        if monitor is not None:
+            monitor.tick(slot)
+        if (session_log is not None and session_log.recording) or (hw is not None and hw.is_ringing()):
+            continue
+        if store.dirty and time.ticks_diff(time.ticks_ms(), store.last_put_ms) >= SAVE_DELAY_MS:
+            store.flush()
+        if session_log is not None and session_log.pending:
+            session_log.flush()
+        if monitor is not None and monitor.dirty:
+            monitor.save()
+
+def show_splash():
+    """ディスプレイだけを初期化してスプラッシュを出す (2回目以降は何もしない)"""
+    if startup.get("first_pixel") is not None:
+        return
+    display.init()
+    display.draw_splash()
+    startup.mark("first_pixel")
 
 # --- メインループ ---
-def main():
-    # 1. ハードウェア初期化
+async def main():
+    # 0. まず画面を出す (電源を入れてから画面が暗いままの時間を短くする)
+    show_splash()
+
+    # 1. 残りのモジュールの読み込み、ハードウェア初期化と常駐タスク (入力・描画・ベル) の起動
+    import hardware
+    import runtime
+    import bells
+    import perf
+    import settings_store
+    import telemetry
+    from agenda import Agenda
+    from runtime import asyncio
+    from presentation_timer_mode import TimerStatus
+
     hw = hardware.HardwareInterface()
+    rt = runtime.Runtime(hw, render_thread=RENDER_ON_SECOND_CORE)
+    rt.start()
+    startup.mark("hardware")
     
-    # 2. モードインスタンス生成
-    timer_mode = PresentationTimerMode(hw)
-    setting_mode = SettingMode(hw)
-    edit_mode = EditMode(hw)
+    # 2. モードインスタンスは初めて使う時に作る (使わないモードの import も後回し)
+    timer_mode = None
+    setting_mode = None
+    edit_mode = None
     
-    # 3. 設定ロード
-    bell_settings = load_settings()
+    # 3. 設定ロード (使用中のプリセット。バイナリのログの最新ブロックだけを読む)
+    # bell_settings はリモート操作からも書き換えるので、このリストは作り直さずに中身を入れ替える
+    store = settings_store.SettingsStore()
+    bell_settings = list(store.load())
+    # セッションの記録 (終わったセッションは autosave が書く)
+    session_log = telemetry.SessionLog()
+    perf.add_source("telemetry", session_log.stats)
+    # ループの期限の監視 (ウォッチドッグは起動が済んでから動かす)
+    monitor = None
+    save_slot = 0
+    if WATCHDOG:
+        import watchdog
+        monitor = watchdog.DeadlineMonitor()
+        rt.set_monitor(monitor)
+        save_slot = monitor.register("autosave")
+        perf.add_source("watchdog", monitor.stats)
+    asyncio.create_task(autosave(store, session_log, hw, monitor, save_slot))
+
+    # 4. アジェンダ (agenda.txt があれば、最初のセッションをスタート待ちで表示する)
+    agenda = Agenda()
+    start_paused = agenda.load()
+    startup.mark("settings")
     
     # 状態管理定数
     STATE_MENU = 0
     STATE_EDIT = 1
     STATE_TIMER = 2
     
-    current_state = STATE_MENU
-    selected_edit_index = 0 # どの時間を編集しているか (0-2)
+    current_state = STATE_TIMER if start_paused else STATE_MENU
+    selected_edit_index = 0 # どのベルの時間を編集しているか
+
+    # ウォッチドッグのリセットで止まったセッションがあれば、メニューに戻さずにそこから再開する
+    # (すべてのループを登録した後に読む。止まったループの名前を記録に残すため)
+    resume_ms = 0
+    session = monitor.restore() if monitor is not None else None
+    if session is not None:
+        resume_ms, start_paused, index = session
+        while agenda.current is not None and agenda.index < index:
+            agenda.advance()
+        log.info("セッションを再開します: {}ms 経過 (アジェンダ {})", resume_ms, agenda.index)
+        current_state = STATE_TIMER
+
+    # 5. リモート操作 (入力タスクが標準入力を poll する)
+    def status():
+        text = "mode={} preset={} bells={}".format(
+            ("menu", "edit", "timer")[current_state], store.active, bells.to_text(bell_settings))
+        if current_state == STATE_TIMER and timer_mode is not None:
+            text += " paused={} remaining={}".format(int(timer_mode.is_paused), timer_mode.remaining_sec)
+        return text
 
-    print("システム起動")
+    if REMOTE_CONTROL:
+        from remote import RemoteControl
+        try:
+            rt.remote = RemoteControl(rt, store, bell_settings, status, session_log)
+            perf.add_source("remote", rt.remote.stats)
+        except Exception as e:
+            # 標準入力を poll できない環境
+            log.warn("リモート操作を使えません: {}", e)
+
+    log.info("システム起動")
+    startup.mark("interactive")
+    startup.dump()
+    if monitor is not None:
+        monitor.start()
+    booting = True
 
     while True:
+        # モードの切り替わりはどの画面も止まっていてよい時なので、ここでゴミを集めておく
+        # (起動直後は最初の画面を優先する)
+        if not booting:
+            perf.collect()
+        booting = False
+
         if current_state == STATE_MENU:
             # --- Setting Mode ---
-            action = setting_mode.run()
+            if setting_mode is None:
+                from setting_mode import SettingMode
+                setting_mode = SettingMode(hw, rt)
+            action = await setting_mode.run(bell_settings, store.active)
             
-            if action == 3: # "START TIMER" が選ばれた
+            if action == SettingMode.REFRESH: # リモート操作で設定が変わった
+                continue
+            elif action == len(bell_settings): # "START TIMER" が選ばれた
                 current_state = STATE_TIMER
-            else:           # 設定項目(0, 1, 2)が選ばれた
+            elif action == len(bell_settings) + 1: # プリセットの切り替え
+                bell_settings[:] = store.select(store.next_preset())
+                log.info("プリセット: {} {}", store.active, bell_settings)
+            else:                            # ベルの設定項目が選ばれた
                 selected_edit_index = action
                 current_state = STATE_EDIT
 
         elif current_state == STATE_EDIT:
             # --- Edit Mode ---
             # 編集する項目のタイトルを決める
-            titles = ["1st Bell", "2nd Bell", "3rd Bell"]
-            current_title = titles[selected_edit_index]
-            current_val = bell_settings[selected_edit_index]
+            current_title = bells.title(selected_edit_index)
+            entry = bell_settings[selected_edit_index]
+            current_val = bells.minutes(entry)
             
             # 編集モード実行 -> 新しい値を受け取る
-            new_val = edit_mode.run(current_title, current_val)
+            if edit_mode is None:
+                from edit_mode import EditMode
+                edit_mode = EditMode(hw, rt)
+            new_val = await edit_mode.run(current_title, current_val)
             
-            # 値を更新して保存
-            bell_settings[selected_edit_index] = new_val
-            save_settings(bell_settings)
+            # 値を更新 (鳴らす回数の指定はそのまま)。書き込みは autosave がまとめて行う
+            # (編集中にリモート操作でベルが減っていたら捨てる)
+            if selected_edit_index < len(bell_settings):
+                bell_settings[selected_edit_index] = bells.with_minutes(entry, new_val)
+                store.put(store.active, bell_settings)
             
             # メニューに戻る
             current_state = STATE_MENU
 
         elif current_state == STATE_TIMER:
             # --- Presentation Timer Mode ---
-            # タイマー実行 (ブロック処理)
-            result = timer_mode.run(bell_settings)
-            
-            # タイマー終了後、または長押し中断後の処理
-            if result == TimerStatus.GO_TO_SETTINGS or result == TimerStatus.FINISHED:
-                current_state = STATE_MENU
-            
-            # エラー等の場合もとりあえずメニューへ
-            else:
-                current_state = STATE_MENU
+            # 未保存の変更はタイマー中に書き込まないよう、ここで書いておく
+            store.flush()
+            if timer_mode is None:
+                from presentation_timer_mode import PresentationTimerMode
+                timer_mode = PresentationTimerMode(hw, rt, session_log)
+            # タイマー実行 (終了または中断まで待つ)
+            # アジェンダがあればそのセッションの設定で、ダブルクリックで次へ進める
+            # (ダブルクリックの判定はその間だけ。ほかの画面では短押しを待たせない)
+            hw.double_click_enabled = agenda.current is not None
+            try:
+                if agenda.current is not None:
+                    title, session_settings = agenda.current
+                    result = await timer_mode.run(
+                        session_settings, "{} {}".format(agenda.index, title), start_paused, title,
+                        resume_ms, agenda.index)
+                else:
+                    result = await timer_mode.run(bell_settings, name=store.active,
+                                                  start_paused=start_paused, resume_ms=resume_ms)
+            finally:
+                hw.double_click_enabled = False
+            start_paused = False
+            resume_ms = 0
 
-        # CPU休憩 (モード遷移の間)
-        time.sleep(0.1)
+            if agenda.current is not None and (
+                    result == TimerStatus.NEXT_SESSION or result == TimerStatus.FINISHED):
+                # 次のセッションをスタート待ちで表示する (メニューを経由しない)
+                if agenda.advance():
+                    start_paused = True
+                    continue
+                log.info("アジェンダ終了")
+
+            # タイマー終了後、長押し中断後、エラー等の場合はメニューへ
+            current_state = STATE_MENU
 
 if __name__ == "__main__":
+    # asyncio の読み込みより先に画面を出す
+    show_splash()
+    from runtime import asyncio
     try:
-        main()
+        asyncio.run(main())
     except KeyboardInterrupt:
         print("\nプログラムを終了します。")
+        if WATCHDOG:
+            # REPL に戻っても約8秒でリセットされないように
+            import watchdog
+            watchdog.release()
+    finally:
+        log.flush()
@@ -0,0 +1,70 @@
+"""
+スクロールするメニュー (項目の数に関係なく、見えている行だけを扱う)
+画面に出せるのは ROWS 行だけなので、項目がいくつあっても次のようにする:
+- 項目の文字列は描画側 (display.draw_menu_screen) が label(i) で見えている行の分だけ作り、
+  行ごとに覚えておく (1行スクロールしても、新しく作るのは入ってきた1行分だけ)。
+  描画は2つ目のコアで動くことがあるので、覚えた文字列は描画側だけが持つ。
+  Menu は位置と項目の数、reset() の回数 (version) だけを持ち、描画側は version が変わったら覚えた文字列を捨てる
+- カーソルの移動と端での折り返しは位置を計算し直すだけ (項目の数によらず一定)
+- 描画 (display.draw_menu_screen) は前回描いた状態と比べて、変わった行だけを描き直す
+  (カーソルが窓の中で動いただけなら、前の行と新しい行の2行だけ)
+
+使い方:
+    menu = Menu("-- SETTING --", len(presets), lambda i: presets[i])
+    menu.move(delta)
+    rt.render(display.draw_menu_screen, menu)
+"""
+
+ROWS = 5  # 見出しの下に並べる行数 (12px から 10px 間隔で 64px のパネルに収まる分)
+
+
+class Menu:
+    def __init__(self, title, count, label, rows=ROWS):
+        """
+        Args:
+            title (str): 見出し
+            count (int): 項目の数
+            label: 項目の番号から表示する文字列を作る関数
+            rows (int): 一度に見せる行数
+        """
+        self.title = title
+        self.rows = rows
+        self.cursor = 0
+        self.top = 0  # 一番上に見えている項目の番号
+        self.count = 0
+        self._label = None
+        self.version = 0  # reset() のたびに増える (描画側が覚えた文字列を捨てる目安)
+        self.reset(count, label)
+
+    def reset(self, count, label=None):
+        """
+        項目が変わった時に呼ぶ (描画側に文字列を作り直させる。カーソルは範囲外なら先頭に戻す)
+        """
+        if label is not None:
+            self._label = label
+        self.count = count
+        if self.cursor >= count:
+            self.cursor = 0
+        self._scroll_to_cursor()
+        # 最後に増やす (描画側が先に version を読んでいれば、次の描画で作り直す)
+        self.version += 1
+
+    def move(self, delta):
+        """カーソルを delta だけ動かす (端では反対側へ折り返す)"""
+        if self.count:
+            self.cursor = (self.cursor + delta) % self.count
+            self._scroll_to_cursor()
+
+    def _scroll_to_cursor(self):
+        """カーソルが窓の外に出たら、カーソルが端の行に来るだけ窓を動かす"""
+        if self.cursor < self.top:
+            self.top = self.cursor
+        elif self.cursor >= self.top + self.rows:
+            self.top = self.cursor - self.rows + 1
+        # 項目が減って窓の下が空いた
+        if self.top > max(0, self.count - self.rows):
+            self.top = max(0, self.count - self.rows)
+
+    def label(self, index):
+        """項目の文字列を作る (覚えない。描画側とログが使う)"""
+        return self._label(index)
@@ -0,0 +1,203 @@
+"""
+計測 (プロファイリング)
+各モードのループ1周の処理時間、display の転送時間、ベルの要求、GC の停止時間などを
+区間ごとのヒストグラムに集計する。
+
+- 無効 (ENABLED = False) の間は、計測する側の `if perf.ENABLED:` 1回の判定だけで何もしない
+  (製品のファームウェアに入れたままでよい)
+- ヒストグラムは区間ごとに固定長の配列 (2のべき乗 us ごとのバケツ) で、件数が増えてもメモリは増えない
+- REPL から:
+    import perf
+    perf.enable()
+    ...
+    perf.dump()
+
+計測する側の書き方:
+    if perf.ENABLED:
+        t0 = time.ticks_us()
+    ...
+    if perf.ENABLED:
+        perf.record("display.flush", t0)
+
+区間の中でメモリを確保していないかの検査 (alloc_mark / alloc_check) もここに置く
+"""
+
+import gc
+import time
+from array import array
+
+import watchdog
+
+ENABLED = False
+
+# バケツ i には 2^(i+MIN_SHIFT-1) 以上 2^(i+MIN_SHIFT) us 未満が入る
+# (先頭はそれ未満すべて、末尾はそれ以上すべて)
+MIN_SHIFT = 6   # 64us 未満
+BUCKETS = 14    # 最後のバケツは 2^18 us (約262ms) 以上
+
+
+class Histogram:
+    def __init__(self, name):
+        self.name = name
+        self.counts = array("I", [0] * BUCKETS)
+        self.n = 0
+        self.total_us = 0
+        self.max_us = 0
+
+    def add(self, us):
+        if us < 0:
+            us = 0
+        v = us >> MIN_SHIFT
+        b = 0
+        while v and b < BUCKETS - 1:
+            v >>= 1
+            b += 1
+        self.counts[b] += 1
+        self.n += 1
+        self.total_us += us
+        if us > self.max_us:
+            self.max_us = us
+
+    def percentile(self, pct):
+        """pct % 点を含むバケツの上限 (us)"""
+        if self.n == 0:
+            return 0
+        target = (self.n * pct + 99) // 100
+        seen = 0
+        for b in range(BUCKETS):
+            seen += self.counts[b]
+            if seen >= target:
+                return min(1 << (b + MIN_SHIFT), self.max_us)
+        return self.max_us
+
+    def reset(self):
+        for b in range(BUCKETS):
+            self.counts[b] = 0
+        self.n = 0
+        self.total_us = 0
+        self.max_us = 0
+
+
+# 区間名 -> Histogram
+_histograms = {}
+# 名前 -> 呼ぶと dict を返す関数 (割り込みハンドラの呼び出し回数などのカウンタ)
+_sources = {}
+
+
+def enable(on=True):
+    global ENABLED
+    ENABLED = on
+
+
+def histogram(name):
+    """区間のヒストグラム (初回だけ作る)"""
+    h = _histograms.get(name)
+    if h is None:
+        h = Histogram(name)
+        _histograms[name] = h
+    return h
+
+
+def record(name, t0_us):
+    """t0_us (ticks_us) から今までの時間を区間 name に記録する"""
+    histogram(name).add(time.ticks_diff(time.ticks_us(), t0_us))
+
+
+def add_source(name, func):
+    """dump() の時に読むカウンタを登録する (func はカウンタの dict を返す)"""
+    _sources[name] = func
+
+
+def collect():
+    """gc.collect() を行い、計測が有効なら停止時間を記録する"""
+    watchdog.enter(watchdog.GC)
+    if ENABLED:
+        t0 = time.ticks_us()
+        gc.collect()
+        record("gc.collect", t0)
+    else:
+        gc.collect()
+    watchdog.leave()
+
+
+def reset():
+    for h in _histograms.values():
+        h.reset()
+    _allocs.clear()
+
+
+def report():
+    """
+    Return:
+        dict: 区間名 -> {n, avg_us, p50_us, p95_us, max_us} と、登録したカウンタ
+    """
+    result = {}
+    for name, h in _histograms.items():
+        result[name] = {
+            "n": h.n,
+            "avg_us": (h.total_us // h.n) if h.n else 0,
+            "p50_us": h.percentile(50),
+            "p95_us": h.percentile(95),
+            "max_us": h.max_us,
+        }
+    for name, counts in _allocs.items():
+        result[name + ".alloc"] = {"n": counts[0], "allocated": counts[1], "max_bytes": counts[2]}
+    for name, func in _sources.items():
+        result[name] = func()
+    return result
+
+
+def dump():
+    """計測結果を表にして表示する"""
+    print("{:<22} {:>7} {:>8} {:>8} {:>8} {:>8}".format("section", "n", "avg", "p50", "p95", "max"))
+    for name in sorted(_histograms):
+        h = _histograms[name]
+        if h.n == 0:
+            continue
+        print("{:<22} {:>7} {:>8} {:>8} {:>8} {:>8}".format(
+            name, h.n, h.total_us // h.n, h.percentile(50), h.percentile(95), h.max_us))
+    for name in sorted(_allocs):
+        counts = _allocs[name]
+        print("{}: alloc in {}/{} (max {} bytes)".format(name, counts[1], counts[0], counts[2]))
+    for name in sorted(_sources):
+        print(name, _sources[name]())
+    if hasattr(gc, "mem_free"):
+        print("gc: free={} alloc={}".format(gc.mem_free(), gc.mem_alloc()))
+
+
+# --- メモリ確保の検査 ---
+# 区間の中でヒープを確保していないかを gc.mem_alloc() の増分で調べる
+# (gc.mem_alloc() がある MicroPython でだけ測れる。CPython では区間を通った回数だけを数える)
+# 実機で確かめる手順は host/alloc_check.py を参照
+#     a0 = perf.alloc_mark()
+#     ...
+#     perf.alloc_check("timer.tick", a0)
+ALLOC_STRICT = False  # True なら確保があった時点で AssertionError にする (確保をなくす作業用)
+
+_mem_alloc = getattr(gc, "mem_alloc", None)
+# 区間名 -> array("I", [回数, 確保があった回数, 最大バイト数])
+_allocs = {}
+
+
+def alloc_mark():
+    """確保量を調べる区間の開始点 (alloc_check() に渡す)"""
+    return _mem_alloc() if _mem_alloc is not None else 0
+
+
+def alloc_check(name, a0):
+    """alloc_mark() の時点から確保されたバイト数を区間 name に記録する"""
+    counts = _allocs.get(name)
+    if counts is None:
+        counts = array("I", [0, 0, 0])
+        _allocs[name] = counts
+    counts[0] += 1
+    if _mem_alloc is None:
+        return
+    used = _mem_alloc() - a0
+    # 途中で GC が走ると負になる (その回は確保なしとして数える)
+    if used > 0:
+        counts[1] += 1
+        if used > counts[2]:
+            counts[2] = used
+        if ALLOC_STRICT:
+            raise AssertionError("{}: {} bytes allocated".format(name, used))
@@ -0,0 +1,141 @@
+"""
+アイドル時の省電力管理
+操作が無い時間が続くと、画面を暗くし (DIM)、次に画面を消す (OFF)。
+画面を消している間は、入力タスクの待ちを machine.lightsleep に切り替える
+(SLEEP_MAX_MS ごとに起きてピンの変化を見る)。
+パネルは電源を切っても表示内容を保持しているので、起こすとすぐ元の画面に戻る。
+
+RP2040 の lightsleep は両方のコアのクロックを止めるので、描画スレッドが2つ目のコアで
+動いている場合 (main.RENDER_ON_SECOND_CORE) は使わず、time.sleep_ms(SHARED_SLEEP_MS) で待つ
+(このコアだけが止まり、その間のピンの変化は割り込みで数えておいて起きてから読む)。
+エンコーダ/ボタンのピンは lightsleep の起床要因として設定していない (ピンの割り込みで途中で
+起きるかは実機で確かめていない) ので、lightsleep を使う場合も遅くとも SLEEP_MAX_MS で起きて入力を読む。
+測ったのはシミュレータ (host/power_check.py) での振る舞いだけで、実機の消費電流と
+lightsleep からの起床は測っていない。
+"""
+
+import time
+import machine
+import display
+
+ACTIVE = 0  # 通常
+DIM = 1     # 画面を暗くしている
+OFF = 2     # 画面を消している (lightsleep で待つ)
+
+
+class PowerManager:
+    DIM_AFTER_MS = 60000      # 操作が無くなってから暗くするまで
+    OFF_AFTER_MS = 300000     # 操作が無くなってから画面を消すまで
+    FULL_CONTRAST = 0xFF
+    DIM_CONTRAST = 0x08
+    SLEEP_MAX_MS = 500        # 1回の lightsleep の長さ
+    SHARED_SLEEP_MS = 100     # lightsleep を使わない場合に1回に待つ時間 (画面が点くまでの遅れの上限)
+    WAKE_IGNORE_MS = 250      # 画面を点けた操作 (回しきる/離す) をモードに渡さない時間
+
+    # 直近に作られたインスタンス (計測用)
+    last = None
+
+    def __init__(self, lightsleep=True):
+        """
+        Args:
+            lightsleep (bool): False なら machine.lightsleep を使わずに time.sleep_ms で待つ
+                (2つ目のコアで描画スレッドが動いている場合)
+        """
+        now = time.ticks_ms()
+        self.use_lightsleep = lightsleep
+        # 1回の lightsleep() で待つ最長時間 (ウォッチドッグの期限に使う)
+        self.sleep_max_ms = self.SLEEP_MAX_MS if lightsleep else self.SHARED_SLEEP_MS
+        self.state = ACTIVE
+        self.keep_awake = False  # タイマー計測中など、暗くしてはいけない間 True
+        self._last_activity = now
+        self._since = now        # 現在の状態に入った時刻 (時間の集計用)
+        self._woke_at = time.ticks_add(now, -self.WAKE_IGNORE_MS)
+
+        # 計測用: 状態ごとの滞在時間と lightsleep の合計
+        self.state_ms = [0, 0, 0]  # ACTIVE / DIM / OFF
+        self.sleep_ms = 0          # lightsleep() で待っていた時間 (OFF の内数)
+        self.sleeps = 0            # lightsleep の回数
+        self.wakes = 0             # OFF から入力で起きた回数
+        PowerManager.last = self
+
+    def _set_state(self, state, now):
+        self.state_ms[self.state] += time.ticks_diff(now, self._since)
+        self._since = now
+        if state == ACTIVE:
+            if self.state == OFF:
+                display.set_power(True)
+            display.set_contrast(self.FULL_CONTRAST)
+        elif state == DIM:
+            display.set_contrast(self.DIM_CONTRAST)
+        elif state == OFF:
+            display.set_power(False)
+        self.state = state
+
+    def activity(self):
+        """入力のピンが変化した時に呼ぶ。画面を元の明るさに戻す"""
+        now = time.ticks_ms()
+        self._last_activity = now
+        if self.state == ACTIVE:
+            return
+        if self.state == OFF:
+            self.wakes += 1
+            self._woke_at = now
+        self._set_state(ACTIVE, now)
+
+    def ignoring_input(self):
+        """画面が消えていた状態から起こした直後 (その操作は捨てる) なら True"""
+        return time.ticks_diff(time.ticks_ms(), self._woke_at) < self.WAKE_IGNORE_MS
+
+    def update(self):
+        """経過時間に応じて暗くする/消す (入力タスクから周期的に呼ぶ)"""
+        now = time.ticks_ms()
+        if self.keep_awake:
+            self._last_activity = now
+            if self.state != ACTIVE:
+                self._set_state(ACTIVE, now)
+            return
+        idle_ms = time.ticks_diff(now, self._last_activity)
+        if self.state == ACTIVE and idle_ms >= self.DIM_AFTER_MS:
+            self._set_state(DIM, now)
+        if self.state == DIM and idle_ms >= self.OFF_AFTER_MS:
+            self._set_state(OFF, now)
+
+    def can_sleep(self):
+        return self.state == OFF and not self.keep_awake
+
+    def lightsleep(self):
+        """
+        sleep_max_ms の間 CPU を止めて待つ (ピンの変化は割り込みで数えておく)
+        Return:
+            int: 待っていた時間 (ms)
+        """
+        t0 = time.ticks_ms()
+        if self.use_lightsleep:
+            machine.lightsleep(self.SLEEP_MAX_MS)
+        else:
+            time.sleep_ms(self.SHARED_SLEEP_MS)
+        slept = time.ticks_diff(time.ticks_ms(), t0)
+        self.sleep_ms += slept
+        self.sleeps += 1
+        return slept
+
+    def stats(self):
+        """
+        Return:
+            dict: 状態ごとの時間 (ms) と、起きていた時間の割合 (%)
+        """
+        now = time.ticks_ms()
+        state_ms = list(self.state_ms)
+        state_ms[self.state] += time.ticks_diff(now, self._since)
+        total_ms = sum(state_ms)
+        awake_ms = total_ms - self.sleep_ms
+        return {
+            "active_ms": state_ms[ACTIVE],
+            "dim_ms": state_ms[DIM],
+            "off_ms": state_ms[OFF],
+            "sleep_ms": self.sleep_ms,
+            "awake_ms": awake_ms,
+            "awake_pct": (awake_ms * 100 // total_ms) if total_ms > 0 else 100,
+            "sleeps": self.sleeps,
+            "wakes": self.wakes,
+        }
@@ -1,103 +1,281 @@
 """
 Presentation Timer Mode (待機・計測画面)
 表示: 現在のタイマー時間、設定値の簡易表示（1回:10分, 2回:15分）、操作の説明
+　　最後の FINAL_PHASE_SEC 秒は 1/10 秒まで 10fps で表示 (反転/点滅も選べる)
 操作:
 　　短押し：スタート/ストップ
 　　長押し：Setting Modeへ遷移
 """
 
 import time
+import bells
 import display
 import hardware
+import log
+import perf
+import runtime
+import watchdog
+from runtime import asyncio
 
 class TimerStatus:
     """上位コードへ返すステータス定数"""
     FINISHED = 0       # タイマー正常終了
     GO_TO_SETTINGS = 1 # 設定画面へ遷移リクエスト
+    NEXT_SESSION = 2   # アジェンダの次のセッションへ進むリクエスト (ダブルクリック)
     ERROR = -1         # エラー発生
 
 class PresentationTimerMode:
-    def __init__(self, hardware_interface):
+    # 直近の run() の計測結果 (起床回数、終了時刻の誤差など)
+    last_stats = None
+
+    # --- 最後の追い込み (ファイナルフェーズ) ---
+    # 残りが FINAL_PHASE_SEC 秒以下になったら 1/10 秒まで表示し、1/10 秒ごと (10fps) に描き直す (0 で無効)
+    FINAL_PHASE_SEC = 30
+    FINAL_FRAME_MS = 100
+    # 画面の見せ方: None (そのまま) / "invert" (反転したまま) / "blink" (1秒ごとに半分だけ反転)
+    # 反転や点滅は使う人が選ぶ (既定はそのまま)。一時停止中は反転しない
+    FINAL_STYLE = None
+
+    def __init__(self, hardware_interface, rt, telemetry=None):
         """
         Args:
             hardware_interface: ボタン入力やベル鳴動を行うハードウェア管理クラス
                                 (get_button_event, ring_bell などのメソッドを持つ想定)
+            rt: 入力待ちと描画要求を仲介する runtime.Runtime
+            telemetry: セッションを記録する telemetry.SessionLog (省略時は記録しない)
         """
         self.hw = hardware_interface
+        self.rt = rt
+        self.telemetry = telemetry
         self.is_paused = False
+        self.remaining_sec = 0  # 表示中の残り時間 (リモート操作の state 用)
 
-    def _min_to_sec(self, minutes):
-        return int(minutes * 60)
+        # 計測用
+        self.wakeups = 0       # ループが起きた回数
+        self.paused_ms = 0     # 一時停止していた合計時間
+        self.final_missed = 0  # ファイナルフェーズで描けなかった (飛ばした) 1/10 秒の数
+        self._final_counts = None  # ファイナルフェーズに入った時の (転送フレーム数, まとめられたフレーム数)
 
     def _sec_to_min_sec(self, total_seconds):
         return total_seconds // 60, total_seconds % 60
 
-    def _check_and_ring_bell(self, current_remaining_sec, total_duration_sec, bell_settings):
+    def _next_deadline_ms(self, remaining_ms):
         """
-        残り時間に応じてベルを鳴らす
-        ここでのロジック例:
-          残り時間が「設定値に対応する経過時間」と一致したら鳴らす
+        表示している秒 (ファイナルフェーズでは 1/10 秒) が次に変わるまでの時間 (ms)
+        ベルの期限も秒単位 (bells.compile_schedule) なので、これが次にやることのある時刻になる
         """
-        elapsed_sec = total_duration_sec - current_remaining_sec
+        if remaining_ms <= self.FINAL_PHASE_SEC * 1000:
+            return remaining_ms % self.FINAL_FRAME_MS + 1
+        return remaining_ms % 1000 + 1
 
-        # 設定: [1回鳴らす時間(分), 2回鳴らす時間(分), 3回鳴らす時間(分)]
-        # 秒に変換して比較
-        times_to_ring = 0
-        
-        # 厳密な一致判定 (ループ周期によっては <= などで範囲判定が必要な場合もあり)
-        if elapsed_sec == self._min_to_sec(bell_settings[0]):
-            times_to_ring = 1
-        elif elapsed_sec == self._min_to_sec(bell_settings[1]):
-            times_to_ring = 2
-        elif elapsed_sec == self._min_to_sec(bell_settings[2]):
-            times_to_ring = 3
-        
-        if times_to_ring > 0:
-            self.hw.ring_bell(times_to_ring) 
+    def _frame_counts(self):
+        stats = self.rt.stats()
+        return display.flush_count, stats["frames_coalesced"]
+
+    def _record_stats(self, start_ticks, end_ticks, finished, final_ms=0):
+        now = time.ticks_ms()
+        run_ms = time.ticks_diff(now, start_ticks)
+        stats = {
+            "run_ms": run_ms,
+            "wakeups": self.wakeups,
+            "wakeups_per_min": (self.wakeups * 60000 // run_ms) if run_ms > 0 else 0,
+            "paused_ms": self.paused_ms,
+            # 予定の終了時刻 (一時停止分を含む) から終了を検出するまでの遅れ
+            "end_error_ms": time.ticks_diff(now, end_ticks) if finished else None,
+        }
+        if self._final_counts is not None:
+            # ファイナルフェーズのフレーム (final_ms はその間にタイマーが進んだ時間。一時停止は含まない)
+            flushes, coalesced = self._frame_counts()
+            frames = flushes - self._final_counts[0]
+            stats["final_frames"] = frames
+            stats["final_fps"] = round(frames * 1000 / final_ms, 1) if final_ms > 0 else 0.0
+            stats["final_missed"] = self.final_missed + coalesced - self._final_counts[1]
+        PresentationTimerMode.last_stats = stats
+
+    def _final_elapsed(self, final_ms, end_ticks, paused_at):
+        """ファイナルフェーズに入ってからタイマーが進んだ時間 (途中で抜けた時用)"""
+        now = paused_at if self.is_paused else time.ticks_ms()
+        return max(0, final_ms - max(0, time.ticks_diff(end_ticks, now)))
 
-    def run(self, bell_settings):
+    def _end_session(self, status, end_ticks, paused_at):
+        """セッションの記録を終える (終了予定時刻とのずれを付けて)"""
+        if self.telemetry is None:
+            return
+        # 一時停止中ならその時点で止まっている (まだ終了予定時刻をずらしていない)
+        now = paused_at if self.is_paused else time.ticks_ms()
+        self.telemetry.end(status, time.ticks_diff(now, end_ticks))
+
+    def _ring_due_bells(self, schedule, next_bell, elapsed_ms):
         """
-        タイマーメインループ
-        上位コードからはこのメソッドを呼ぶだけでモードが実行される
+        期限を過ぎたベルを鳴らす
+        ベルは時刻順に並んでいるので、毎回見るのは次のベル1つだけでよい。
+        ループが止まっていて期限を過ぎてしまったベルも、ここで1回だけ鳴らす (取りこぼさない)
+        Args:
+            schedule (list): bells.compile_schedule() の結果 [(経過ms, 回数), ...]
+            next_bell (int): まだ鳴らしていない最初のベルの位置
+            elapsed_ms (int): 開始からの経過時間 (一時停止分は除く)
+        Return:
+            int: 次に鳴らすベルの位置
+        """
+        while next_bell < len(schedule) and schedule[next_bell][0] <= elapsed_ms:
+            self.hw.ring_bell(schedule[next_bell][1])
+            if self.telemetry is not None:
+                self.telemetry.bell(next_bell, elapsed_ms)
+            next_bell += 1
+        return next_bell
+
+    async def run(self, bell_settings, title=None, start_paused=False, name=None,
+                  resume_ms=0, index=0):
+        """
+        タイマーメインループ (時間管理タスク)
+        上位コードからはこのコルーチンを await するだけでモードが実行される
+        Args:
+            bell_settings (list): ベル設定 (形式は bells.py を参照)
+            title (str): 画面下に表示するセッション名 (アジェンダ使用時)
+            start_paused (bool): 一時停止の状態で始める (クリックでスタート)
+            name (str): セッションの記録に残す名前 (省略時は title)
+            resume_ms (int): この経過時間から始める (ウォッチドッグのリセットからの再開。それまでのベルは鳴らさない)
+            index (int): アジェンダのセッションの番号 (再開用に watchdog.checkpoint() に残す)
         """
         # 1. 初期設定とガード節
-        # bell_settingsの3番目(インデックス2)を終了時間とする
-        total_duration_sec = self._min_to_sec(bell_settings[2])
+        # 計測中にリモート操作で使用中の設定 (main のリスト) が書き換えられても、画面の見出しと
+        # 鳴らすベルがずれないようにコピーを使う (変更は次のタイマーから)
+        bell_settings = list(bell_settings)
+        # ベル設定を時刻順のイベント列にしておく。最後のベルが終了時刻
+        schedule = bells.compile_schedule(bell_settings) if bell_settings else []
+        total_duration_sec = schedule[-1][0] // 1000 if schedule else 0
+        next_bell = 0
         
         if total_duration_sec <= 0:
-            print("エラー: 設定値が不正です")
+            log.error("設定値が不正です")
             return TimerStatus.ERROR
+        if resume_ms >= total_duration_sec * 1000:
+            resume_ms = 0
+        while next_bell < len(schedule) and schedule[next_bell][0] <= resume_ms:
+            next_bell += 1  # リセット前に鳴らした
 
         # 2. タイマー開始準備
-        print(f"--- {total_duration_sec}秒タイマー スタート ---")
+        log.info("--- {}秒タイマー スタート ---", total_duration_sec)
+        self.rt.clear_input()
+        self.is_paused = start_paused
+        # 計測中は画面を暗くしない (一時停止中は省電力にしてよい)
+        self.rt.power.keep_awake = not start_paused
+        self.wakeups = 0
+        self.paused_ms = 0
         start_ticks = time.ticks_ms()
+        paused_at = start_ticks
         # 終了予定時刻を計算
-        end_ticks = time.ticks_add(start_ticks, total_duration_sec * 1000)
-        
+        total_ms = total_duration_sec * 1000
+        end_ticks = time.ticks_add(start_ticks, total_ms - resume_ms)
+        # セッションの記録は計測が始まった時 (一時停止で始めた場合は最初の再開) から
+        rec = self.telemetry
+        if rec is not None and not start_paused:
+            rec.begin(name or title, schedule)
+
         last_displayed_sec = -1
+        # 毎秒の画面の引数 [分, 秒, ベル設定, タイトル]。毎回タプルを作らずにリストを使い回す
+        # (描画スレッドが前のフレームを描いている間に書き換えないよう、2つを交互に使う)
+        frames = ([0, 0, bell_settings, title], [0, 0, bell_settings, title])
+        frame_no = 0
+        # ファイナルフェーズの画面の引数 [秒, 1/10秒, ベル設定, タイトル, 反転]
+        final_frames = ([0, 0, bell_settings, title, False], [0, 0, bell_settings, title, False])
+        final_ms = min(self.FINAL_PHASE_SEC * 1000, total_ms)
+        last_tenths = -1
+        self.final_missed = 0
+        self._final_counts = None
+        wait_ms = 0  # 初回はすぐに描画する
+        self.remaining_sec = (total_ms - resume_ms + 999) // 1000
+        # ウォッチドッグのリセットで止まっても、ここから再開できるようにしておく (秒が変わるごとに書く)
+        watchdog.checkpoint(resume_ms, start_paused, index)
+        last_checkpoint_sec = self.remaining_sec
+        if start_paused:
+            # スタート前は全体 (再開時は残り) の時間を表示して待つ
+            m, s = self._sec_to_min_sec(self.remaining_sec)
+            self.rt.render(display.draw_timer_screen, m, s, bell_settings, title)
+            wait_ms = None
         
         # 3. メインループ
+        # 1周 (眠っている間の入力タスクや描画も含めて) ではメモリを確保しない
+        # (GC が秒の切り替わりやベルに重ならないように)
+        # perf を有効にすると、眠る直前から、期限で起きてベルも鳴らさなかった周の終わりまでの確保量を
+        # "timer.tick" で調べる (入力で起きた周やベルを鳴らした周は数えない)
+        t0 = wake_at = a0 = 0
         try:
             while True:
-                # --- A. ボタン入力の処理 (割り込み/ポーリング) ---
-                # ハードウェア側で判定されたイベントを取得
-                event = self.hw.get_button_event() 
+                # --- A. ボタン入力の処理 ---
+                # 入力があるか、次の期限 (秒の切り替わり) まで眠る
+                # 一時停止中は期限が無いので入力だけを待つ
+                if perf.ENABLED:
+                    if wait_ms:
+                        wake_at = time.ticks_add(time.ticks_us(), wait_ms * 1000)
+                    a0 = perf.alloc_mark()
+                delta, event = await self.rt.wait_input(wait_ms)
+                self.wakeups += 1
+                if perf.ENABLED:
+                    t0 = time.ticks_us()
+                    if wait_ms and delta == 0 and event is None:
+                        # 期限で起きた場合の予定からの遅れ
+                        perf.record("timer.wake_late", wake_at)
+                steady = wait_ms and delta == 0 and event is None
+
+                # リモート操作はボタンの操作に読み替える
+                if event == "REMOTE_STOP":
+                    event = "LONG_PRESS"
+                elif (event == "REMOTE_START" and self.is_paused) or (
+                        event == "REMOTE_PAUSE" and not self.is_paused):
+                    event = "SHORT_PRESS"
 
                 if event == "LONG_PRESS":
-                    print("長押し検出: 設定モードへ遷移します")
+                    log.info("長押し検出: 設定モードへ遷移します")
+                    self._record_stats(start_ticks, end_ticks, False,
+                                       self._final_elapsed(final_ms, end_ticks, paused_at))
+                    self._end_session(TimerStatus.GO_TO_SETTINGS, end_ticks, paused_at)
                     return TimerStatus.GO_TO_SETTINGS
+
+                elif event == "DOUBLE_CLICK":
+                    log.info("ダブルクリック検出: 次のセッションへ進みます")
+                    self._record_stats(start_ticks, end_ticks, False,
+                                       self._final_elapsed(final_ms, end_ticks, paused_at))
+                    self._end_session(TimerStatus.NEXT_SESSION, end_ticks, paused_at)
+                    return TimerStatus.NEXT_SESSION
                 
                 elif event == "SHORT_PRESS":
                     self.is_paused = not self.is_paused
-                    print("一時停止" if self.is_paused else "再開")
-                    # ※ポーズ実装時は start_ticks のずらし処理などが別途必要ですが、
-                    # ここでは簡易的にループをスキップするだけに留めます
+                    self.rt.power.keep_awake = not self.is_paused
+                    log.info("一時停止" if self.is_paused else "再開")
+                    if self.is_paused:
+                        paused_at = time.ticks_ms()
+                        elapsed_ms = total_ms - time.ticks_diff(end_ticks, paused_at)
+                        watchdog.checkpoint(elapsed_ms, True, index)
+                        if rec is not None:
+                            rec.pause(elapsed_ms)
+                        shown = final_frames[(frame_no - 1) & 1]
+                        if last_tenths >= 0 and shown[4]:
+                            # 反転したまま止めない (同じ残り時間を反転せずに描き直す)
+                            args = final_frames[frame_no & 1]
+                            args[0] = shown[0]
+                            args[1] = shown[1]
+                            args[4] = False
+                            frame_no += 1
+                            self.rt.render_args(display.draw_countdown_screen, args)
+                    else:
+                        # 止まっていた時間だけ終了予定時刻を後ろにずらす
+                        # (単調増加の時計で測るので、ループの周期に関係なくずれない)
+                        paused_ms = time.ticks_diff(time.ticks_ms(), paused_at)
+                        end_ticks = time.ticks_add(end_ticks, paused_ms)
+                        self.paused_ms += paused_ms
+                        watchdog.checkpoint(total_ms - time.ticks_diff(end_ticks, time.ticks_ms()),
+                                            False, index)
+                        if rec is not None:
+                            if rec.recording:
+                                rec.resume()
+                            else:
+                                rec.begin(name or title, schedule)
                 
                 if self.is_paused:
-                    time.sleep(0.1)
-                    # ポーズ中も終了予定時刻が後ろにズレるように
-                    # end_ticks を加算する処理を入れるのが一般的
-                    end_ticks = time.ticks_add(end_ticks, 100) 
+                    wait_ms = None
+                    if perf.ENABLED:
+                        perf.record("timer.loop", t0)
                     continue
 
                 # --- B. 残り時間の計算 ---
@@ -106,34 +284,78 @@ class PresentationTimerMode:
                 
                 # 終了判定
                 if remaining_ms <= 0:
-                    print("タイマー終了")
-                    # 終了時のベル（3回）を強制的に鳴らすならここで呼ぶ
-                    self.hw.ring_bell(3)
-                    display.draw_timer_screen(0, 0, bell_settings)
+                    log.info("タイマー終了")
+                    self.remaining_sec = 0
+                    # 終了のベルと、まだ鳴らしていないベルをすべて鳴らす
+                    self._ring_due_bells(schedule, next_bell, total_ms - remaining_ms)
+                    self.rt.render(display.draw_timer_screen, 0, 0, bell_settings, title)
+                    self._record_stats(start_ticks, end_ticks, True, final_ms)
+                    self._end_session(TimerStatus.FINISHED, end_ticks, paused_at)
+                    log.info("計測: {}", PresentationTimerMode.last_stats)
                     return TimerStatus.FINISHED
 
                 # ミリ秒 -> 秒 (切り上げ表示が見やすい)
                 remaining_sec = (remaining_ms // 1000) + 1
 
-                # --- C. 画面更新とベル制御 (1秒に1回だけ実行) ---
-                if remaining_sec != last_displayed_sec:
-                    
-                    # 画面表示
-                    m, s = self._sec_to_min_sec(remaining_sec)
-                    print(f"残り: {m:02}:{s:02}")
-                    display.draw_timer_screen(m, s, bell_settings)
-                    
-                    # ベル判定
-                    self._check_and_ring_bell(remaining_sec, total_duration_sec, bell_settings)
+                # --- C. ベル制御 ---
+                rung = next_bell
+                next_bell = self._ring_due_bells(schedule, next_bell, total_ms - remaining_ms)
+                if next_bell != rung:
+                    steady = False  # ベルのキューへの追加は数に入れない
+                # 鳴らしたベルより後の経過時間を残す (再開してもそのベルは鳴らし直さない)
+                if remaining_sec != last_checkpoint_sec:
+                    watchdog.checkpoint(total_ms - remaining_ms, False, index)
+                    last_checkpoint_sec = remaining_sec
 
+                # --- D. 画面更新 (1秒に1回だけ実行。ファイナルフェーズでは 1/10 秒ごと) ---
+                if remaining_ms <= final_ms:
+                    tenths = (remaining_ms + 99) // 100  # 切り上げ
+                    if tenths != last_tenths:
+                        if last_tenths < 0:
+                            log.info("ファイナルフェーズ: 残り{}秒", self.FINAL_PHASE_SEC)
+                            self._final_counts = self._frame_counts()
+                            steady = False
+                        elif last_tenths - tenths > 1:
+                            # ループが遅れて途中の 1/10 秒を描けなかった
+                            self.final_missed += last_tenths - tenths - 1
+                        self.remaining_sec = remaining_sec
+                        args = final_frames[frame_no & 1]
+                        args[0] = tenths // 10
+                        args[1] = tenths % 10
+                        args[4] = self.FINAL_STYLE == "invert" or (
+                            self.FINAL_STYLE == "blink" and args[1] >= 5)
+                        frame_no += 1
+                        self.rt.render_args(display.draw_countdown_screen, args)
+                        last_tenths = tenths
+                elif remaining_sec != last_displayed_sec:
+                    self.remaining_sec = remaining_sec
+                    m = remaining_sec // 60
+                    s = remaining_sec % 60
+                    log.debug("残り: {:02}:{:02}", m, s)
+                    args = frames[frame_no & 1]
+                    args[0] = m
+                    args[1] = s
+                    frame_no += 1
+                    self.rt.render_args(display.draw_timer_screen, args)
                     last_displayed_sec = remaining_sec
 
-                # --- D. CPU負荷軽減 ---
-                time.sleep(0.05)
+                # --- E. 次の期限までの時間 ---
+                remaining_ms = time.ticks_diff(end_ticks, time.ticks_ms())
+                wait_ms = self._next_deadline_ms(remaining_ms) if remaining_ms > 0 else 0
+                if perf.ENABLED:
+                    if steady:
+                        perf.alloc_check("timer.tick", a0)
+                    perf.record("timer.loop", t0)
 
         except KeyboardInterrupt:
-            print("\n強制中断")
+            log.info("強制中断")
             return TimerStatus.ERROR
+        finally:
+            self.rt.power.keep_awake = False
+            watchdog.clear_session()
+            # 上の return を通らずに抜けた (中断や例外) セッションも残す
+            if rec is not None and rec.recording:
+                self._end_session(TimerStatus.ERROR, end_ticks, paused_at)
 
 # --- ダミーのハードウェアクラス (テスト用) ---
 class MockHardware:
@@ -147,14 +369,22 @@ class MockHardware:
 
 # --- 上位コード (Main Program) からの呼び出しイメージ ---
 if __name__ == "__main__":
-    hw = hardware.HardwareInterface()
-    timer_mode = PresentationTimerMode(hw)
-    
-    # 設定値 (1分, 2分, 30分)
-    settings = [1, 2, 3]
-    status = timer_mode.run(settings)
-    
-    if status == TimerStatus.GO_TO_SETTINGS:
-        print(">> 設定画面へ切り替えます")
-    elif status == TimerStatus.FINISHED:
-        print(">> タイマーが完了しました")
\ No newline at end of file
+    async def _test():
+        hw = hardware.HardwareInterface()
+        rt = runtime.Runtime(hw)
+        rt.start()
+        timer_mode = PresentationTimerMode(hw, rt)
+        
+        # 設定値 (1分, 2分, 3分)。[分, 回数] で回数を個別に指定することもできる
+        settings = [1, 2, 3]
+        status = await timer_mode.run(settings)
+        
+        if status == TimerStatus.GO_TO_SETTINGS:
+            print(">> 設定画面へ切り替えます")
+        elif status == TimerStatus.FINISHED:
+            print(">> タイマーが完了しました")
+            # 終了ベルを鳴らし切るまで待つ
+            while hw.is_ringing():
+                await runtime.sleep_ms(100)
+
+    asyncio.run(_test())
\ No newline at end of file
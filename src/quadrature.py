@@ -0,0 +1,231 @@
+"""
+ロータリーエンコーダ (2相) のデコーダ
+前回と今回の A/B 相 (2bit + 2bit) を並べた 4bit を添字にして、
+16通りの遷移表から回転方向を引く。
+割り込みハンドラ内でメモリを確保しないよう、状態は事前確保した配列に持つ。
+"""
+
+import sys
+import time
+import micropython
+from array import array
+
+# 遷移表: 添字 = (前回AB << 2) | 今回AB
+# 0: 変化なし, 1: 正転(CW), 2: 逆転(CCW), 3: 不正遷移 (2相同時変化 = 取りこぼし)
+_NONE = 0
+_CW = 1
+_CCW = 2
+_INVALID = 3
+TRANSITIONS = bytes((
+    _NONE, _CCW, _CW, _INVALID,    # 00 -> 00, 01, 10, 11
+    _CW, _NONE, _INVALID, _CCW,    # 01 -> 00, 01, 10, 11
+    _CCW, _INVALID, _NONE, _CW,    # 10 -> 00, 01, 10, 11
+    _INVALID, _CW, _CCW, _NONE,    # 11 -> 00, 01, 10, 11
+))
+
+# クリック (デテント) 位置のAB。プルアップなので止まっている時は両相 HIGH
+DETENT_AB = 0b11
+
+# state 配列の添字
+LAST = 0     # 前回のAB
+COUNT = 1    # 累積ステップ数 (正転で+1)
+ERRORS = 2   # 不正遷移の回数
+EDGES = 3    # ハンドラが呼ばれた回数
+DETENTS = 4  # デテントに到達した回数 (= クリック数)
+CLICK_US = 5 # ここから CLICK_RING 個: 直近のクリック時刻 (ticks_us) のリングバッファ
+CLICK_RING = 8  # 2のべき乗にすること
+
+# デコーダの実装の種類
+MODE_PYTHON = "python"
+MODE_NATIVE = "native"
+MODE_VIPER = "viper"
+
+# RP2040 の SIO GPIO_IN レジスタ (全GPIOの入力値をまとめて1回で読める)
+_RP2_GPIO_IN = 0xD0000004
+_HAS_GPIO_IN = sys.platform == "rp2"
+
+
+def new_state(initial_ab=DETENT_AB):
+    """デコーダの状態配列を確保する"""
+    state = array("i", [0] * (CLICK_US + CLICK_RING))
+    state[LAST] = initial_ab & 0b11
+    return state
+
+
+def step_python(state, ab, now_us):
+    """1エッジ分の状態遷移 (素のPython版)"""
+    code = TRANSITIONS[(state[LAST] << 2) | ab]
+    state[LAST] = ab
+    state[EDGES] += 1
+    if code == _CW:
+        state[COUNT] += 1
+    elif code == _CCW:
+        state[COUNT] -= 1
+    elif code == _INVALID:
+        state[ERRORS] += 1
+    if ab == DETENT_AB and (code == _CW or code == _CCW):
+        state[CLICK_US + (state[DETENTS] & (CLICK_RING - 1))] = now_us
+        state[DETENTS] += 1
+    return code
+
+
+@micropython.native
+def step_native(state, ab, now_us):
+    """1エッジ分の状態遷移 (ネイティブコード版)"""
+    code = TRANSITIONS[(state[0] << 2) | ab]
+    state[0] = ab
+    state[3] += 1
+    if code == 1:
+        state[1] += 1
+    elif code == 2:
+        state[1] -= 1
+    elif code == 3:
+        state[2] += 1
+    if ab == 3 and (code == 1 or code == 2):
+        state[5 + (state[4] & 7)] = now_us
+        state[4] += 1
+    return code
+
+
+@micropython.viper
+def step_viper(state, ab: int, now_us: int) -> int:
+    """1エッジ分の状態遷移 (viper版。配列をポインタで直接操作する)"""
+    s = ptr32(state)
+    code = int(ptr8(TRANSITIONS)[((s[0] << 2) | ab) & 0xF])
+    s[0] = ab
+    s[3] = s[3] + 1
+    if code == 1:
+        s[1] = s[1] + 1
+    elif code == 2:
+        s[1] = s[1] - 1
+    elif code == 3:
+        s[2] = s[2] + 1
+    if ab == 3 and (code == 1 or code == 2):
+        s[5 + (s[4] & 7)] = now_us
+        s[4] = s[4] + 1
+    return code
+
+
+@micropython.viper
+def _step_viper_gpio(state, a_num: int, b_num: int) -> int:
+    """
+    GPIO_IN レジスタから A/B 相を直接読んで遷移させる (RP2040 専用)
+    クリック時刻はタイマーの TIMERAWL レジスタ (us) を ticks_us と同じ30bitに丸めて使う
+    """
+    gpio = int(ptr32(0xD0000004)[0])  # _RP2_GPIO_IN
+    ab = (((gpio >> a_num) & 1) << 1) | ((gpio >> b_num) & 1)
+    s = ptr32(state)
+    code = int(ptr8(TRANSITIONS)[((s[0] << 2) | ab) & 0xF])
+    s[0] = ab
+    s[3] = s[3] + 1
+    if code == 1:
+        s[1] = s[1] + 1
+    elif code == 2:
+        s[1] = s[1] - 1
+    elif code == 3:
+        s[2] = s[2] + 1
+    if ab == 3 and (code == 1 or code == 2):
+        s[5 + (s[4] & 7)] = int(ptr32(0x40054028)[0]) & 0x3FFFFFFF  # TIMERAWL
+        s[4] = s[4] + 1
+    return code
+
+
+class QuadratureDecoder:
+    """
+    割り込みハンドラを提供するデコーダ
+    handler を A相/B相 両方の IRQ に登録して使う
+    """
+
+    def __init__(self, pin_a, pin_b, a_num, b_num, mode=MODE_VIPER):
+        """
+        Args:
+            pin_a, pin_b: A相/B相の machine.Pin
+            a_num, b_num: A相/B相の GPIO番号 (viper版のレジスタ直読みで使う)
+            mode: MODE_PYTHON / MODE_NATIVE / MODE_VIPER
+        """
+        self.pin_a = pin_a
+        self.pin_b = pin_b
+        self.a_num = a_num
+        self.b_num = b_num
+        self.mode = mode
+        self.state = new_state((pin_a.value() << 1) | pin_b.value())
+
+        # 割り込み内でメソッドオブジェクトを生成しないよう、ここで選んで保持する
+        if mode == MODE_VIPER and _HAS_GPIO_IN:
+            self.handler = self._handler_gpio
+        elif mode == MODE_VIPER:
+            self.handler = self._handler_viper
+        elif mode == MODE_NATIVE:
+            self.handler = self._handler_native
+        else:
+            self.handler = self._handler_python
+
+    @property
+    def pin_handler(self):
+        """
+        pin_a / pin_b の value() で A/B 相を読むハンドラ
+        (GPIO レジスタを直接読む版は使わない。ピンを差し替えて入力トレースを再生する時に使う)
+        """
+        if self.mode == MODE_VIPER:
+            return self._handler_viper
+        if self.mode == MODE_NATIVE:
+            return self._handler_native
+        return self._handler_python
+
+    def _handler_python(self, pin):
+        step_python(self.state, (self.pin_a.value() << 1) | self.pin_b.value(), time.ticks_us())
+
+    @micropython.native
+    def _handler_native(self, pin):
+        step_native(self.state, (self.pin_a.value() << 1) | self.pin_b.value(), time.ticks_us())
+
+    def _handler_viper(self, pin):
+        step_viper(self.state, (self.pin_a.value() << 1) | self.pin_b.value(), time.ticks_us())
+
+    def _handler_gpio(self, pin):
+        _step_viper_gpio(self.state, self.a_num, self.b_num)
+
+    @property
+    def count(self):
+        """累積ステップ数"""
+        return self.state[COUNT]
+
+    @property
+    def errors(self):
+        """不正遷移 (取りこぼし) の回数"""
+        return self.state[ERRORS]
+
+    @property
+    def edges(self):
+        """ハンドラが呼ばれた回数"""
+        return self.state[EDGES]
+
+    def click_rate(self, window_us, now_us=None):
+        """
+        直近 window_us 以内のクリック時刻から回転速度を推定する
+        Return:
+            int: クリック/秒 (window_us 以内のクリックが2つ未満なら 0)
+        """
+        if now_us is None:
+            now_us = time.ticks_us()
+        state = self.state
+        detents = state[DETENTS]
+        available = min(detents, CLICK_RING)
+
+        newest = oldest = 0
+        n = 0
+        for i in range(1, available + 1):
+            t = state[CLICK_US + ((detents - i) & (CLICK_RING - 1))]
+            if time.ticks_diff(now_us, t) > window_us:
+                break
+            if n == 0:
+                newest = t
+            oldest = t
+            n += 1
+
+        if n < 2:
+            return 0
+        span = time.ticks_diff(newest, oldest)
+        if span <= 0:
+            return 0
+        return (n - 1) * 1000000 // span
@@ -0,0 +1,300 @@
+"""
+USB シリアル (標準入力) からのリモート操作
+PC のターミナルなどから1行1コマンドのテキストを送り、タイマーの開始/一時停止や設定の変更をする。
+入力タスクの1周ごとに poll() が呼ばれ、select.poll で読めるバイトだけを読む
+(読めるものが無ければすぐ戻るので、モードのループもエンコーダ/ボタンの処理も待たせない)。
+
+コマンド (返事は "OK ..." か "ERR ..." の1行):
+  start                 タイマーをスタート/再開 (メニュー画面ならタイマーへ)
+  pause                 タイマーを一時停止
+  stop                  タイマーを中断してメニューへ
+  bell N 分[:回数]      N 番目 (1始まり) のベルを設定する (N が個数+1 なら追加)
+  bells 分[:回数],...   ベル設定をまとめて置き換える
+  preset [名前]         プリセットを切り替える (省略時は次のプリセット)
+  state                 状態を返す (例: "OK mode=timer preset=default bells=7,10,15 paused=0 remaining=412")
+  export                セッションの記録を "T <16進数>" の行で全部出力し、"OK export 件数" を返す
+                        (PC 側では host/telemetry_decode.py で読む。出力中に送ったコマンドの返事はその後に出る)
+  trace start|stop|replay  エンコーダとボタンのエッジを記録する / 止めて input.trc に保存する /
+                        input.trc を再生する (結果は再生後にログに出る。input_trace.py を参照)
+
+";" で区切ると複数のコマンドを1行で送れる (バッチ)。すべて検査してからまとめて適用し、
+返事も1行だけ返す (どれかが不正なら何も変えずに ERR を返す)。
+  例: bells 5,8,10:3; preset lt5; bell 1 4; state
+start / pause / stop はモードが次に起きた時に反映されるので、その結果の state は次の行で問い合わせる。
+
+設定の変更は使用中のプリセットに入れ (保存は autosave がまとめて行う)、次のタイマーから使われる。
+メニュー画面には "REFRESH" イベントで表示し直させる。
+
+返事と export の行は print() せずに出力待ちの列に積み、poll() のたびに出力先が詰まっていない
+(log.writable()) 分だけ書く。PC 側が読まなくなっても入力タスクは止まらない (止まるとウォッチドッグで
+リセットされる)。列が一杯なら返事を捨てて out_dropped に数える。
+"""
+
+import sys
+import select
+import bells
+import log
+import settings_store
+
+MAX_MINUTES = 180  # EditMode.MAX_VALUE と同じ
+MAX_STRIKES = 9
+
+
+class RemoteControl:
+    LINE_MAX = 128  # 1行の最大バイト数 (超えた行は捨てる)
+    MAX_BYTES = 64  # 1回の poll() で読む最大バイト数
+    OUT_QUEUE = 8   # 出力待ちにしておける返事の数 (export の行はまとめて1つ)
+    OUT_LINES_PER_POLL = 4  # 1回の poll() で書く最大行数
+
+    # コマンド -> モードに渡すイベント
+    EVENTS = {"start": "REMOTE_START", "pause": "REMOTE_PAUSE", "stop": "REMOTE_STOP"}
+
+    def __init__(self, rt, store, bell_settings, status=None, telemetry=None, stream=None):
+        """
+        Args:
+            rt: runtime.Runtime (イベントをモードに渡す)
+            store: settings_store.SettingsStore
+            bell_settings (list): main が使っている使用中のベル設定 (このリストの中身を書き換える)
+            status: state の返事に使う状態の文字列を返す関数 (省略時はプリセットとベル設定だけ)
+            telemetry: export で出力する telemetry.SessionLog
+            stream: コマンドを読むストリーム (省略時は標準入力)
+        """
+        self.rt = rt
+        self.store = store
+        self.bell_settings = bell_settings
+        self._status = status
+        self.telemetry = telemetry
+        self._recording = None  # trace start で記録中の input_trace.InputTrace
+        stream = stream or sys.stdin
+        # バッファを通さずに読む (CPython でバッファに溜まった分を poll で見落とさないように)
+        raw = getattr(stream, "buffer", stream)
+        self._stream = getattr(raw, "raw", raw)
+        self._poller = select.poll()
+        self._polled = stream
+        self._poller.register(stream, select.POLLIN)
+        # MicroPython の ipoll は結果のリストを作らない (何も来ていない間の poll() でメモリを確保しない)
+        self._ipoll = getattr(self._poller, "ipoll", None)
+
+        self._line = bytearray(self.LINE_MAX)
+        self._len = 0
+        self._overflow = False
+        self.closed = False  # 入力が閉じられた (パイプの相手が終了した)
+        # 出力待ちの返事 (文字列か、export の行を返す iterator)
+        self._out = []
+
+        # 計測用
+        self.commands = 0
+        self.errors = 0
+        self.out_dropped = 0  # 出力待ちの列が一杯で捨てた返事の数
+
+    # --- 読み込み ---
+    def _readable(self):
+        if self._ipoll is not None:
+            for _ in self._ipoll(0):
+                return True
+            return False
+        return bool(self._poller.poll(0))
+
+    def poll(self):
+        """
+        出力待ちの返事を書き、読めるバイトを読んで、行が揃ったら実行する (入力タスクから毎周呼ぶ。待たない)
+        """
+        if self._out:
+            self._drain()
+        n = 0
+        while not self.closed and n < self.MAX_BYTES and self._readable():
+            c = self._stream.read(1)
+            if not c:
+                # EOF
+                self.closed = True
+                self._poller.unregister(self._polled)
+                break
+            n += 1
+            b = c[0] if not isinstance(c, str) else ord(c)
+            if b == 0x0A or b == 0x0D:
+                if self._len or self._overflow:
+                    self._line_done()
+            elif self._len < self.LINE_MAX:
+                self._line[self._len] = b
+                self._len += 1
+            else:
+                self._overflow = True
+
+    def _line_done(self):
+        if self._overflow:
+            reply = "ERR line too long"
+            self.errors += 1
+        else:
+            try:
+                reply = self.execute(bytes(self._line[:self._len]).decode())
+            except UnicodeError:
+                reply = "ERR bad encoding"
+                self.errors += 1
+        self._len = 0
+        self._overflow = False
+        if reply is not None:
+            self._send(reply)
+
+    # --- 出力 ---
+    def _send(self, item):
+        """返事 (または export の行の iterator) を出力待ちに積む。一杯なら捨てる"""
+        if len(self._out) >= self.OUT_QUEUE:
+            self.out_dropped += 1
+            return False
+        self._out.append(item)
+        return True
+
+    def _drain(self):
+        """出力待ちを、出力先が詰まっていない分だけ書く"""
+        n = 0
+        while self._out and n < self.OUT_LINES_PER_POLL and log.writable():
+            item = self._out[0]
+            if isinstance(item, str):
+                self._out.pop(0)
+                line = item
+            else:
+                line = next(item, None)
+                if line is None:
+                    self._out.pop(0)
+                    continue
+            print(line)
+            n += 1
+
+    # --- 実行 ---
+    def execute(self, text):
+        """
+        1行分のコマンド (";" 区切りのバッチを含む) を実行する
+        Return:
+            str: 返事の行 (空行なら None)
+        """
+        commands = [part.split() for part in text.split(";")]
+        commands = [words for words in commands if words]
+        if not commands:
+            return None
+
+        store = self.store
+        preset = store.active
+        settings = list(self.bell_settings)
+        events = []
+        want_state = False
+        want_export = False
+        trace_cmd = None
+        replay = None
+
+        # 1. 作業用のコピーに順番に当てはめて検査する (ここでは何も変えない)
+        for i, words in enumerate(commands):
+            cmd = words[0].lower()
+            try:
+                if cmd in self.EVENTS:
+                    events.append(self.EVENTS[cmd])
+                elif cmd == "state":
+                    want_state = True
+                elif cmd == "trace":
+                    trace_cmd = words[1] if len(words) > 1 else ""
+                    if trace_cmd not in ("start", "stop", "replay"):
+                        raise ValueError("start|stop|replay")
+                    if trace_cmd == "replay":
+                        import input_trace
+                        try:
+                            replay = input_trace.InputTrace.load()
+                        except OSError:
+                            raise ValueError("no trace")
+                elif cmd == "export":
+                    if self.telemetry is None:
+                        raise ValueError("no telemetry")
+                    if len(self._out) + 2 > self.OUT_QUEUE:
+                        raise ValueError("output busy")
+                    want_export = True
+                elif cmd == "bell":
+                    n = int(words[1]) - 1
+                    if not 0 <= n <= len(settings):
+                        raise ValueError("no bell {}".format(n + 1))
+                    entry = bells.parse_text(words[2])
+                    if n == len(settings):
+                        settings.append(entry)
+                    else:
+                        settings[n] = entry
+                elif cmd == "bells":
+                    settings = [bells.parse_text(item) for item in "".join(words[1:]).split(",")]
+                elif cmd == "preset":
+                    if len(words) > 1:
+                        preset = words[1]
+                    else:
+                        names = store.names
+                        preset = names[(names.index(preset) + 1) % len(names)]
+                    settings = list(store.get(preset))
+                else:
+                    raise ValueError("unknown command")
+                _check(settings)
+            except (ValueError, IndexError, KeyError) as e:
+                self.errors += 1
+                return "ERR {} {}: {}".format(i + 1, cmd, e)
+
+        # 2. まとめて適用する
+        changed = False
+        if preset != store.active:
+            store.select(preset)
+            changed = True
+        if settings != store.get():
+            store.put(preset, settings)
+            changed = True
+        if changed:
+            self.bell_settings[:] = settings
+            log.info("リモート: {} {}", preset, settings)
+            if not events:
+                # 表示し直させる (start などが続く場合は、その遷移で新しい設定が表示される)
+                self.rt.post_event("REFRESH")
+        for event in events:
+            self.rt.post_event(event)
+        self.commands += len(commands)
+
+        reply = "OK"
+        if trace_cmd is not None:
+            reply += " " + self._trace(trace_cmd, replay)
+        if want_export:
+            # 行は返事より先に出力待ちに積む (返事は最後の行の後に出る)
+            count, lines = self.telemetry.export()
+            self._send(lines)
+            reply += " export {}".format(count)
+        if want_state:
+            reply += " " + self.state()
+        return reply
+
+    def _trace(self, cmd, replay):
+        import input_trace
+        hw = self.rt.hw
+        if cmd == "start":
+            if self._recording is None:
+                self._recording = input_trace.InputTrace()
+            hw.start_trace(self._recording)
+            return "trace=recording"
+        if cmd == "stop":
+            trace = hw.stop_trace()
+            if trace is None:
+                return "trace=0"
+            trace.save()
+            return "trace={}".format(trace.count)
+        from runtime import asyncio
+        asyncio.create_task(input_trace.TraceReplayer(hw, replay).run())
+        return "trace=replaying"
+
+    def state(self):
+        if self._status is not None:
+            return self._status()
+        return "preset={} bells={}".format(self.store.active, bells.to_text(self.bell_settings))
+
+    def stats(self):
+        return {"commands": self.commands, "errors": self.errors, "closed": self.closed,
+                "out_pending": len(self._out), "out_dropped": self.out_dropped}
+
+
+def _check(bell_settings):
+    """ベル設定として使える値か調べる (使えなければ ValueError)"""
+    if not 1 <= len(bell_settings) <= settings_store.MAX_BELLS:
+        raise ValueError("1-{} bells".format(settings_store.MAX_BELLS))
+    for i, entry in enumerate(bell_settings):
+        mins, strikes = bells.parse(entry, i)
+        if not 1 <= mins <= MAX_MINUTES:
+            raise ValueError("minutes 1-{}".format(MAX_MINUTES))
+        if not 1 <= strikes <= MAX_STRIKES:
+            raise ValueError("strikes 1-{}".format(MAX_STRIKES))
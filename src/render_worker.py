@@ -0,0 +1,144 @@
+"""
+描画専用スレッド (RP2040 では2つ目のコア)
+フレームバッファへの描画と I2C 転送を別のコアで行い、
+入力監視や時間管理をしているメインのコアを表示の処理で止めないようにする。
+
+メインのコアはフレーム (描画関数と引数) を2枚のバッファの書き込み側に置くだけで、
+描画スレッドが読み出し側と入れ替えて描く。描画が追いつく前に次のフレームが来たら
+古いフレームは上書きされる (捨てたフレームとして数える)。
+描画の間隔は min_interval_ms 以上あけ、その間に来た要求は最新の1つだけを描く。
+2枚のバッファは最初に作ったリストを使い回す (フレームごとにメモリを確保しない)。
+
+MicroPython の _thread と CPython の _thread のどちらでも動く。
+"""
+
+import time
+import _thread
+import log
+
+
+class RenderWorker:
+    def __init__(self, min_interval_ms=0):
+        """
+        Args:
+            min_interval_ms (int): 描画の最短間隔 (ms)
+        """
+        self.min_interval_ms = min_interval_ms
+        self._last_start = time.ticks_add(time.ticks_ms(), -min_interval_ms)
+        self._lock = _thread.allocate_lock()   # 以下のフレームの受け渡し用の変数を守る
+        self._ready = _thread.allocate_lock()  # フレームがある時だけ解放されている
+        self._ready.acquire()
+        self._signalled = False
+        # 2枚のフレーム: [書き込み側, 描画側]。それぞれ [描画関数, 引数, 要求時刻us]
+        # (描画関数が None なら空)
+        self._slots = [[None, None, 0], [None, None, 0]]
+        self._running = False
+        self.busy = False  # 描画中
+
+        # 計測用
+        self.submitted = 0      # 要求されたフレーム数
+        self.rendered = 0       # 描画したフレーム数
+        self.dropped = 0        # 描画前に上書きされたフレーム数
+        self.handoff_us_max = 0 # 要求から描画開始までの最大時間
+        self.handoff_us_total = 0
+        self.render_us_max = 0  # 1フレームの描画 + 転送にかかった最大時間
+        self.errors = 0
+
+        # 期限の監視 (watchdog.DeadlineMonitor)
+        self._monitor = None
+        self._slot = 0
+        self._budget_ms = 0
+
+    def set_monitor(self, monitor, slot, budget_ms):
+        """1フレームの描画と転送を budget_ms 以内に終える期限を監視させる"""
+        self._monitor = monitor
+        self._slot = slot
+        self._budget_ms = budget_ms
+
+    def start(self):
+        """描画スレッドを起動する (RP2040 では2つ目のコアで動く)"""
+        self._running = True
+        _thread.start_new_thread(self._loop, ())
+
+    def stop(self):
+        """描画スレッドを止める (描画中のフレームは描き終わる)"""
+        self._running = False
+        self._signal()
+
+    def submit(self, draw_func, args):
+        """フレームを渡す (すぐに戻る)"""
+        now = time.ticks_us()
+        with self._lock:
+            slot = self._slots[0]
+            if slot[0] is not None:
+                self.dropped += 1
+            slot[0] = draw_func
+            slot[1] = args
+            slot[2] = now
+            self.submitted += 1
+            self._signal_locked()
+
+    def _signal(self):
+        with self._lock:
+            self._signal_locked()
+
+    def _signal_locked(self):
+        if not self._signalled:
+            self._signalled = True
+            self._ready.release()
+
+    def _loop(self):
+        slots = self._slots
+        while True:
+            self._ready.acquire()
+            # 前のフレームから min_interval_ms 経つまで待つ (その間の要求は書き込み側で上書きされる)
+            wait = self.min_interval_ms - time.ticks_diff(time.ticks_ms(), self._last_start)
+            if wait > 0 and self._running:
+                time.sleep_ms(wait)
+            with self._lock:
+                self._signalled = False
+                # 書き込み側と描画側を入れ替え、新しい書き込み側 (描き終えたフレーム) を空にする
+                slots[0], slots[1] = slots[1], slots[0]
+                slots[0][0] = None
+                slots[0][1] = None
+                frame = slots[1]
+                self.busy = frame[0] is not None
+            if not self._running:
+                self.busy = False
+                return
+            if frame[0] is None:
+                continue
+
+            self._last_start = time.ticks_ms()
+            start = time.ticks_us()
+            handoff = time.ticks_diff(start, frame[2])
+            self.handoff_us_total += handoff
+            if handoff > self.handoff_us_max:
+                self.handoff_us_max = handoff
+            monitor = self._monitor
+            if monitor is not None:
+                monitor.expect(self._slot, self._budget_ms)
+            try:
+                frame[0](*frame[1])
+            except Exception as e:
+                # 描画の失敗でスレッドごと止まらないようにする
+                self.errors += 1
+                log.error("描画エラー: {}", e)
+            if monitor is not None:
+                monitor.tick(self._slot)
+            elapsed = time.ticks_diff(time.ticks_us(), start)
+            if elapsed > self.render_us_max:
+                self.render_us_max = elapsed
+            self.rendered += 1
+            self.busy = False
+
+    def stats(self):
+        return {
+            "submitted": self.submitted,
+            "rendered": self.rendered,
+            "dropped": self.dropped,
+            "handoff_us_avg": (self.handoff_us_total // self.rendered) if self.rendered else 0,
+            "handoff_us_max": self.handoff_us_max,
+            "render_us_max": self.render_us_max,
+            "errors": self.errors,
+        }
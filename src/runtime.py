@@ -0,0 +1,351 @@
+"""
+非同期ランタイム (asyncio / uasyncio)
+入力・描画・ベル駆動をそれぞれ独立したタスクとして動かし、
+各モードはコルーチンとして入力イベントや期限を await する。
+MicroPython と CPython (host/ のスタンドイン使用) の両方で動作する。
+"""
+
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+
+import time
+import display
+import log
+import perf
+import power
+
+# asyncio.sleep_ms は MicroPython にしかないので、CPython では秒に換算して代用する
+if hasattr(asyncio, "sleep_ms"):
+    sleep_ms = asyncio.sleep_ms
+else:
+    async def sleep_ms(ms):
+        await asyncio.sleep(ms / 1000)
+
+
+class Runtime:
+    """
+    各タスクとモードの仲介をするクラス
+    - 入力タスク: エンコーダ/ボタンを監視し、入力があればイベントで通知
+                  操作が無い間は画面を暗くし/消し、消している間は lightsleep で待つ
+                  溜まったログ (log.py) もこの空き時間に出力し、リモート操作 (remote.py) のコマンドも読む
+    - 描画タスク: 最新のフレーム要求だけを描画 (古い要求は上書きされる)
+                  描画の間隔は frame_interval_ms 以上あける (エンコーダを速く回している間に
+                  途中の値を1つずつ転送せず、最後の状態だけをその間隔の後にすぐ描く)
+                  render_thread=True の場合は代わりに描画スレッド (render_worker.py) が描く
+                  フレームを出し終えて次の期限まで余裕がある時に GC を行う (期限の直前に止まらないように)
+    - ベルタスク: タイマー割り込みを使えない環境だけ、BellScheduler の tick() を次の切り替え時刻まで待って回す
+                  (使える環境ではピンの切り替えを hardware のワンショットタイマーに任せる。
+                  イベントループが止まっても通電時間が伸びたり次の打鍵が遅れたりしないように)
+    - 期限の監視: set_monitor() で watchdog.DeadlineMonitor を渡すと、入力タスク・モード (wait_input)・
+                  描画がそれぞれ次に戻ってくる期限を伝え、入力タスクが毎周ウォッチドッグに餌をやる
+    """
+
+    INPUT_POLL_MS = 10   # 入力監視の周期
+    LOG_LINES_PER_POLL = 4  # 入力監視1周の空き時間に出力するログの最大件数
+    FRAME_INTERVAL_MS = 33  # 描画の最短間隔 (約30fps)。set_frame_interval() で変えられる
+    GC_INTERVAL_MS = 1000   # 空き時間の GC の最短間隔
+    GC_MARGIN_MS = 50       # モードの次の期限までこれ以上ある時だけ GC する
+    MODE_BUDGET_MS = 2000   # モードが入力を受け取ってから次に wait_input() を呼ぶまでの期限
+                            # (モードの切り替えでの import や設定の書き込みを含む)
+    RENDER_BUDGET_MS = 200  # 1フレームの描画と転送の期限
+
+    # 直近に作られたインスタンス (計測用)
+    last = None
+    EVENT_QUEUE_SIZE = 4 # 溜めておけるボタンイベント数
+
+    def __init__(self, hardware_interface, render_thread=False):
+        """
+        Args:
+            hardware_interface: hardware.HardwareInterface
+            render_thread (bool): True なら描画と I2C 転送を別スレッド (RP2040 では2つ目のコア) で行う
+        """
+        self.hw = hardware_interface
+        display.init()  # 描画はランタイムの担当 (既に初期化済みなら何もしない)
+
+        # 入力
+        self._input_event = asyncio.Event()
+        self._delta = 0
+        self._events = []
+        self._taken = [0, None]   # take_input() の返り値 (毎回作らずに使い回す)
+        self._waiting = False     # モードが wait_input() で待っている
+        self._wait_until = None   # その待ちの期限 (ticks_ms)。期限なしなら None
+
+        # 省電力
+        # (2つ目のコアで描画する場合、lightsleep は両方のコアを止めるので使わない)
+        self.power = power.PowerManager(lightsleep=not render_thread)
+
+        # リモート操作 (remote.RemoteControl。main が使う場合に設定する)
+        self.remote = None
+
+        # 期限の監視 (watchdog.DeadlineMonitor。set_monitor() で設定する)
+        self.monitor = None
+        self._input_slot = self._mode_slot = self._render_slot = 0
+
+        # 描画
+        self._frame_func = None
+        self._frame_args = None
+        self._frame_event = asyncio.Event()
+        self._rendered = 0  # 描画スレッドが描き終えたフレーム数 (GC の契機を調べる用)
+        self.frame_interval_ms = self.FRAME_INTERVAL_MS
+        self._last_frame_ms = time.ticks_add(time.ticks_ms(), -self.frame_interval_ms)
+        self.frames_rendered = 0   # 描画したフレーム数
+        self.frames_coalesced = 0  # 描画する前に次の要求で上書きされたフレーム数
+
+        # GC
+        self._last_gc = time.ticks_ms()
+        self.idle_collects = 0  # 空き時間に行った GC の回数
+        self.render_worker = None
+        if render_thread:
+            from render_worker import RenderWorker
+            self.render_worker = RenderWorker(self.frame_interval_ms)
+            perf.add_source("render_worker", self.render_worker.stats)
+        perf.add_source("power", self.power.stats)
+        perf.add_source("log", log.stats)
+        perf.add_source("runtime", self.stats)
+
+        # ベル
+        self._bell_event = asyncio.Event()
+
+        self.tasks = []
+        Runtime.last = self
+
+    def set_monitor(self, monitor):
+        """期限の監視を始める (入力タスク・モード・描画のループを登録する)"""
+        self._input_slot = monitor.register("input")
+        self._mode_slot = monitor.register("mode")
+        # 描画スレッドを使う場合、描画は2つ目のコアで動く
+        self._render_slot = monitor.register("render", 1 if self.render_worker is not None else 0)
+        if self.render_worker is not None:
+            self.render_worker.set_monitor(monitor, self._render_slot, self.RENDER_BUDGET_MS)
+        self.monitor = monitor
+
+    def start(self):
+        """常駐タスクを起動する (イベントループの中で呼ぶ)"""
+        self.tasks = [asyncio.create_task(self._input_task())]
+        if not self.hw.has_bell_timer:
+            self.hw.set_bell_driver(self._bell_event.set)
+            self.tasks.append(asyncio.create_task(self._bell_task()))
+        if self.render_worker is not None:
+            self.render_worker.start()
+        else:
+            self.tasks.append(asyncio.create_task(self._render_task()))
+
+    # --- 入力 ---
+    async def _input_task(self):
+        hw = self.hw
+        pm = self.power
+        last_edges = hw.get_input_edges()
+        while True:
+            monitor = self.monitor
+            if monitor is not None:
+                # 期限を守れなかったループがあればウォッチドッグに餌をやらない
+                monitor.tick(self._input_slot)
+                monitor.check()
+            delta = hw.get_rotation_delta()
+            event = hw.get_button_event()
+            edges = hw.get_input_edges()
+            if edges != last_edges:
+                last_edges = edges
+                pm.activity()
+            if pm.ignoring_input():
+                # 画面を起こすための操作なので、モードには渡さない
+                delta = 0
+                event = None
+            if delta != 0:
+                self._delta += delta
+            if event is not None and len(self._events) < self.EVENT_QUEUE_SIZE:
+                self._events.append(event)
+            if delta != 0 or event is not None:
+                self._input_event.set()
+            # ハードウェアの入力を渡した後に読む (エンコーダ/ボタンを待たせない)
+            if self.remote is not None:
+                self.remote.poll()
+
+            pm.update()
+            # ログはここでまとめて出す (出力先が詰まっている時は次の周回に回す)
+            if log.count:
+                log.drain(self.LOG_LINES_PER_POLL)
+            if self.render_worker is not None and self.render_worker.rendered != self._rendered:
+                # 描画スレッドがフレームを出し終えた
+                self._rendered = self.render_worker.rendered
+                self._idle_collect()
+            if pm.can_sleep() and not hw.is_ringing() and not self._rendering():
+                if monitor is not None:
+                    monitor.expect(self._input_slot, pm.sleep_max_ms)
+                slept = pm.lightsleep()
+                if monitor is not None:
+                    # 眠っている間は他のループも動けないので、その分だけ期限を延ばす
+                    monitor.postpone(slept)
+                await sleep_ms(0)  # 他のタスクにも回す
+            else:
+                if monitor is not None:
+                    monitor.expect(self._input_slot, self.INPUT_POLL_MS)
+                await sleep_ms(self.INPUT_POLL_MS)
+
+    def post_event(self, event):
+        """
+        ボタン以外 (リモート操作など) からモードにイベントを渡す
+        ボタンのイベントと同じキューに入り、画面が消えていれば点ける
+        """
+        self.power.activity()
+        if len(self._events) < self.EVENT_QUEUE_SIZE:
+            self._events.append(event)
+        self._input_event.set()
+
+    def clear_input(self):
+        """溜まっている入力を捨てる (モード遷移直後の誤操作防止)"""
+        self._delta = 0
+        self._events.clear()
+        self._input_event.clear()
+
+    def take_input(self):
+        """
+        溜まっている入力を取り出す
+        Return:
+            list: [回転量, ボタンイベント (str or None)]
+                  (同じリストを使い回すので、すぐに取り出すこと)
+        """
+        taken = self._taken
+        taken[0] = self._delta
+        self._delta = 0
+        taken[1] = self._events.pop(0) if self._events else None
+        if not self._events:
+            self._input_event.clear()
+        return taken
+
+    async def wait_input(self, timeout_ms=None):
+        """
+        入力があるまで (または timeout_ms 経過まで) 待つ
+        Return:
+            list: [回転量, ボタンイベント]。タイムアウト時は [0, None] (take_input() を参照)
+        """
+        monitor = self.monitor
+        if monitor is not None:
+            # 前の入力の処理が終わった。次は入力を待つ間 (期限なし) か timeout_ms まで
+            monitor.tick(self._mode_slot)
+            monitor.expect(self._mode_slot, timeout_ms)
+        if self._delta == 0 and not self._events:
+            self._input_event.clear()
+            self._waiting = True
+            try:
+                if timeout_ms is None:
+                    self._wait_until = None
+                    await self._input_event.wait()
+                elif timeout_ms > 0:
+                    # asyncio.wait_for は待つたびにタスクとコルーチン (と秒の float) を作るので使わない。
+                    # 期限までを入力監視の周期ごとに区切って眠り、起きるたびに入力を見る
+                    # (MicroPython の sleep_ms は使い回しのジェネレータを返すので、待つ間もメモリを確保しない)
+                    until = time.ticks_add(time.ticks_ms(), timeout_ms)
+                    self._wait_until = until
+                    while not self._input_event.is_set():
+                        left = time.ticks_diff(until, time.ticks_ms())
+                        if left <= 0:
+                            break
+                        await sleep_ms(left if left < self.INPUT_POLL_MS else self.INPUT_POLL_MS)
+            finally:
+                self._waiting = False
+        if monitor is not None:
+            monitor.tick(self._mode_slot)
+            monitor.expect(self._mode_slot, self.MODE_BUDGET_MS)
+        return self.take_input()
+
+    # --- 描画 ---
+    def _rendering(self):
+        """描画スレッドが描画中か (描画中は lightsleep しない)"""
+        return self.render_worker is not None and self.render_worker.busy
+
+    def render(self, draw_func, *args):
+        """
+        描画を要求する (すぐに戻る)
+        描画タスクが追いつく前に次の要求が来た場合、古い要求は捨てられる
+        (描画スレッドを使う場合、描画が終わるまで args の中身を書き換えないこと)
+        """
+        self.render_args(draw_func, args)
+
+    def render_args(self, draw_func, args):
+        """
+        render() と同じ。引数をタプルかリストでまとめて渡す
+        (毎秒描く画面などで、使い回しのリストを渡して引数のタプルを作らないようにする)
+        """
+        if self.render_worker is not None:
+            self.render_worker.submit(draw_func, args)
+            return
+        if self._frame_func is not None:
+            self.frames_coalesced += 1
+        self._frame_func = draw_func
+        self._frame_args = args
+        self._frame_event.set()
+
+    def set_frame_interval(self, ms):
+        """描画の最短間隔 (ms) を変える。0 なら要求があり次第すぐ描く"""
+        self.frame_interval_ms = ms
+        if self.render_worker is not None:
+            self.render_worker.min_interval_ms = ms
+
+    async def _render_task(self):
+        while True:
+            await self._frame_event.wait()
+            self._frame_event.clear()
+            # 前のフレームから frame_interval_ms 経つまで待つ (その間の要求は最新の1つにまとまる)
+            wait = self.frame_interval_ms - time.ticks_diff(time.ticks_ms(), self._last_frame_ms)
+            if wait > 0:
+                await sleep_ms(wait)
+            func = self._frame_func
+            self._frame_func = None
+            if func is not None:
+                self._last_frame_ms = time.ticks_ms()
+                monitor = self.monitor
+                if monitor is not None:
+                    monitor.expect(self._render_slot, self.RENDER_BUDGET_MS)
+                func(*self._frame_args)
+                if monitor is not None:
+                    monitor.tick(self._render_slot)
+                self.frames_rendered += 1
+                self._idle_collect()
+
+    # --- GC ---
+    def _idle_collect(self):
+        """
+        フレームを出し終えた時に、何も差し迫っていなければ GC を行う
+        (メモリが足りなくなってから自動で GC が走ると、秒の切り替わりやベルの時刻に重なることがある)
+        """
+        now = time.ticks_ms()
+        if time.ticks_diff(now, self._last_gc) < self.GC_INTERVAL_MS:
+            return
+        # モードが入力待ちで、次の期限まで余裕があり、描画・入力・ベルの待ちが無い時だけ
+        if not self._waiting or self._frame_func is not None or self._rendering():
+            return
+        if self._delta != 0 or self._events or self.hw.is_ringing():
+            return
+        if self._wait_until is not None and time.ticks_diff(self._wait_until, now) < self.GC_MARGIN_MS:
+            return
+        perf.collect()
+        self._last_gc = time.ticks_ms()
+        self.idle_collects += 1
+
+    def stats(self):
+        if self.render_worker is not None:
+            rendered = self.render_worker.rendered
+            coalesced = self.render_worker.dropped
+        else:
+            rendered = self.frames_rendered
+            coalesced = self.frames_coalesced
+        return {
+            "frames_rendered": rendered,
+            "frames_coalesced": coalesced,
+            "frame_interval_ms": self.frame_interval_ms,
+            "idle_collects": self.idle_collects,
+        }
+
+    # --- ベル ---
+    async def _bell_task(self):
+        bell = self.hw.bell
+        while True:
+            await self._bell_event.wait()
+            self._bell_event.clear()
+            delay = bell.tick()
+            while delay is not None:
+                await sleep_ms(delay)
+                delay = bell.tick()
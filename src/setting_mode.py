@@ -1,77 +1,119 @@
 import time
 import hardware
 import display
+import perf
+import log
+import bells
+import runtime
+from menu import Menu
+from runtime import asyncio
 
 class SettingMode:
-    def __init__(self, hardware_interface):
+    REFRESH = -1  # 設定が外から (リモート操作で) 変わったので表示し直す
+
+    def __init__(self, hardware_interface, rt):
         self.hw = hardware_interface
-        # メニュー項目
-        self.items = [
-            "1st Bell (1)",
-            "2nd Bell (2)",
-            "3rd Bell (3)",
-            "START TIMER"
-        ]
-        self.cursor_index = 0
+        self.rt = rt
+        # メニュー (項目はベルの数に合わせて run() で設定する。文字列は描画側が見えている行の分だけ作る)
+        self._bell_settings = []
+        self._preset_name = None
+        self.menu = Menu("-- SETTING --", 1, self._label)
+
+    def _label(self, index):
+        """ベルごとの項目 (名前と鳴らす回数)、START TIMER、プリセットの順に並べた項目の文字列"""
+        bell_settings = self._bell_settings
+        if index < len(bell_settings):
+            strikes = bells.parse(bell_settings[index], index)[1]
+            return "{} ({})".format(bells.title(index), strikes)
+        if index == len(bell_settings):
+            return "START TIMER"
+        return "Preset " + self._preset_name
 
-    def run(self):
+    async def run(self, bell_settings, preset_name=None):
         """
-        メニュー画面ループ
+        メニュー画面ループ (コルーチン)
+        Args:
+            bell_settings (list): ベル設定 (項目の数と表示に使う)
+            preset_name (str): 使用中のプリセット名 (省略時はプリセット項目を出さない)
         Return:
             int: 選択されたアクションコード
-                 0-2: 設定項目のインデックス (編集へ)
-                 3:   タイマースタート
+                 0 - len(bell_settings)-1: 設定項目のインデックス (編集へ)
+                 len(bell_settings):       タイマースタート
+                 len(bell_settings)+1:     次のプリセットへ切り替え
+                 SettingMode.REFRESH:      設定が外から変わった (同じ引数で呼び直す)
         """
-        print("--- Setting Mode ---")
+        log.info("--- Setting Mode ---")
+        self._bell_settings = bell_settings
+        self._preset_name = preset_name
+        menu = self.menu
+        menu.reset(len(bell_settings) + (1 if preset_name is None else 2))
         
+        # 遷移前に溜まった入力は捨てる (遷移直後の誤操作防止)
+        self.rt.clear_input()
+
         # 画面初回描画
-        display.draw_menu_screen(self.cursor_index, self.items)
-        time.sleep(0.2) # 遷移直後の誤操作防止
+        self.rt.render(display.draw_menu_screen, menu)
 
+        t0 = 0
         while True:
+            # 入力があるまで待つ
+            delta, event = await self.rt.wait_input()
+            if perf.ENABLED:
+                t0 = time.ticks_us()
+
             # 1. 回転入力 (カーソル移動)
-            delta = self.hw.get_rotation_delta()
             if delta != 0:
-                # 項目数でループさせる
-                self.cursor_index = (self.cursor_index + delta) % len(self.items)
-                display.draw_menu_screen(self.cursor_index, self.items)
-                print(f"Cursor: {self.cursor_index}")
+                # 項目数でループさせる (描き直すのは変わった行だけ)
+                menu.move(delta)
+                self.rt.render(display.draw_menu_screen, menu)
+                log.debug("Cursor: {}", menu.cursor)
 
             # 2. ボタン入力 (決定)
-            event = self.hw.get_button_event()
             if event == "SHORT_PRESS":
-                print(f"Selected: {self.items[self.cursor_index]}")
-                return self.cursor_index
+                log.info("Selected: {}", menu.label(menu.cursor))
+                return menu.cursor
 
-            time.sleep(0.05)
+            # 3. リモート操作
+            if event == "REMOTE_START":
+                return len(bell_settings)
+            if event == "REFRESH":
+                return self.REFRESH
+
+            if perf.ENABLED:
+                perf.record("menu.loop", t0)
             
 if __name__ == "__main__":
     print("=== Setting Mode Test Start ===")
     print("エンコーダを回して項目選択、ボタンで決定してください。")
     print("Ctrl+C で終了します。")
 
-    try:
-        hw = hardware.HardwareInterface()
-    except Exception as e:
-        print(f"ハードウェア初期化エラー: {e}")
+    async def _test():
+        try:
+            hw = hardware.HardwareInterface()
+        except Exception as e:
+            print(f"ハードウェア初期化エラー: {e}")
 
-    app = SettingMode(hw)
+        rt = runtime.Runtime(hw)
+        rt.start()
+        app = SettingMode(hw, rt)
+        settings = [7, 10, 15]
 
-    try:
         while True:
             print("\n--- メニュー待機中 ---")
             
-            # ユーザーがボタンを押すまでここで処理がブロックされます
-            selected_index = app.run()
+            # ユーザーがボタンを押すまでここで待ちます
+            selected_index = await app.run(settings)
             
             # 結果の表示
-            if selected_index == 3:
+            if selected_index == len(settings):
                 print(f"結果: [START TIMER] が選択されました (Index: {selected_index})")
             else:
                 print(f"結果: 設定項目 [{selected_index}] が選択されました")
             
             # すぐに再ループするとチャタリングで誤作動しやすいので少し待つ
-            time.sleep(1.0)
+            await runtime.sleep_ms(1000)
 
+    try:
+        asyncio.run(_test())
     except KeyboardInterrupt:
         print("\nテストを終了します。")
\ No newline at end of file
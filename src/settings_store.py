@@ -0,0 +1,320 @@
+"""
+ベル設定の保存 (バイナリのログ形式)
+- 固定長 (32バイト) のレコードを、あらかじめ確保したファイルに追記していく
+- ファイルはフラッシュの消去ブロック単位のブロックに分かれ、書き込み位置は
+  ブロックを順番に一周する (同じ場所ばかり書き換えない)
+- 各ブロックの先頭には全プリセットのスナップショットを書くので、
+  起動時は最新のブロックを1つ読むだけで復元できる
+- レコードごとに CRC16 を付け、書きかけ (電源断) のレコードは読み飛ばす
+- put() / select() はメモリ上で更新するだけで、flush() でまとめて1回で書く
+
+レコードの形式 (リトルエンディアン):
+  magic(1) type(1) count(1) seq(4) name(8) bells(MAX_BELLS x [分(1) 回数(1)]) crc(2) pad(1)
+"""
+
+import struct
+import time
+from array import array
+
+import bells
+import log
+import watchdog
+
+STORE_FILE = "settings.bin"
+LEGACY_FILE = "settings.json"  # 以前の JSON 形式 (初回だけ取り込む)
+
+BLOCK_SIZE = 4096  # RP2040 のフラッシュの消去単位
+BLOCK_COUNT = 4
+RECORD_SIZE = 32
+SLOTS_PER_BLOCK = BLOCK_SIZE // RECORD_SIZE
+
+MAGIC = 0xB5
+TYPE_PRESET = 1  # プリセット (名前とベル設定)
+TYPE_ACTIVE = 2  # 使用中のプリセット名
+
+NAME_SIZE = 8
+MAX_BELLS = 7
+MAX_PRESETS = 16  # スナップショットが1ブロックに収まる数
+
+_HEADER = "<BBBI8s"
+_HEADER_SIZE = struct.calcsize(_HEADER)
+_CRC_OFFSET = _HEADER_SIZE + MAX_BELLS * 2
+
+DEFAULT_PRESET = "default"
+DEFAULT_PRESETS = (
+    (DEFAULT_PRESET, [7, 10, 15]),
+    ("lt5", [3, 4, 5]),        # 5分のライトニングトーク
+    ("talk20", [10, 15, 20]),  # 20分の発表
+)
+
+
+def _make_crc_table():
+    table = array("H", [0] * 256)
+    for i in range(256):
+        crc = i << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+        table[i] = crc & 0xFFFF
+    return table
+
+
+_CRC_TABLE = _make_crc_table()
+
+
+def crc16(data, length):
+    """CRC-16/CCITT-FALSE (data の先頭 length バイト)"""
+    crc = 0xFFFF
+    table = _CRC_TABLE
+    for i in range(length):
+        crc = ((crc << 8) & 0xFFFF) ^ table[((crc >> 8) ^ data[i]) & 0xFF]
+    return crc
+
+
+def encode_record(rtype, seq, name, bell_settings=()):
+    """レコード1つ分 (RECORD_SIZE バイト) を作る"""
+    if len(bell_settings) > MAX_BELLS:
+        raise ValueError("too many bells")
+    name_bytes = name.encode()
+    if len(name_bytes) > NAME_SIZE:
+        raise ValueError("preset name too long")
+    record = bytearray(RECORD_SIZE)
+    struct.pack_into(_HEADER, record, 0, MAGIC, rtype, len(bell_settings), seq, name_bytes)
+    for i, entry in enumerate(bell_settings):
+        minutes, strikes = bells.parse(entry, i)
+        record[_HEADER_SIZE + i * 2] = minutes
+        record[_HEADER_SIZE + i * 2 + 1] = strikes
+    struct.pack_into("<H", record, _CRC_OFFSET, crc16(record, _CRC_OFFSET))
+    return record
+
+
+def decode_record(record):
+    """
+    レコードを読む
+    Return:
+        (type, seq, name, bell_settings) 。空き領域や CRC 不一致なら None
+    """
+    if record[0] != MAGIC:
+        return None
+    if struct.unpack_from("<H", record, _CRC_OFFSET)[0] != crc16(record, _CRC_OFFSET):
+        return None
+    _, rtype, count, seq, name = struct.unpack_from(_HEADER, record, 0)
+    if count > MAX_BELLS:
+        return None
+    bell_settings = []
+    for i in range(count):
+        minutes = record[_HEADER_SIZE + i * 2]
+        strikes = record[_HEADER_SIZE + i * 2 + 1]
+        # 回数が順番どおりなら従来どおり分だけで持つ
+        bell_settings.append(minutes if strikes == i + 1 else [minutes, strikes])
+    return rtype, seq, name.rstrip(b"\x00").decode(), bell_settings
+
+
+class SettingsStore:
+    """
+    名前付きプリセットを保持する設定ストア
+    使い方:
+        store = SettingsStore()
+        bell_settings = store.load()     # 使用中のプリセット
+        store.put(store.active, [5, 8, 10])
+        store.flush()                    # 溜まった変更をまとめて書く
+    """
+
+    def __init__(self, path=STORE_FILE, legacy_path=LEGACY_FILE):
+        self.path = path
+        self.legacy_path = legacy_path
+        self.names = []    # プリセット名 (登録順)
+        self.presets = {}  # 名前 -> ベル設定
+        self.active = DEFAULT_PRESET
+
+        self._seq = 0
+        self._head = 0     # 次に書くスロット
+        self._dirty = []   # flush() で書くレコード [(type, name), ...]
+        self.last_put_ms = 0
+
+        # 計測用
+        self.bytes_written = 0
+        self.flush_count = 0
+
+    @property
+    def dirty(self):
+        return bool(self._dirty)
+
+    # --- 読み込み ---
+    def load(self):
+        """
+        ファイルから復元する。無ければ作成し、旧 JSON 設定かデフォルトを入れる
+        Return:
+            list: 使用中のプリセットのベル設定
+        """
+        try:
+            f = open(self.path, "rb")
+        except OSError:
+            self._create()
+            return self.get()
+        with f:
+            self._restore(f)
+        if not self.names:
+            # 全ブロックが壊れていた
+            self._set_defaults()
+        log.info("設定をロードしました: {} {}", self.active, self.get())
+        return self.get()
+
+    def _restore(self, f):
+        # 各ブロック先頭のスナップショットから最新のブロックを探す
+        record = bytearray(RECORD_SIZE)
+        newest_block = -1
+        newest_seq = -1
+        for block in range(BLOCK_COUNT):
+            f.seek(block * BLOCK_SIZE)
+            if f.readinto(record) != RECORD_SIZE:
+                break
+            decoded = decode_record(record)
+            if decoded is not None and decoded[1] > newest_seq:
+                newest_block = block
+                newest_seq = decoded[1]
+        if newest_block < 0:
+            return
+
+        # 最新のブロックを、前の周回の古いレコードに当たるまで読む
+        f.seek(newest_block * BLOCK_SIZE)
+        slot = 0
+        last_seq = newest_seq - 1
+        while slot < SLOTS_PER_BLOCK:
+            if f.readinto(record) != RECORD_SIZE:
+                break
+            decoded = decode_record(record)
+            if decoded is None or decoded[1] <= last_seq:
+                break
+            rtype, last_seq, name, bell_settings = decoded
+            if rtype == TYPE_PRESET:
+                self._set_preset(name, bell_settings)
+            elif rtype == TYPE_ACTIVE:
+                self.active = name
+            slot += 1
+        self._seq = last_seq + 1
+        self._head = newest_block * SLOTS_PER_BLOCK + slot
+        if self.active not in self.presets and self.names:
+            self.active = self.names[0]
+
+    def _create(self):
+        """ファイルを消去済み (0xFF) の状態で確保し、初期値を書く"""
+        chunk = b"\xff" * RECORD_SIZE * 8
+        with open(self.path, "wb") as f:
+            for _ in range(BLOCK_COUNT * BLOCK_SIZE // len(chunk)):
+                f.write(chunk)
+        self._head = 0
+        self._set_defaults()
+        legacy = self._load_legacy()
+        if legacy is not None:
+            self.put(DEFAULT_PRESET, legacy)
+        self.flush()
+
+    def _load_legacy(self):
+        try:
+            import json
+            with open(self.legacy_path, "r") as f:
+                data = json.load(f)
+            log.info("旧設定ファイルを取り込みます: {}", data)
+            return data
+        except (OSError, ValueError):
+            return None
+
+    def _set_defaults(self):
+        for name, bell_settings in DEFAULT_PRESETS:
+            self.put(name, list(bell_settings))
+        self.select(DEFAULT_PRESET)
+
+    def _set_preset(self, name, bell_settings):
+        if name not in self.presets:
+            self.names.append(name)
+        self.presets[name] = bell_settings
+
+    # --- 参照と変更 (メモリ上のみ) ---
+    def get(self, name=None):
+        """プリセットのベル設定 (省略時は使用中のもの)"""
+        return self.presets[self.active if name is None else name]
+
+    def put(self, name, bell_settings):
+        """プリセットを追加/更新する (flush() まで書き込まない)"""
+        if name not in self.presets and len(self.names) >= MAX_PRESETS:
+            raise ValueError("too many presets")
+        # 書き込めない値はここで弾く
+        encode_record(TYPE_PRESET, 0, name, bell_settings)
+        self._set_preset(name, list(bell_settings))
+        self._mark_dirty(TYPE_PRESET, name)
+
+    def select(self, name):
+        """使用するプリセットを切り替える"""
+        if name not in self.presets:
+            raise KeyError(name)
+        if name != self.active:
+            self.active = name
+            self._mark_dirty(TYPE_ACTIVE, name)
+        return self.get()
+
+    def next_preset(self):
+        """登録順で次のプリセットの名前"""
+        i = self.names.index(self.active) if self.active in self.names else -1
+        return self.names[(i + 1) % len(self.names)]
+
+    def _mark_dirty(self, rtype, name):
+        if rtype == TYPE_ACTIVE:
+            self._dirty = [d for d in self._dirty if d[0] != TYPE_ACTIVE]
+        key = (rtype, name)
+        if key not in self._dirty:
+            self._dirty.append(key)
+        self.last_put_ms = time.ticks_ms()
+
+    # --- 書き込み ---
+    def _snapshot(self):
+        keys = [(TYPE_PRESET, name) for name in self.names]
+        keys.append((TYPE_ACTIVE, self.active))
+        return keys
+
+    def flush(self):
+        """
+        溜まった変更をまとめて1回で書き込む
+        ブロックの先頭に来た時、または残りに収まらない時は次のブロックへ進み、
+        全プリセットのスナップショットを書く
+        Return:
+            int: 書き込んだバイト数
+        """
+        if not self._dirty:
+            return 0
+        keys = self._dirty
+        offset = self._head % SLOTS_PER_BLOCK
+        if offset == 0 or offset + len(keys) > SLOTS_PER_BLOCK:
+            if offset != 0:
+                self._head += SLOTS_PER_BLOCK - offset
+            self._head %= BLOCK_COUNT * SLOTS_PER_BLOCK
+            keys = self._snapshot()
+
+        data = bytearray()
+        for rtype, name in keys:
+            bell_settings = self.presets[name] if rtype == TYPE_PRESET else ()
+            data.extend(encode_record(rtype, self._seq, name, bell_settings))
+            self._seq += 1
+
+        watchdog.enter(watchdog.FLASH)
+        try:
+            with open(self.path, "r+b") as f:
+                f.seek(self._head * RECORD_SIZE)
+                f.write(data)
+        finally:
+            watchdog.leave()
+        self._head += len(keys)
+        self._dirty = []
+        self.bytes_written += len(data)
+        self.flush_count += 1
+        log.info("設定を保存しました: {} {}", self.active, self.get())
+        return len(data)
+
+
+if __name__ == "__main__":
+    store = SettingsStore()
+    store.load()
+    print("プリセット:", [(name, store.get(name)) for name in store.names])
+    store.put(store.active, [5, 8, 10])
+    store.put("talk20", [[10, 1], [15, 2], [18, 2], [20, 3]])
+    store.flush()
+    print("書き込み:", store.bytes_written, "バイト")
@@ -0,0 +1,40 @@
+"""
+起動時間の記録 (ブートタイムライン)
+main.py の一番最初に import し、節目ごとに mark() する。
+MicroPython の ticks はリセット時に 0 から数え始めるので、記録はリセットからの時間になる。
+
+主な節目:
+  first_pixel:  最初の画面 (スプラッシュ) を転送し終えた
+  interactive:  入力を受け付けて最初のモードが動き始めた
+"""
+
+import time
+
+# (節目の名前, ticks_us) 。節目の数は決まっているのでこれ以上は増えない
+marks = [("import", time.ticks_us())]
+
+
+def mark(name):
+    """節目を記録する (同じ名前は最初の1回だけ)"""
+    if get(name) is None:
+        marks.append((name, time.ticks_us()))
+
+
+def get(name):
+    """節目の時刻 (リセットからの ms)。まだなら None"""
+    for mark_name, t in marks:
+        if mark_name == name:
+            return t / 1000
+    return None
+
+
+def report():
+    """節目ごとのリセットからの時間 (ms)"""
+    return {name: t / 1000 for name, t in marks}
+
+
+def dump():
+    prev = 0
+    for name, t in marks:
+        print("{:<14} {:>9.1f} ms  (+{:.1f})".format(name, t / 1000, (t - prev) / 1000))
+        prev = t
@@ -0,0 +1,288 @@
+"""
+セッションの記録 (フラッシュ上のリングログ)
+タイマーを1回動かすごとに、開始時刻・一時停止・ベルの予定と実際の時刻・終わり方を
+固定長 (128バイト) のレコード1つにまとめ、あらかじめ確保したファイルに巡回して書く
+(古いものから上書きされる。RECORD_COUNT 回分が残る)。
+
+- 計測中は RAM 上の配列に書き込むだけで、ファイルには書かない
+- セッションを終えるとレコードを組み立てて溜めておき、flush() でまとめて書く
+  (main の autosave が、ベルを鳴らし終えて次の計測が始まっていない時に呼ぶ)
+- export() で全レコードを16進数の行にする (リモート操作の export コマンドが、出力先が詰まっていない時に
+  少しずつ出力する)。PC 側では host/telemetry_decode.py で読む
+
+レコードの形式 (リトルエンディアン):
+  magic(1) status(1) planned_s(2) seq(4) start_time(4) start_ms(4) run_ms(4) paused_ms(4)
+  end_offset_ms(4, 符号付き) name(12) pause_count(1) bell_count(1)
+  pauses(MAX_PAUSES x [開始時の経過秒(2) 長さ秒(2)])
+  bells(MAX_BELLS x [予定の経過秒(2) 予定とのずれms(2, 符号付き。鳴らなかったら MISSED)])
+  crc(2) pad
+  status は TimerStatus の値。start_time は time.time() (RTC が合っていなければ起動日時ではない)、
+  start_ms は起動からの ms。経過は一時停止を除いた時間。
+  end_offset_ms は終了予定時刻から終えた時刻までの差。タイマーは 0 で止まるので、0 まで計った
+  セッションでは終わりに気づいた遅れでしかなく、予定を超えて話した時間 (超過) は記録していない。
+"""
+
+import binascii
+import struct
+import time
+from array import array
+
+import log
+import watchdog
+from settings_store import crc16
+
+TELEMETRY_FILE = "telemetry.bin"
+
+RECORD_SIZE = 128
+RECORD_COUNT = 64   # ファイルは 8KB
+PENDING_MAX = 4     # 書き込む前に溜めておけるレコード数 (超えたら古いものを捨てる)
+
+MAGIC = 0xC7
+NAME_SIZE = 12
+MAX_PAUSES = 8      # 区間を残す一時停止の数 (回数はそれ以上も数える)
+MAX_BELLS = 7
+MISSED = -32768     # 鳴らなかったベル
+
+_HEADER = "<BbHIIIIIi12sBB"
+_HEADER_SIZE = struct.calcsize(_HEADER)
+_PAUSES_OFFSET = _HEADER_SIZE
+_BELLS_OFFSET = _PAUSES_OFFSET + MAX_PAUSES * 4
+_CRC_OFFSET = _BELLS_OFFSET + MAX_BELLS * 4
+
+
+def decode_record(record):
+    """
+    レコードを読む
+    Return:
+        dict: レコードの内容。空き領域や CRC 不一致なら None
+    """
+    if record[0] != MAGIC:
+        return None
+    if struct.unpack_from("<H", record, _CRC_OFFSET)[0] != crc16(record, _CRC_OFFSET):
+        return None
+    (_, status, planned_s, seq, start_time, start_ms, run_ms, paused_ms, end_offset_ms,
+     name, pause_count, bell_count) = struct.unpack_from(_HEADER, record, 0)
+    pauses = []
+    for i in range(min(pause_count, MAX_PAUSES)):
+        pauses.append(struct.unpack_from("<HH", record, _PAUSES_OFFSET + i * 4))
+    bell_list = []
+    for i in range(min(bell_count, MAX_BELLS)):
+        scheduled_s, error_ms = struct.unpack_from("<Hh", record, _BELLS_OFFSET + i * 4)
+        bell_list.append((scheduled_s, None if error_ms == MISSED else error_ms))
+    return {
+        "seq": seq, "status": status, "name": name.rstrip(b"\x00").decode(),
+        "start_time": start_time, "start_ms": start_ms, "planned_s": planned_s,
+        "run_ms": run_ms, "paused_ms": paused_ms, "end_offset_ms": end_offset_ms,
+        "pause_count": pause_count, "pauses": pauses, "bells": bell_list,
+    }
+
+
+def _export_lines(records, pending):
+    """export() の行を1行ずつ作る (records は _read_all() の結果、pending は seq と CRC を付けたレコード)"""
+    for _, record in records:
+        yield "T " + binascii.hexlify(record).decode()
+    for record in pending:
+        yield "T " + binascii.hexlify(record).decode()
+
+
+class SessionLog:
+    """
+    タイマーのセッションを記録するクラス
+    使い方 (PresentationTimerMode から):
+        session_log.begin("Keynote", schedule)   # 計測を始めた時
+        session_log.pause(elapsed_ms) / resume()
+        session_log.bell(index, elapsed_ms)      # ベルを鳴らした時
+        session_log.end(status, end_offset_ms)   # レコードを組み立てて溜める
+        session_log.flush()                      # 溜めたレコードを書く (計測中でない時に)
+    """
+
+    def __init__(self, path=TELEMETRY_FILE):
+        self.path = path
+        self.recording = False  # begin() から end() まで
+
+        # 計測中のセッション (毎回作らずに使い回す)
+        self._name = ""
+        self._planned_s = 0
+        self._start_time = 0
+        self._start_ms = 0
+        self._paused_ms = 0
+        self._paused_at = None       # 一時停止した時刻 (ticks_ms)。停止中でなければ None
+        self._pause_count = 0
+        self._pauses = array("H", [0] * (MAX_PAUSES * 2))
+        self._bell_count = 0
+        self._bell_scheduled = array("H", [0] * MAX_BELLS)
+        self._bell_error = array("h", [MISSED] * MAX_BELLS)
+
+        self._pending = []   # まだ書いていないレコード
+        self._seq = None     # 次のレコードの番号 (最初の flush() でファイルを調べる)
+
+        # 計測用
+        self.records_written = 0
+        self.records_dropped = 0
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    # --- 計測中 (RAM 上の配列に書くだけ) ---
+    def begin(self, name, schedule):
+        """
+        セッションの記録を始める
+        Args:
+            name (str): セッション名 (アジェンダのタイトルやプリセット名)
+            schedule (list): bells.compile_schedule() の結果
+        """
+        self._name = name or ""
+        self._planned_s = schedule[-1][0] // 1000 if schedule else 0
+        self._start_time = int(time.time())
+        self._start_ms = time.ticks_ms()
+        self._paused_ms = 0
+        self._paused_at = None
+        self._pause_count = 0
+        self._bell_count = min(len(schedule), MAX_BELLS)
+        for i in range(self._bell_count):
+            self._bell_scheduled[i] = schedule[i][0] // 1000
+            self._bell_error[i] = MISSED
+        self.recording = True
+
+    def pause(self, elapsed_ms):
+        """一時停止した (elapsed_ms は一時停止を除いた開始からの時間)"""
+        if not self.recording:
+            return
+        self._paused_at = time.ticks_ms()
+        if self._pause_count < MAX_PAUSES:
+            self._pauses[self._pause_count * 2] = min(elapsed_ms // 1000, 0xFFFF)
+            self._pauses[self._pause_count * 2 + 1] = 0
+        if self._pause_count < 255:
+            self._pause_count += 1
+
+    def resume(self):
+        """一時停止から再開した"""
+        if not self.recording or self._paused_at is None:
+            return
+        paused_ms = time.ticks_diff(time.ticks_ms(), self._paused_at)
+        self._paused_at = None
+        self._paused_ms += paused_ms
+        i = self._pause_count - 1
+        if i < MAX_PAUSES:
+            self._pauses[i * 2 + 1] = min(paused_ms // 1000, 0xFFFF)
+
+    def bell(self, index, elapsed_ms):
+        """スケジュールの index 番目のベルを鳴らした"""
+        if not self.recording or index >= self._bell_count:
+            return
+        error = elapsed_ms - self._bell_scheduled[index] * 1000
+        self._bell_error[index] = max(-32767, min(32767, error))
+
+    def end(self, status, end_offset_ms):
+        """
+        セッションを終えてレコードを溜める (まだ書かない)
+        Args:
+            status (int): TimerStatus の値
+            end_offset_ms (int): 終了予定時刻 (一時停止分を含む) から終えた時刻までの差 (負なら予定より早い。
+                0 まで計った場合は終わりに気づいた遅れで、超過の時間ではない)
+        """
+        if not self.recording:
+            return
+        self.resume()  # 一時停止中に終えた場合はその時間も数える (recording を下ろす前に)
+        self.recording = False
+        record = bytearray(RECORD_SIZE)
+        name = self._name.encode()[:NAME_SIZE]
+        struct.pack_into(
+            _HEADER, record, 0, MAGIC, status, self._planned_s, 0, self._start_time,
+            self._start_ms, time.ticks_diff(time.ticks_ms(), self._start_ms), self._paused_ms,
+            end_offset_ms, name, self._pause_count, self._bell_count)
+        for i in range(min(self._pause_count, MAX_PAUSES)):
+            struct.pack_into("<HH", record, _PAUSES_OFFSET + i * 4,
+                             self._pauses[i * 2], self._pauses[i * 2 + 1])
+        for i in range(self._bell_count):
+            struct.pack_into("<Hh", record, _BELLS_OFFSET + i * 4,
+                             self._bell_scheduled[i], self._bell_error[i])
+        if len(self._pending) >= PENDING_MAX:
+            self._pending.pop(0)
+            self.records_dropped += 1
+        self._pending.append(record)
+
+    # --- ファイル ---
+    def _read_all(self):
+        """ファイルの全レコードを seq の順に返す [(seq, record), ...]"""
+        records = []
+        try:
+            f = open(self.path, "rb")
+        except OSError:
+            return records
+        with f:
+            while True:
+                record = f.read(RECORD_SIZE)
+                if len(record) < RECORD_SIZE:
+                    break
+                if record[0] == MAGIC and decode_record(record) is not None:
+                    records.append((struct.unpack_from("<I", record, 4)[0], record))
+        records.sort(key=lambda r: r[0])
+        return records
+
+    def _create_if_missing(self):
+        try:
+            open(self.path, "rb").close()
+        except OSError:
+            with open(self.path, "wb") as f:
+                empty = bytearray(RECORD_SIZE)
+                for _ in range(RECORD_COUNT):
+                    f.write(empty)
+
+    def _next_seq(self, records):
+        if self._seq is not None:
+            return self._seq
+        return records[-1][0] + 1 if records else 0
+
+    def flush(self):
+        """
+        溜めたレコードをまとめて書く (計測中には呼ばないこと)
+        Return:
+            int: 書いたレコード数
+        """
+        if not self._pending:
+            return 0
+        if self._seq is None:
+            self._create_if_missing()
+            self._seq = self._next_seq(self._read_all())
+
+        count = len(self._pending)
+        watchdog.enter(watchdog.FLASH)
+        try:
+            with open(self.path, "r+b") as f:
+                for record in self._pending:
+                    struct.pack_into("<I", record, 4, self._seq)
+                    struct.pack_into("<H", record, _CRC_OFFSET, crc16(record, _CRC_OFFSET))
+                    f.seek((self._seq % RECORD_COUNT) * RECORD_SIZE)
+                    f.write(record)
+                    self._seq += 1
+        finally:
+            watchdog.leave()
+        self._pending = []
+        self.records_written += count
+        log.info("セッションの記録を書きました: {}件", count)
+        return count
+
+    def export(self):
+        """
+        全レコード (書き込み前のものも含む) を古い順に "T <16進数>" の行にする
+        (ここでは出力しない。行は取り出す時に1行ずつ作るので、出力が詰まっていても溜め込まない)
+        Return:
+            (int, iterator): レコード数と、行を返す iterator
+        """
+        records = self._read_all()
+        seq = self._next_seq(records)
+        pending = []
+        for record in self._pending:
+            # 書き込み前のレコードは seq と CRC が未設定なので、ここで仮に付けて出す
+            record = bytearray(record)
+            struct.pack_into("<I", record, 4, seq)
+            seq += 1
+            struct.pack_into("<H", record, _CRC_OFFSET, crc16(record, _CRC_OFFSET))
+            pending.append(record)
+        return len(records) + len(pending), _export_lines(records, pending)
+
+    def stats(self):
+        return {"written": self.records_written, "dropped": self.records_dropped,
+                "pending": len(self._pending)}
@@ -0,0 +1,342 @@
+"""
+ループの期限監視とウォッチドッグ
+モードのループや入力タスクが止まると、タイマーの表示もベルも黙って止まってしまう。
+各ループは「次にいつまでに戻ってくるか」を DeadlineMonitor に伝え (expect)、戻ってきたら知らせる (tick)。
+入力タスクが毎周 check() を呼び、すべてのループが期限を守っている時だけ machine.WDT に餌をやる
+(止まったままなら WDT_TIMEOUT_MS でリセットされる)。
+
+- 期限を GRACE_MS 以上過ぎた (ストール) ら、その間にそのループのコアで長く掛かっていたサブシステム
+  (I2C の転送、GC、フラッシュへの書き込み) を記録する。遅かったものから STALL_KEEP 件を
+  stalls.bin に残す (ソフトリセットや電源を切っても残る。書き込みは main の autosave が行う)
+- 処理中のサブシステムと計測中のセッション (経過時間、一時停止中か、アジェンダの何番目か) は
+  RP2040 のウォッチドッグのスクラッチレジスタにも書いておく。ここはウォッチドッグのリセットでは消えないので、
+  リセット後の起動で「何の最中に止まったか」を記録し、計測中だったセッションを途中から再開できる
+
+スクラッチレジスタへの書き込み (enter() / leave() / checkpoint()) は DeadlineMonitor.start() で
+ウォッチドッグを動かすまで何もしない (main.WATCHDOG = False ならフラッシュやベルの度の書き込みも無い)。
+リセット前の状態は DeadlineMonitor.restore() で読む。rp2 では machine.reset() もウォッチドッグの
+リセットとして報告されるので、意図して止める時 (release()) はセッションの記録を消してからにする。
+
+サブシステムの印は enter() / leave() (コアごとに別々に覚えるので描画スレッドからも呼べる。
+メモリを確保しない。入れ子にはしない。割り込みハンドラからは呼ばない):
+    watchdog.enter(watchdog.I2C)
+    try:
+        ...
+    finally:
+        watchdog.leave()
+"""
+
+import struct
+import time
+from array import array
+
+import machine
+import log
+
+WDT_TIMEOUT_MS = 8000  # RP2040 の上限は約8.3秒
+GRACE_MS = 250         # 期限からこれ以上遅れたらストールとみなす
+
+KEEPALIVE_MS = 1000    # release() の後にタイマーで餌をやる間隔
+
+STALL_FILE = "stalls.bin"
+STALL_KEEP = 8         # 残すストールの記録の数 (遅かった順)
+
+# --- サブシステム ---
+IDLE = 0
+I2C = 1
+BELL = 2   # ベルはタイマー割り込みで鳴らすので印は付けない (stalls.bin の記録を読むために番号は残す)
+GC = 3
+FLASH = 4
+RENDER = 5
+NAMES = ("loop", "i2c", "bell", "gc", "flash", "render", "reset")
+RESET = 6  # ウォッチドッグのリセット (記録の種類として使う)
+
+# --- スクラッチレジスタ (WATCHDOG_BASE + SCRATCH0..3。SCRATCH4-7 はブートROMが使う) ---
+_SCRATCH = 0x4005800C
+_SCR_SESSION = _SCRATCH       # MAGIC | アジェンダの番号 << 4 | 一時停止中 << 1 | 計測中
+_SCR_ELAPSED = _SCRATCH + 4   # セッションの経過時間 (ms。一時停止は除く)
+_SCR_ACTIVE = _SCRATCH + 8    # コア0で処理中のサブシステム << 24 | 開始時刻 (ms の下位24bit)
+_SCR_STALL = _SCRATCH + 12    # 期限を過ぎているループ: MAGIC | ループ << 8 | サブシステム
+_MAGIC = 0x2E5E0000           # small int に収まる値 (書き込みでメモリを確保しない)
+_MAGIC_MASK = 0x3FFF0000
+
+# どちらのコアで動いているか (SIO の CPUID レジスタ。0 か 1)
+_CPUID = 0xD0000000
+
+_STALL_RECORD = "<IIB11s"     # 遅れ(ms) time.time() サブシステム ループ名
+_STALL_SIZE = struct.calcsize(_STALL_RECORD)
+
+_running = False  # DeadlineMonitor.start() でウォッチドッグを動かした (それまではスクラッチに書かない)
+
+# コアごとの処理中のサブシステムと、直近の長かった区間 (ストールの原因の推定に使う)
+# 2つのコアが同じ場所を書き合わないように、コアの番号の位置にだけ書く
+active = bytearray(2)
+_active_ms = array("i", [0, 0])
+_long_sub = bytearray(2)
+_long_end_ms = array("i", [0, 0])
+
+
+def enter(sub):
+    """サブシステムの処理を始める"""
+    if not _running:
+        return
+    core = machine.mem32[_CPUID] & 1
+    now = time.ticks_ms()
+    active[core] = sub
+    _active_ms[core] = now
+    if core == 0:
+        # コア1 (描画スレッド) が止まった時は、コア0の check() が先に見つけて _SCR_STALL に書く
+        machine.mem32[_SCR_ACTIVE] = (sub << 24) | (now & 0xFFFFFF)
+
+
+def leave():
+    """サブシステムの処理を終える (GRACE_MS の半分以上掛かった区間は原因の候補として覚えておく)"""
+    if not _running:
+        return
+    core = machine.mem32[_CPUID] & 1
+    now = time.ticks_ms()
+    if time.ticks_diff(now, _active_ms[core]) >= GRACE_MS // 2:
+        _long_sub[core] = active[core]
+        _long_end_ms[core] = now
+    active[core] = IDLE
+    if core == 0:
+        machine.mem32[_SCR_ACTIVE] = 0
+
+
+# --- セッションの再開用 ---
+def checkpoint(elapsed_ms, paused, agenda_index=0):
+    """計測中のセッションの状態をスクラッチレジスタに書く (メモリを確保しない)"""
+    if not _running:
+        return
+    machine.mem32[_SCR_ELAPSED] = elapsed_ms
+    machine.mem32[_SCR_SESSION] = _MAGIC | (agenda_index << 4) | (2 if paused else 0) | 1
+
+
+def clear_session():
+    if _running:
+        machine.mem32[_SCR_SESSION] = 0
+
+
+def _read_scratch():
+    """
+    ウォッチドッグのリセットで再起動した場合に、リセット前の状態を読んで消す
+    (start() より前に読む。それまではスクラッチに何も書かないので、起動中の転送などで上書きされない)
+    Return:
+        (session, stall): session は (経過ms, 一時停止中, アジェンダの番号) か None、
+                          stall は (ループの番号, サブシステム) か None
+    """
+    session = stall = None
+    if machine.reset_cause() == machine.WDT_RESET:
+        word = machine.mem32[_SCR_SESSION]
+        if word & _MAGIC_MASK == _MAGIC and word & 1:
+            session = (machine.mem32[_SCR_ELAPSED], bool(word & 2), (word >> 4) & 0xFFF)
+        word = machine.mem32[_SCR_STALL]
+        if word & _MAGIC_MASK == _MAGIC:
+            stall = ((word >> 8) & 0xFF, word & 0xFF)
+        else:
+            # 期限切れを検出する前に止まった: 止まった時に処理中だったサブシステム
+            stall = (0xFF, (machine.mem32[_SCR_ACTIVE] >> 24) & 0xFF)
+    for addr in (_SCR_SESSION, _SCR_ELAPSED, _SCR_ACTIVE, _SCR_STALL):
+        machine.mem32[addr] = 0
+    return session, stall
+
+
+class DeadlineMonitor:
+    """
+    ループの期限を監視して、守られている間だけウォッチドッグに餌をやるクラス
+    使い方:
+        monitor = DeadlineMonitor()
+        session = monitor.restore()       # ウォッチドッグのリセット後なら再開するセッション
+        slot = monitor.register("timer")
+        monitor.expect(slot, 1000)        # 1秒以内に戻ってくる (None なら期限なし)
+        monitor.tick(slot)                # 戻ってきた
+        monitor.postpone(500)             # イベントループを止めて 500ms 眠っていた (コア0 の期限を延ばす)
+        monitor.start()                   # WDT を動かす (以後 check() が餌をやる)
+        watchdog.release()                # Ctrl-C で REPL に戻る時 (以後はタイマーが餌をやる)
+    """
+
+    MAX_LOOPS = 8
+    last = None  # start() したインスタンス (release() が使う)
+
+    def __init__(self, path=STALL_FILE):
+        self.path = path
+        self.names = []
+        self._deadline = array("i", [0] * self.MAX_LOOPS)
+        self._since = array("i", [0] * self.MAX_LOOPS)     # 期限を設定した時刻
+        self._armed = bytearray(self.MAX_LOOPS)
+        self._late = bytearray(self.MAX_LOOPS)             # check() で期限切れを見つけた
+        self._core = bytearray(self.MAX_LOOPS)             # ループが動くコア
+        self.wdt = None
+        self._keepalive = None  # release() 後に餌をやる machine.Timer
+        self.stalls = []     # [(遅れms, time.time(), サブシステム, ループ名), ...] 遅い順
+        self.dirty = False   # stalls を書いていない
+
+        # 計測用
+        self.feeds = 0
+        self.starved = 0     # 期限切れのループがあって餌をやらなかった回数
+        self.overruns = 0
+
+    def register(self, name, core=0):
+        """
+        ループを登録する (core はそのループが動くコア。ストールの原因はそのコアの処理から探す)
+        Return: スロット番号
+        """
+        self._core[len(self.names)] = core
+        self.names.append(name)
+        return len(self.names) - 1
+
+    # --- ループから ---
+    def expect(self, slot, ms):
+        """次の tick() を ms 以内に呼ぶ (None なら期限なし。入力を待つだけの間など)"""
+        if ms is None:
+            self._armed[slot] = 0
+            return
+        now = time.ticks_ms()
+        self._since[slot] = now
+        self._deadline[slot] = time.ticks_add(now, ms + GRACE_MS)
+        self._armed[slot] = 1
+
+    def postpone(self, ms):
+        """
+        コア0 のループの期限を ms 延ばす (入力タスクが眠ってイベントループを止めていた分。
+        その間に起きられなかったループをストールとして記録しない)
+        """
+        for slot in range(len(self.names)):
+            if self._armed[slot] and not self._core[slot]:
+                self._deadline[slot] = time.ticks_add(self._deadline[slot], ms)
+
+    def tick(self, slot):
+        """ループが戻ってきた。期限を過ぎていればストールとして記録する"""
+        if not self._armed[slot]:
+            return
+        now = time.ticks_ms()
+        late = time.ticks_diff(now, self._deadline[slot])
+        self._armed[slot] = 0
+        if late > 0 or self._late[slot]:
+            self._late[slot] = 0
+            self._stall(slot, late + GRACE_MS, now)
+
+    def _stall(self, slot, late_ms, now):
+        """ストールを記録する (この間に長く掛かっていたサブシステムのせいにする)"""
+        self.overruns += 1
+        core = self._core[slot]
+        sub = active[core]
+        if sub == IDLE and time.ticks_diff(_long_end_ms[core], self._since[slot]) >= 0:
+            sub = _long_sub[core]
+        machine.mem32[_SCR_STALL] = 0
+        self._add(late_ms, sub, self.names[slot])
+        log.warn("ストール: {} {}ms ({})", self.names[slot], late_ms, NAMES[sub])
+
+    def check(self):
+        """
+        期限切れのループが無ければウォッチドッグに餌をやる (入力タスクから毎周呼ぶ)
+        Return:
+            bool: 餌をやった
+        """
+        now = time.ticks_ms()
+        for slot in range(len(self.names)):
+            if self._armed[slot] and time.ticks_diff(now, self._deadline[slot]) > 0:
+                if not self._late[slot]:
+                    # まだ戻ってこない。リセットされても分かるようにスクラッチに書いておく
+                    self._late[slot] = 1
+                    machine.mem32[_SCR_STALL] = _MAGIC | (slot << 8) | active[self._core[slot]]
+                self.starved += 1
+                return False
+        if self.wdt is not None:
+            self.wdt.feed()
+            self.feeds += 1
+        return True
+
+    def start(self):
+        """ウォッチドッグを動かす (一度動かすと止められない。以後スクラッチレジスタに状態を書く)"""
+        global _running
+        if self.wdt is None:
+            self.wdt = machine.WDT(timeout=WDT_TIMEOUT_MS)
+        DeadlineMonitor.last = self
+        _running = True
+
+    def keep_alive(self):
+        """ループの監視をやめて、以後は machine.Timer で餌をやり続ける (release() を参照)"""
+        if self.wdt is None or self._keepalive is not None:
+            return
+        wdt = self.wdt
+        self.wdt.feed()
+        self._keepalive = machine.Timer(period=KEEPALIVE_MS, mode=machine.Timer.PERIODIC,
+                                        callback=lambda t: wdt.feed())
+
+    # --- 記録 ---
+    def _add(self, late_ms, sub, name):
+        stalls = self.stalls
+        if len(stalls) >= STALL_KEEP and late_ms <= stalls[-1][0]:
+            return
+        stalls.append((late_ms, int(time.time()), sub, name))
+        stalls.sort(key=lambda r: -r[0])
+        del stalls[STALL_KEEP:]
+        self.dirty = True
+
+    def restore(self):
+        """
+        保存したストールの記録を読み、ウォッチドッグのリセット後ならその時の状態を取り出す
+        Return:
+            (int, bool, int): 再開するセッション (経過ms, 一時停止中, アジェンダの番号)。無ければ None
+        """
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+            for offset in range(0, len(data) - _STALL_SIZE + 1, _STALL_SIZE):
+                late_ms, t, sub, name = struct.unpack_from(_STALL_RECORD, data, offset)
+                if late_ms:
+                    self.stalls.append((late_ms, t, sub, name.rstrip(b"\x00").decode()))
+        except (OSError, ValueError):
+            pass
+        session, stall = _read_scratch()
+        if stall is not None:
+            loop, sub = stall
+            name = self.names[loop] if loop < len(self.names) else "reset"
+            log.warn("ウォッチドッグのリセットから復帰しました: {} ({})", name,
+                     NAMES[sub] if sub < len(NAMES) else sub)
+            # 遅れは分からないので、リセットまでの時間として記録する
+            self._add(WDT_TIMEOUT_MS, sub if sub != IDLE else RESET, name)
+        return session
+
+    def save(self):
+        """ストールの記録を書く (計測中やベルの最中には呼ばないこと)"""
+        if not self.dirty:
+            return
+        data = bytearray(_STALL_SIZE * STALL_KEEP)
+        for i, (late_ms, t, sub, name) in enumerate(self.stalls):
+            struct.pack_into(_STALL_RECORD, data, i * _STALL_SIZE, late_ms, t, sub, name.encode()[:11])
+        enter(FLASH)
+        try:
+            with open(self.path, "wb") as f:
+                f.write(data)
+        finally:
+            leave()
+        self.dirty = False
+
+    def stats(self):
+        return {
+            "feeds": self.feeds, "starved": self.starved, "overruns": self.overruns,
+            "slowest": ["{} {}ms {}".format(name, late_ms, NAMES[sub] if sub < len(NAMES) else sub)
+                        for late_ms, _, sub, name in self.stalls[:3]],
+        }
+
+
+def release():
+    """
+    プログラムを止めて REPL に戻る時 (Ctrl-C) に呼ぶ
+    RP2040 のウォッチドッグは一度動かすと止められないので、そのままだと約8秒でリセットされ、
+    REPL で perf.dump() や log.flush() を使う間も無い。以後は machine.Timer で餌をやり続ける。
+    ソフトリセット (Ctrl-D、mpremote や Thonny の再接続) ではタイマーが消えるので、main.py が
+    動き直さない raw REPL のままなら約8秒後にリセットされる (開発中は main.WATCHDOG = False にする)
+    """
+    global _running
+    monitor = DeadlineMonitor.last
+    if monitor is not None:
+        monitor.keep_alive()
+        log.info("ウォッチドッグはタイマーで餌をやり続けます")
+    # この後の machine.reset() (mpremote の reset など) もウォッチドッグのリセットとして報告されるので、
+    # 計測中のセッションを再開しないようにスクラッチを消して、以後は書かない
+    _running = False
+    for addr in (_SCR_SESSION, _SCR_ELAPSED, _SCR_ACTIVE, _SCR_STALL):
+        machine.mem32[addr] = 0